@@ -1,10 +1,13 @@
 # API/api_app.py
 
-from fastapi import FastAPI, Depends, HTTPException, status, Path, Query, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Depends, HTTPException, status, Path, Query, WebSocket, WebSocketDisconnect, Request
 from fastapi.security import OAuth2PasswordRequestForm
-from .auth import authenticate_user, create_access_token, get_current_user, get_current_user_websocket
+from fastapi.responses import PlainTextResponse
+from .auth import authenticate_user, create_access_token, get_current_user, get_current_user_websocket, get_current_admin_user, get_password_hash, Principal
+from .password_hashing import password_hasher, PasswordHasherSaturated
 from datetime import timedelta, datetime, timezone
 import asyncio
+import time
 from contextlib import asynccontextmanager
 from sqlalchemy.exc import IntegrityError, NoResultFound
 from collections import OrderedDict
@@ -18,52 +21,118 @@ from .api_response_models import (
     MarketListingsResponse, ListItemRequest, ListItemResponse,
     BuyItemRequest, BuyItemResponse, CancelListingResponse, CancelListingRequest,
     ItemQuickSellRequest, TransactionHistoryResponse, TransactionHistoryItem, UserCategoryXPResponse,
-    CategoryProgress
+    CategoryProgress, CatalogReloadResponse
 
 )
 from .api_db_access import (
     fetch_user_tools, fetch_user_items, get_user_by_username, toggle_user_tool_enabled,
-    get_available_tool_crafting_recipes, get_item_crafting_recipes, fetch_market_listings, 
+    get_available_tool_crafting_recipes, get_item_crafting_recipes_json, fetch_market_listings, 
     create_market_listing, buy_market_item, cancel_market_listing, fetch_user_market_listings,
-    quick_sell_user_item, get_transaction_history, save_chat_message, fetch_user_category_xp
+    quick_sell_user_item, get_transaction_history, save_chat_message, fetch_user_category_xp,
+    fetch_user_total_level
 )
 from GenerateData.create_users import create_user, UserAlreadyExistsError
-from GameServer.process_repeating_tools import process_repeating_tools
-from GameServer.crafting_ongoing_process import crafting_ongoing_process
+from GameServer.repeating_tools_engine import process_repeating_tools_async
+from GameServer.crafting_scheduler import crafting_scheduler
+from GameServer.offline_progress import lazy_accrual_enabled
+from GameServer.game_catalog import get_game_catalog, load_game_catalog, reload_game_catalog, run_catalog_listener
+from GameServer.leader_election import LeaderElector, make_tick_lock
+from GameServer.inventory_ledger import ledger_enabled, compact_ledger, LEDGER_COMPACT_INTERVAL
+from GameServer.state_cache import state_cache, state_cache_enabled, STATE_CACHE_ENABLED
+from GameServer.user_actors import user_actors
 from GameServer.craft_tool_process import craft_tool
 from GameServer.craft_process import craft_item
-from Database.models import User
+from Database.database import request_session
+from sqlalchemy.ext.asyncio import AsyncSession
+from Database.query_accounting import query_scope, record_query_stats, all_query_metrics, QUERY_DEBUG_HEADERS
+from .encoded_responses import encoded_json_response
+from .metrics import (
+    registry, request_latency, requests_in_flight, websocket_connections, websocket_connections_opened,
+    broadcast_latency, market_trades, market_trade_gold
+)
+from os import getenv
+
+RUN_TICK_LOOPS_IN_API = getenv("RUN_TICK_LOOPS_IN_API", "true").lower() == "true"
 
-# Background task functions
+# Background task functions, only the process holding the loop's leader lock ticks
 async def run_process_repeating_tools():
-    while True:
-        await asyncio.to_thread(process_repeating_tools)
-        await asyncio.sleep(5)
+    elector = LeaderElector(make_tick_lock("repeating_tools"))
+    await elector.run(process_repeating_tools_async, interval=5, name="repeating_tools")
 
 async def run_crafting_ongoing_process():
-    while True:
-        await crafting_ongoing_process()
-        await asyncio.sleep(5)
+    # A new leader's heap may be stale, rebuild it from the database first
+    elector = LeaderElector(make_tick_lock("crafting"), on_elected=crafting_scheduler.reset)
+    # Crafting settles the elapsed time itself, overrun ticks are merged into one run
+    await elector.run(crafting_scheduler.process_due, interval=5, name="crafting", overrun="merge")
+
+async def run_ledger_compactor():
+    elector = LeaderElector(make_tick_lock("ledger_compactor"))
+    await elector.run(compact_ledger, interval=LEDGER_COMPACT_INTERVAL, name="ledger_compactor", overrun="merge")
 
 # Lifespan function to manage startup and shutdown events
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Start background tasks
-    task1 = asyncio.create_task(run_process_repeating_tools())
-    task2 = asyncio.create_task(run_crafting_ongoing_process())
+    # Load the static game data once, every request and tick reads it from memory
+    await load_game_catalog()
+    password_hasher.start()
+    # Start background tasks, in lazy accrual mode repeating tools are settled on demand.
+    # A separate tick service (python -m GameServer.tick_service) takes the same loop locks,
+    # the loops run in whichever holds them. RUN_TICK_LOOPS_IN_API=false leaves them to the service.
+    # Every worker follows catalog reloads triggered in other workers.
+    tasks = [asyncio.create_task(run_catalog_listener())]
+    # The write-behind state cache replays its journal before any request or tick touches the state
+    if STATE_CACHE_ENABLED:
+        await state_cache.start()
+        tasks.append(asyncio.create_task(state_cache.run_flusher()))
+    if RUN_TICK_LOOPS_IN_API:
+        tasks.append(asyncio.create_task(run_crafting_ongoing_process()))
+        if not lazy_accrual_enabled():
+            tasks.append(asyncio.create_task(run_process_repeating_tools()))
+        if ledger_enabled():
+            tasks.append(asyncio.create_task(run_ledger_compactor()))
     yield
     # Cancel tasks on shutdown
-    task1.cancel()
-    task2.cancel()
-    await asyncio.gather(task1, task2, return_exceptions=True)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    password_hasher.close()
+    await user_actors.close()
+    # Write the cached state back once the loops stopped mutating it
+    await state_cache.close()
 
 # Create the FastAPI app
 app = FastAPI(lifespan=lifespan, title="IdleCrafter API", version="1", description="API created for IdleCrafter game")
 
+# Records the latency, queries, rows and database time of every request, per route
+@app.middleware("http")
+async def request_metrics_middleware(request: Request, call_next):
+    requests_in_flight.inc()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        with query_scope() as stats:
+            response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        requests_in_flight.dec()
+        # The router stores the matched route in the scope, unmatched paths share one entry
+        route = request.scope.get("route")
+        route_path = route.path if route else "unmatched"
+        request_latency.observe(time.perf_counter() - start, (request.method, route_path, status_code))
+    record_query_stats(f"{request.method} {route_path}", stats)
+    if QUERY_DEBUG_HEADERS:
+        response.headers["X-DB-Queries"] = str(stats.queries)
+        response.headers["X-DB-Rows"] = str(stats.rows)
+        response.headers["X-DB-Time-Ms"] = f"{stats.db_time * 1000:.1f}"
+    return response
+
 # Route to obtain JWT token
 @app.post("/token", response_model=Token, tags=["Authentication"])
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = await authenticate_user(form_data.username, form_data.password)
+    try:
+        user = await authenticate_user(form_data.username, form_data.password)
+    except PasswordHasherSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -71,12 +140,18 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
             headers={"WWW-Authenticate": "Bearer"},
         )
     access_token = create_access_token(
-        data={"sub": user.Username})
+        data={"sub": user.Username, "uid": str(user.Id)})
     return {"access_token": access_token, "token_type": "bearer"}
 
 # Protected route example
 @app.get("/users/me", response_model=UserResponse, tags=["Authentication"])
-async def read_users_me(current_user: User = Depends(get_current_user)):
+async def read_users_me(current_user: Principal = Depends(get_current_user), session: AsyncSession = Depends(request_session)):
+    # The cached principal only identifies the user, the balances are read fresh
+    current_user = await get_user_by_username(current_user.Username, session=session)
+    if state_cache_enabled():
+        # The cached balance is ahead of the database by up to one flush interval
+        state = await state_cache.get_user(current_user.Id)
+        current_user.Gold, current_user.TotalLevel = state.gold, state.total_level
     return current_user
 
 # Signup endpoint
@@ -86,12 +161,13 @@ async def signup(request: SignupRequest):
         # Convert the request data to a dictionary
         user_data = request.model_dump()
         
-        # Call the existing create_user function
-        new_user = await create_user(user_data)
+        # Hash in the hashing pool, then call the existing create_user function
+        password_hash = await get_password_hash(user_data["Password"])
+        new_user = await create_user(user_data, password_hash=password_hash)
         
         # Generate JWT token
         access_token = create_access_token(
-            data={"sub": new_user.Username}
+            data={"sub": new_user.Username, "uid": str(new_user.Id)}
         )
         
         return {
@@ -102,6 +178,9 @@ async def signup(request: SignupRequest):
                 "Email": new_user.Email
             }
         }
+    except PasswordHasherSaturated as e:
+        # Shed signups while the hashing pool is full
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except UserAlreadyExistsError as e:
         # Handle duplicate username or email
         raise HTTPException(status_code=400, detail=str(e))
@@ -116,30 +195,37 @@ async def signup(request: SignupRequest):
 @app.post("/craft/tool", tags=["Crafting"])
 async def craft_tool_endpoint(
     request: CraftToolRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user),
+    session: AsyncSession = Depends(request_session)
 ):
-    result = await craft_tool(current_user.Username, request.tool_unique_name, request.tool_tier)
+    result = await user_actors.run(current_user.Id, lambda session: craft_tool(
+        str(current_user.Id), request.tool_unique_name, request.tool_tier, session=session
+    ), session=session)
     return result  # Return the success message
     
 # Endpoint to craft an item
 @app.post("/craft/item", tags=["Crafting"])
 async def craft_item_endpoint(
     request: CraftItemRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user),
+    session: AsyncSession = Depends(request_session)
 ):
     # Call the async function to craft the item
-    result = await craft_item(current_user.Username, request.item_unique_name, request.quantity)
+    result = await user_actors.run(current_user.Id, lambda session: craft_item(
+        str(current_user.Id), request.item_unique_name, request.quantity, session=session
+    ), session=session)
     return result  # Return the success message
 
 # GET endpoint for user's tools
 @app.get("/user/tools", response_model=UserToolsResponse, tags=["Tools"])
-async def get_user_tools(current_user: User = Depends(get_current_user)):
+async def get_user_tools(current_user: Principal = Depends(get_current_user), session: AsyncSession = Depends(request_session)):
     try:
-        user_tools = await fetch_user_tools(current_user.Id)
+        user_tools = await fetch_user_tools(current_user.Id, session=session)
+        catalog = await get_game_catalog()
         tools_by_category = {}
 
         for user_tool in user_tools:
-            tool = user_tool.tool
+            tool = catalog.tools[(user_tool.ToolUniqueName, user_tool.Tier)]
 
             category = tool.Category
 
@@ -174,13 +260,14 @@ async def get_user_tools(current_user: User = Depends(get_current_user)):
 
 # GET endpoint for user's items
 @app.get("/user/items", response_model=UserItemsResponse, tags=["Items"])
-async def get_user_items(current_user: User = Depends(get_current_user)):
+async def get_user_items(current_user: Principal = Depends(get_current_user), session: AsyncSession = Depends(request_session)):
     try:
-        user_items = await fetch_user_items(current_user.Id)
+        user_items = await fetch_user_items(current_user.Id, session=session)
+        catalog = await get_game_catalog()
         items_by_category = {}
 
         for user_item in user_items:
-            item = user_item.item
+            item = catalog.items[user_item.UniqueName]
 
             category = item.Category
 
@@ -210,11 +297,14 @@ async def get_user_items(current_user: User = Depends(get_current_user)):
 @app.post("/user/items/quick-sell", tags=["Items"])
 async def quick_sell_item(
     request: ItemQuickSellRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user),
+    session: AsyncSession = Depends(request_session)
 ):
     try:
         # Call the database access function to quick sell the item
-        await quick_sell_user_item(current_user, request.item_unique_name, request.item_quantity)
+        await user_actors.run(current_user.Id, lambda session: quick_sell_user_item(
+            current_user, request.item_unique_name, request.item_quantity, session=session
+        ), session=session)
         return {"status": "success", "message": f"Item {request.item_unique_name} quick-sold."}
     except NoResultFound:
         raise HTTPException(status_code=404, detail="Item not found for user")
@@ -226,11 +316,14 @@ async def quick_sell_item(
 async def toggle_tool_enabled(
     tool_unique_name: str = Path(..., description="Unique name of the tool"),
     tool_id: int = Path(..., description="Multiple Tool ID"),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user),
+    session: AsyncSession = Depends(request_session)
 ):
     try:
         # Call the database access function to toggle the tool's isEnabled status
-        user_tool = await toggle_user_tool_enabled(current_user.Id, tool_unique_name, tool_id)
+        user_tool = await user_actors.run(current_user.Id, lambda session: toggle_user_tool_enabled(
+            current_user.Id, tool_unique_name, tool_id, session=session
+        ), session=session)
         
         # Prepare response
         response = ToolToggleResponse(
@@ -246,29 +339,35 @@ async def toggle_tool_enabled(
     
 # GET endpoint to fetch tool crafting recipes    
 @app.get("/tool-crafting-recipes", response_model=List[CraftableTool], tags=["Crafting"])
-async def get_tool_crafting_recipes(current_user: User = Depends(get_current_user)):
+async def get_tool_crafting_recipes(
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    session: AsyncSession = Depends(request_session)
+):
     try:
-        recipes = await get_available_tool_crafting_recipes(current_user.Username)
-        return recipes
+        # Memoized per user until their tools or levels change, clients holding the current ETag get a 304
+        recipes = await get_available_tool_crafting_recipes(current_user.Id, session=session)
+        return encoded_json_response(request, recipes)
     except Exception as e:
         print(f"Error fetching tool crafting recipes: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     
 # GET endpoint to fetch item crafting recipes
 @app.get("/item-crafting-recipes", response_model=List[ToolRecipes], tags=["Crafting"])
-async def get_item_crafting_recipes_endpoint(current_user: User = Depends(get_current_user)):
+async def get_item_crafting_recipes_endpoint(request: Request, current_user: Principal = Depends(get_current_user)):
     try:
-        recipes = await get_item_crafting_recipes()
-        return recipes
+        # Encoded once per catalog version, clients holding the current ETag get a 304
+        recipes = await get_item_crafting_recipes_json()
+        return encoded_json_response(request, recipes)
     except Exception as e:
         print(f"Error fetching item crafting recipes: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 # New endpoint to get market listings
 @app.get("/market/listings", response_model=MarketListingsResponse, tags=["Market"])
-async def get_market_listings(current_user: User = Depends(get_current_user)):
+async def get_market_listings(current_user: Principal = Depends(get_current_user), session: AsyncSession = Depends(request_session)):
     try:
-        listings = await fetch_market_listings()
+        listings = await fetch_market_listings(session=session)
         return MarketListingsResponse(listings=listings)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -277,16 +376,18 @@ async def get_market_listings(current_user: User = Depends(get_current_user)):
 @app.post("/market/list", response_model=ListItemResponse, tags=["Market"])
 async def list_item_for_sale(
     request: ListItemRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user),
+    session: AsyncSession = Depends(request_session)
 ):
     try:
-        new_listing = await create_market_listing(
+        new_listing = await user_actors.run(current_user.Id, lambda session: create_market_listing(
             user=current_user,
             item_unique_name=request.item_unique_name,
             quantity=request.quantity,
             price=request.price,
-            expire_date=request.expire_date
-        )
+            expire_date=request.expire_date,
+            session=session
+        ), session=session)
         return ListItemResponse(
             status="success",
             message="Item listed for sale.",
@@ -299,14 +400,18 @@ async def list_item_for_sale(
 @app.post("/market/buy", response_model=BuyItemResponse, tags=["Market"])
 async def buy_market_item_endpoint(
     request: BuyItemRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user),
+    session: AsyncSession = Depends(request_session)
 ):
     try:
-        purchase_details = await buy_market_item(
+        purchase_details = await user_actors.run(current_user.Id, lambda session: buy_market_item(
             buyer=current_user,
             listing_id=request.listing_id,
-            quantity=request.quantity
-        )
+            quantity=request.quantity,
+            session=session
+        ), session=session)
+        market_trades.inc()
+        market_trade_gold.inc(purchase_details['total_price'])
         return BuyItemResponse(
             status="success",
             message="Purchase completed.",
@@ -321,9 +426,9 @@ async def buy_market_item_endpoint(
     
 # New endpoint to list user's active market listings
 @app.get("/market/my-listings", response_model=MarketListingsResponse, tags=["Market"])
-async def get_user_market_listings(current_user: User = Depends(get_current_user)):
+async def get_user_market_listings(current_user: Principal = Depends(get_current_user), session: AsyncSession = Depends(request_session)):
     try:
-        listings = await fetch_user_market_listings(ListCreator=current_user)
+        listings = await fetch_user_market_listings(ListCreator=current_user, session=session)
         return MarketListingsResponse(listings=listings)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) 
@@ -332,13 +437,15 @@ async def get_user_market_listings(current_user: User = Depends(get_current_user
 @app.delete("/market/my-listings/cancel", tags=["Market"], response_model=CancelListingResponse)
 async def cancel_user_market_listing(
     request: CancelListingRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user),
+    session: AsyncSession = Depends(request_session)
 ):
     try:
-        await cancel_market_listing(
+        await user_actors.run(current_user.Id, lambda session: cancel_market_listing(
             seller_id=current_user.Id,
-            listing_id=request.listing_id
-        )
+            listing_id=request.listing_id,
+            session=session
+        ), session=session)
         return CancelListingResponse(status="success", message=f"Listing {request.listing_id} cancelled.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -348,7 +455,8 @@ async def get_transaction_history_endpoint(
     start_date: datetime = Query(..., description="Start date in ISO format"),
     end_date: datetime = Query(..., description="End date in ISO format"),
     item_unique_name: str = Query(..., description="Unique name of the item"),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user),
+    session: AsyncSession = Depends(request_session)
 ):
     try:
         # Validate that start_date is not after end_date
@@ -359,7 +467,8 @@ async def get_transaction_history_endpoint(
         transactions = await get_transaction_history(
             start_date=start_date,
             end_date=end_date,
-            item_unique_name=item_unique_name
+            item_unique_name=item_unique_name,
+            session=session
         )
 
         transaction_items = [
@@ -388,13 +497,18 @@ class ConnectionManager:
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
         self.active_connections.append(websocket)
+        websocket_connections.set(len(self.active_connections))
+        websocket_connections_opened.inc()
 
     def disconnect(self, websocket: WebSocket):
         self.active_connections.remove(websocket)
+        websocket_connections.set(len(self.active_connections))
 
     async def broadcast(self, message: dict):
+        start = time.perf_counter()
         for connection in self.active_connections:
             await connection.send_json(message)
+        broadcast_latency.observe(time.perf_counter() - start)
 
 manager = ConnectionManager()
 
@@ -422,7 +536,7 @@ async def websocket_endpoint(websocket: WebSocket):
             message = {
                 "time": chat_message.Time.isoformat(timespec='seconds'),
                 "username": user.Username,
-                "level": user.TotalLevel,
+                "level": await fetch_user_total_level(user.Id),
                 "text": message_text
             }
             # Broadcast the message to all connected clients
@@ -431,9 +545,9 @@ async def websocket_endpoint(websocket: WebSocket):
         manager.disconnect(websocket)
 
 @app.get("/category/xp", response_model=UserCategoryXPResponse, tags=["Category"])
-async def get_user_category_xp(current_user: User = Depends(get_current_user)):
+async def get_user_category_xp(current_user: Principal = Depends(get_current_user), session: AsyncSession = Depends(request_session)):
     try:
-        categories_progress = await fetch_user_category_xp(current_user.Id)
+        categories_progress = await fetch_user_category_xp(current_user.Id, session=session)
         if categories_progress is None:
             raise HTTPException(status_code=404, detail="User not found.")
         elif not categories_progress:
@@ -442,6 +556,33 @@ async def get_user_category_xp(current_user: User = Depends(get_current_user)):
     except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
+# Admin endpoint to reload the static game data in every worker
+@app.post("/admin/catalog/reload", response_model=CatalogReloadResponse, tags=["Admin"])
+async def reload_catalog(current_user: Principal = Depends(get_current_admin_user)):
+    try:
+        previous_version = (await get_game_catalog()).version
+        catalog = await reload_game_catalog()
+        print(f"User '{current_user.Username}' reloaded the game catalog: {previous_version} -> {catalog.version}")
+        return CatalogReloadResponse(
+            status="success",
+            version=catalog.version,
+            previous_version=previous_version,
+            changed=catalog.version != previous_version
+        )
+    except Exception as e:
+        print(f"Error reloading game catalog: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+# Admin endpoint with the query totals per route and game loop of this worker
+@app.get("/admin/query-stats", tags=["Admin"])
+async def get_query_stats(current_user: Principal = Depends(get_current_admin_user)):
+    return all_query_metrics()
+
+# Prometheus scrape endpoint with this worker's request, database, tick loop and game metrics
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 # Health check endpoint
 @app.get("/health", tags=["Health"])
 async def health_check():
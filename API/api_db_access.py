@@ -2,58 +2,85 @@
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy import func, literal, union_all
+from sqlalchemy.orm import selectinload
 from sqlalchemy.exc import NoResultFound
 from typing import List, Dict, Optional
 from datetime import datetime, timedelta, timezone
 import uuid
-from Database.database import AsyncSessionLocal
+from Database.database import AsyncSessionLocal, session_scope, commit_unit, rollback_unit
+from GameServer.offline_progress import settle_user_tools, lazy_accrual_enabled
+from GameServer.game_catalog import get_game_catalog
+from GameServer.inventory_service import inventory_service
+from GameServer.inventory_ledger import ledger_enabled, user_items_with_tail_query
+from GameServer.state_cache import state_cache, state_cache_enabled
 from Database.models import (
-    User, UserTool, Tool, UserItem, Item, ToolCraftingRecipe, CraftingRecipe, Market, MarketHistory, ChatHistory, UserCategoryXP, CategoryLevels
+    User, UserTool, UserItem, Market, MarketHistory, ChatHistory, UserCategoryXP
 )
+from .encoded_responses import EncodedJSON, encode_json
+from .auth import Principal
 from .api_response_models import CategoryProgress, CraftableTool, RequiredItem, ToolRecipes, Recipe, InputItem, MarketListing, TransactionHistoryResponse
-from collections import Counter
+from collections import namedtuple, OrderedDict
+import os
 
+# Rows built from the write-behind state cache, shaped like the ORM objects they replace
+CachedUserItem = namedtuple("CachedUserItem", ["UniqueName", "Quantity"])
+CachedCategoryXP = namedtuple("CachedCategoryXP", ["Category", "CurrentXP", "CategoryLevel"])
 
+# Users whose /tool-crafting-recipes response is kept encoded
+TOOL_RECIPES_MEMO_SIZE = int(os.getenv("TOOL_RECIPES_MEMO_SIZE", "10000"))
 
-# Function to get user tools
-async def fetch_user_tools(user_id):
-    async with AsyncSessionLocal() as session:
+
+
+# Function to get user tools, tool definitions are looked up in the game catalog
+async def fetch_user_tools(user_id, session: AsyncSession = None):
+    async with session_scope(session) as session:
         result = await session.execute(
             select(UserTool)
-            .options(
-                selectinload(UserTool.tool)
-            )
             .filter(UserTool.UserId == user_id)
         )
         user_tools = result.scalars().all()
     return user_tools
 
-# Function to get user items
-async def fetch_user_items(user_id):
-    async with AsyncSessionLocal() as session:
+# Function to get user items, item definitions are looked up in the game catalog
+async def fetch_user_items(user_id, session: AsyncSession = None):
+    async with session_scope(session) as session:
+        if await settle_user_tools(session, user_id):
+            await commit_unit(session)
+        if state_cache_enabled():
+            state = await state_cache.get_user(user_id)
+            return [CachedUserItem(name, quantity) for name, quantity in state.items.items()]
+        if ledger_enabled():
+            # Compacted balance plus the ledger rows not folded in yet
+            result = await session.execute(user_items_with_tail_query(user_id))
+            return result.all()
         result = await session.execute(
             select(UserItem)
-            .options(
-                selectinload(UserItem.item)
-            )
             .filter(UserItem.UserId == user_id)
         )
         user_items = result.scalars().all()
     return user_items
 
 # Function to get user by username
-async def get_user_by_username(username):
-    async with AsyncSessionLocal() as session:
+async def get_user_by_username(username, session: AsyncSession = None):
+    async with session_scope(session) as session:
         result = await session.execute(
             select(User).filter(User.Username == username)
         )
         user = result.scalar_one_or_none()
     return user
 
+# Function to get a user's current TotalLevel, the cached principal does not carry it
+async def fetch_user_total_level(user_id, session: AsyncSession = None) -> Optional[int]:
+    if state_cache_enabled():
+        return (await state_cache.get_user(user_id)).total_level
+    async with session_scope(session) as session:
+        result = await session.execute(select(User.TotalLevel).filter(User.Id == user_id))
+        return result.scalar_one_or_none()
+
 # Function to toggle the isEnabled status of a user's tool
-async def toggle_user_tool_enabled(user_id: str, tool_unique_name: str, tool_id: int) -> UserTool:
-    async with AsyncSessionLocal() as session:
+async def toggle_user_tool_enabled(user_id: str, tool_unique_name: str, tool_id: int, session: AsyncSession = None) -> UserTool:
+    async with session_scope(session) as session:
         try:
             # Fetch the UserTool for the user and tool_unique_name
             result = await session.execute(
@@ -69,258 +96,207 @@ async def toggle_user_tool_enabled(user_id: str, tool_unique_name: str, tool_id:
             if not user_tool:
                 raise NoResultFound("Tool not found for user")
 
+            # Settle production up to now so the toggle only affects future ticks
+            await settle_user_tools(session, user_id)
+
             # Toggle the isEnabled status
             user_tool.isEnabled = not user_tool.isEnabled
-            await session.commit()
+            if user_tool.isEnabled and lazy_accrual_enabled():
+                user_tool.LastSettled = datetime.now()
+            await commit_unit(session)
             await session.refresh(user_tool)
             return user_tool
         
         except Exception as e:
-            await session.rollback()
+            await rollback_unit(session)
             raise e  # Re-raise exception to be handled by calling function
         
-async def get_available_tool_crafting_recipes(user_identifier: str) -> List[CraftableTool]:
-    async with AsyncSessionLocal() as session:
-        try:
-            # Fetch the user and their tools
-            user_query = select(User).where(User.Username == user_identifier).options(
-                selectinload(User.tools)
-            )
-            user_result = await session.execute(user_query)
-            user = user_result.scalar_one_or_none()
-            if not user:
-                raise Exception(f"User '{user_identifier}' not found.")
-
-            # Fetch user's category levels
-            user_category_levels_query = select(UserCategoryXP).where(
-                UserCategoryXP.UserId == user.Id
-            )
-            user_category_levels_result = await session.execute(user_category_levels_query)
-            user_category_levels = user_category_levels_result.scalars().all()
-            # Create a dictionary for quick access
-            user_category_levels_dict = {userXp.Category: userXp.CategoryLevel for userXp in user_category_levels}
-
-            # Build a mapping from (ToolUniqueName, Tier) to count
-            tool_counter = Counter((user_tool.ToolUniqueName, user_tool.Tier) for user_tool in user.tools)
-
-            # Fetch all unique OutputToolUniqueNames from ToolCraftingRecipe
-            all_tools_query = select(ToolCraftingRecipe.OutputToolUniqueName).distinct()
-            all_tools_result = await session.execute(all_tools_query)
-            all_tool_unique_names = [row[0] for row in all_tools_result.fetchall()]
-
-            response = []
-
-            for tool_unique_name in all_tool_unique_names:
-                # Fetch all available tiers for this tool
-                tiers_query = select(ToolCraftingRecipe.OutputToolTier).where(
-                    ToolCraftingRecipe.OutputToolUniqueName == tool_unique_name
-                ).distinct()
-                tiers_result = await session.execute(tiers_query)
-                available_tiers = sorted([row[0] for row in tiers_result.fetchall()])
-
-                # Fetch all Tool entries for this tool_unique_name
-                tool_entries_query = select(Tool).where(
-                    Tool.UniqueName == tool_unique_name
-                )
-                tool_entries_result = await session.execute(tool_entries_query)
-                tool_entries = tool_entries_result.scalars().all()
-
-                # Build a mapping of tier to Tool object
-                tier_to_tool = {tool.Tier: tool for tool in tool_entries}
-
-                # Build a mapping of tier to user's count at that tier
-                user_tool_counts = {tier: count for ((name, tier), count) in tool_counter.items() if name == tool_unique_name}
-
-                # Iterate over available tiers
-                next_tier = None
-                for tier in available_tiers:
-                    tool = tier_to_tool.get(tier)
-                    if not tool:
-                        continue  # Tool not found, skip
-
-                    # Fetch the crafting recipe for this tool and tier
-                    recipe_query = select(ToolCraftingRecipe).where(
-                        ToolCraftingRecipe.OutputToolUniqueName == tool_unique_name,
-                        ToolCraftingRecipe.OutputToolTier == tier
-                    )
-                    recipe_result = await session.execute(recipe_query)
-                    recipe = recipe_result.scalars().all()
-                    if not recipe:
-                        continue  # Recipe not found, skip
-
-                    # Check user's category level
-                    category = recipe[0].Category
-                    minimum_level_required = recipe[0].MinimumCategoryLevel
-                    user_category_level = user_category_levels_dict.get(category, 0)
-                    if user_category_level + 1 < minimum_level_required:
-                        continue  # User doesn't meet level requirement
-
-                    is_multiple_craftable = tool.isMultipleCraftable
-                    max_crafting_number = tool.maxCraftingNumber
-
-                    user_count_at_tier = user_tool_counts.get(tier, 0)
-
-                    if is_multiple_craftable:
-                        if user_count_at_tier < max_crafting_number:
-                            # User can craft more at this tier
-                            next_tier = tier
-                            break  # Found the next tier to craft
-                        else:
-                            # User has reached max crafting number at this tier, check next tier
-                            continue
-                    else:
-                        if user_count_at_tier == 0:
-                            # User doesn't have this tool at this tier
-                            next_tier = tier
-                            break  # Found the next tier to craft
-                        else:
-                            # User has the tool at this tier, check next tier
-                            continue
-
-                if next_tier is None:
-                    # No tiers left to consider for this tool
-                    continue  # Skip to next tool
-
-                # Fetch required items for this tool at next_tier
-                required_items_query = select(ToolCraftingRecipe).where(
-                    ToolCraftingRecipe.OutputToolUniqueName == tool_unique_name,
-                    ToolCraftingRecipe.OutputToolTier == next_tier
-                ).options(
-                    selectinload(ToolCraftingRecipe.input_item)
-                )
-                required_items_result = await session.execute(required_items_query)
-                required_recipes = required_items_result.scalars().all()
-
-                required_items_list = []
-                for recipe in required_recipes:
-                    input_item = recipe.input_item
-                    if not input_item:
-                        continue  # Input item not found, skip
-
-                    required_items_list.append(RequiredItem(
-                        item_unique_name=recipe.InputItemUniqueName,
-                        item_display_name=input_item.Name,
-                        required_quantity=recipe.InputQuantity
-                    ))
-
-                # Create the CraftableTool object including the tier and minimum level required
-                response.append(CraftableTool(
-                    unique_tool_name=tool_unique_name,
-                    display_name=tool.Name,
-                    tier=next_tier,
-                    required_items=required_items_list,
-                    category=category,
-                    minimum_category_level=minimum_level_required
-                ))
-
-            # Sort the response by tier and then by minimum_level_required in ascending order
-            response.sort(key=lambda x: (x.tier, x.minimum_category_level))
-
-            return response
-
-        except Exception as e:
-            print(f"Error fetching tool crafting recipes: {e}")
-            raise
-
+# Function to get the next craftable tier of every tool for a user, as pre-encoded JSON with its ETag
+async def get_available_tool_crafting_recipes(user_id, session: AsyncSession = None) -> EncodedJSON:
+    try:
+        # Tool counts per (ToolUniqueName, Tier) and category levels, in one round trip
+        tool_counts_query = (
+            select(literal("tool"), UserTool.ToolUniqueName, UserTool.Tier, func.count())
+            .where(UserTool.UserId == user_id)
+            .group_by(UserTool.ToolUniqueName, UserTool.Tier)
+        )
+        levels_query = (
+            select(literal("level"), UserCategoryXP.Category, UserCategoryXP.CategoryLevel, literal(0))
+            .where(UserCategoryXP.UserId == user_id)
+        )
+        async with session_scope(session) as session:
+            rows = (await session.execute(union_all(tool_counts_query, levels_query))).all()
 
-# Function to get item crafting recipes
-async def get_item_crafting_recipes() -> List[ToolRecipes]:
-    async with AsyncSessionLocal() as session:
-        try:
-            # Fetch all CraftingRecipes with related Tool, OutputItem, and InputItem
-            recipes_query = select(CraftingRecipe).options(
-                joinedload(CraftingRecipe.tool),
-                joinedload(CraftingRecipe.output_item),
-                joinedload(CraftingRecipe.input_item)
-            )
-            recipes_result = await session.execute(recipes_query)
-            crafting_recipes = recipes_result.scalars().all()
-
-            # Organize data into a nested dictionary
-            tool_recipes_dict: Dict[tuple, Dict[str, any]] = {}
-
-            for crafting_recipe in crafting_recipes:
-                tool_key = (crafting_recipe.ToolUniqueName, crafting_recipe.ToolTier)
-                output_item_key = crafting_recipe.OutputItemUniqueName
-
-                # Initialize tool entry if not exists
-                if tool_key not in tool_recipes_dict:
-                    tool = crafting_recipe.tool
-                    tool_recipes_dict[tool_key] = {
-                        "unique_tool_name": tool.UniqueName,
-                        "tool_tier": tool.Tier,
-                        "recipe_dict": {}
-                    }
-
-                tool_entry = tool_recipes_dict[tool_key]
-
-                # Initialize recipe entry if not exists
-                if output_item_key not in tool_entry["recipe_dict"]:
-                    output_item = crafting_recipe.output_item
-                    tool_entry["recipe_dict"][output_item_key] = {
-                        "output_item_unique_name": output_item.UniqueName,
-                        "output_item_display_name": output_item.Name,
-                        "generation_duration": int(crafting_recipe.GenerationDuration),
-                        "input_items": []
-                    }
-
-                recipe_entry = tool_entry["recipe_dict"][output_item_key]
-
-                # Add input item to the recipe's input items
-                input_item = crafting_recipe.input_item
-                recipe_entry["input_items"].append(InputItem(
-                    input_item_unique_name=input_item.UniqueName,
-                    input_item_display_name=input_item.Name,
-                    input_item_quantity=crafting_recipe.InputQuantity
-                ))
+        tool_counts, category_levels = {}, {}
+        for kind, name, value, count in rows:
+            if kind == "tool":
+                tool_counts[(name, value)] = count
+            else:
+                category_levels[name] = value
+        if state_cache_enabled():
+            # Levels reached since the last flush are only in the cache
+            state = await state_cache.get_user(user_id)
+            category_levels = {category: level for category, (_, level) in state.xp.items()}
+
+        catalog = await get_game_catalog()
+        return tool_recipes_memo.get(user_id, catalog, tool_counts, category_levels)
+
+    except Exception as e:
+        print(f"Error fetching tool crafting recipes: {e}")
+        raise
+
+def build_available_tool_crafting_recipes(catalog, tool_counts: dict, category_levels: dict) -> List[CraftableTool]:
+    """
+    Next craftable tier of every tool in the catalog's tool-upgrade graph: the
+    lowest tier whose level requirement the user meets (one level ahead is
+    allowed) and of which they own fewer than the tier's maximum.
+
+    :param tool_counts: (ToolUniqueName, Tier) -> number of the user's tools
+    :param category_levels: Category -> the user's CategoryLevel
+    """
+    response = []
+    for tool_unique_name, steps in catalog.tool_upgrade_graph.items():
+        for step in steps:
+            if category_levels.get(step.Category, 0) + 1 < step.MinimumCategoryLevel:
+                continue  # User doesn't meet level requirement
+            if tool_counts.get((tool_unique_name, step.Tier), 0) >= step.maxCraftingNumber:
+                continue  # User has every tool allowed at this tier, check next tier
+            response.append(CraftableTool(
+                unique_tool_name=tool_unique_name,
+                display_name=step.Name,
+                tier=step.Tier,
+                required_items=[
+                    RequiredItem(item_unique_name=unique_name, item_display_name=name, required_quantity=quantity)
+                    for unique_name, name, quantity in step.Inputs
+                ],
+                category=step.Category,
+                minimum_category_level=step.MinimumCategoryLevel
+            ))
+            break
+
+    # Sort the response by tier and then by minimum_level_required in ascending order
+    response.sort(key=lambda x: (x.tier, x.minimum_category_level))
+    return response
+
+class ToolRecipesMemo:
+    """
+    Per-user LRU memo of the encoded /tool-crafting-recipes response. An entry
+    is valid for the catalog version and the tool counts and category levels
+    it was built from, so a new tool, a level-up or a catalog reload rebuilds it.
+    """
+
+    def __init__(self, max_users: int = TOOL_RECIPES_MEMO_SIZE):
+        self.max_users = max_users
+        self._entries = OrderedDict()  # user id -> (catalog version, state key, EncodedJSON)
+
+    def get(self, user_id, catalog, tool_counts: dict, category_levels: dict) -> EncodedJSON:
+        state_key = (frozenset(tool_counts.items()), frozenset(category_levels.items()))
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] == catalog.version and entry[1] == state_key:
+            self._entries.move_to_end(user_id)
+            return entry[2]
+        encoded = encode_json(List[CraftableTool], build_available_tool_crafting_recipes(catalog, tool_counts, category_levels))
+        self._entries[user_id] = (catalog.version, state_key, encoded)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+        return encoded
+
+tool_recipes_memo = ToolRecipesMemo()
+
+
+# Function to get item crafting recipes as pre-encoded JSON with its ETag
+async def get_item_crafting_recipes_json() -> EncodedJSON:
+    # The response only depends on the catalog, so it is built and encoded once per catalog version
+    catalog = await get_game_catalog()
+    return catalog.derived("item_crafting_recipes_json", lambda: encode_json(
+        List[ToolRecipes], build_item_crafting_recipes(catalog)
+    ))
+
+def build_item_crafting_recipes(catalog) -> List[ToolRecipes]:
+    # All CraftingRecipes with their Tool, OutputItem, and InputItem from the game catalog
+    # Organize data into a nested dictionary
+    tool_recipes_dict: Dict[tuple, Dict[str, any]] = {}
+
+    for crafting_recipe in (recipe for recipes in catalog.recipes_by_tool.values() for recipe in recipes):
+        tool_key = (crafting_recipe.ToolUniqueName, crafting_recipe.ToolTier)
+        output_item_key = crafting_recipe.OutputItemUniqueName
+
+        # Initialize tool entry if not exists
+        if tool_key not in tool_recipes_dict:
+            tool = catalog.tools[tool_key]
+            tool_recipes_dict[tool_key] = {
+                "unique_tool_name": tool.UniqueName,
+                "tool_tier": tool.Tier,
+                "recipe_dict": {}
+            }
 
-            # Convert the nested dictionary to the response format
-            response = []
-            for tool_info in tool_recipes_dict.values():
-                recipe_list = []
-                for recipe_info in tool_info["recipe_dict"].values():
-                    recipe_list.append(Recipe(
-                        output_item_unique_name=recipe_info["output_item_unique_name"],
-                        output_item_display_name=recipe_info["output_item_display_name"],
-                        generation_duration=recipe_info["generation_duration"],
-                        input_items=recipe_info["input_items"]
-                    ))
-                response.append(ToolRecipes(
-                    unique_tool_name=tool_info["unique_tool_name"],
-                    tool_tier=tool_info["tool_tier"],
-                    recipe_list=recipe_list
-                ))
+        tool_entry = tool_recipes_dict[tool_key]
 
-            return response
+        # Initialize recipe entry if not exists
+        if output_item_key not in tool_entry["recipe_dict"]:
+            output_item = catalog.items[output_item_key]
+            tool_entry["recipe_dict"][output_item_key] = {
+                "output_item_unique_name": output_item.UniqueName,
+                "output_item_display_name": output_item.Name,
+                "generation_duration": int(crafting_recipe.GenerationDuration),
+                "input_items": []
+            }
 
-        except Exception as e:
-            print(f"Error fetching item crafting recipes: {e}")
-            raise
+        recipe_entry = tool_entry["recipe_dict"][output_item_key]
+
+        # Add input item to the recipe's input items
+        input_item = catalog.items[crafting_recipe.InputItemUniqueName]
+        recipe_entry["input_items"].append(InputItem(
+            input_item_unique_name=input_item.UniqueName,
+            input_item_display_name=input_item.Name,
+            input_item_quantity=crafting_recipe.InputQuantity
+        ))
+
+    # Convert the nested dictionary to the response format
+    response = []
+    for tool_info in tool_recipes_dict.values():
+        recipe_list = []
+        for recipe_info in tool_info["recipe_dict"].values():
+            recipe_list.append(Recipe(
+                output_item_unique_name=recipe_info["output_item_unique_name"],
+                output_item_display_name=recipe_info["output_item_display_name"],
+                generation_duration=recipe_info["generation_duration"],
+                input_items=recipe_info["input_items"]
+            ))
+        response.append(ToolRecipes(
+            unique_tool_name=tool_info["unique_tool_name"],
+            tool_tier=tool_info["tool_tier"],
+            recipe_list=recipe_list
+        ))
+
+    return response
 
 # Function to get market listings
-async def fetch_market_listings() -> List[MarketListing]:
-    async with AsyncSessionLocal() as session:
+async def fetch_market_listings(session: AsyncSession = None) -> List[MarketListing]:
+    async with session_scope(session) as session:
         result = await session.execute(
             select(Market)
             .options(
-                selectinload(Market.item),
                 selectinload(Market.seller)
             )
             .order_by(Market.ListCreatedAt.desc())
         )
         listings = result.scalars().all()
+        catalog = await get_game_catalog()
         market_listings = []
         for listing in listings:
             if listing.ExpireDate < datetime.now():
-                await cancel_market_listing(listing.Id, listing.SellerId)
+                # Returned to the seller in this session, not a new one per listing
+                await cancel_market_listing(listing.Id, listing.SellerId, session=session)
             else:
                 market_listings.append(MarketListing(
                     id=listing.Id,
                     seller_id=str(listing.SellerId),
                     seller_username=listing.SellerUsername,
                     item_unique_name=listing.ItemUniqueName,
-                    item_display_name=listing.item.Name,
-                    item_description=listing.item.ItemDescription,
+                    item_display_name=catalog.items[listing.ItemUniqueName].Name,
+                    item_description=catalog.items[listing.ItemUniqueName].ItemDescription,
                     quantity=listing.Quantity,
                     price=listing.Price,
                     list_created_at=listing.ListCreatedAt,
@@ -330,21 +306,14 @@ async def fetch_market_listings() -> List[MarketListing]:
         return market_listings
 
 # Function to create a market listing
-async def create_market_listing(user: User, item_unique_name: str, quantity: int, price: float, expire_date: Optional[datetime]=None):
-    async with AsyncSessionLocal() as session:
+async def create_market_listing(user: Principal, item_unique_name: str, quantity: int, price: float, expire_date: Optional[datetime]=None, session: AsyncSession = None):
+    async with session_scope(session) as session:
         try:
-            # Check if user has enough of the item
-            user_item_query = select(UserItem).filter(
-                UserItem.UserId == user.Id,
-                UserItem.UniqueName == item_unique_name
-            )
-            result = await session.execute(user_item_query)
-            user_item = result.scalar_one_or_none()
-            if not user_item or user_item.Quantity < quantity:
+            await settle_user_tools(session, user.Id)
+            # Deduct the quantity from the user's inventory if they have enough of the item
+            deduction = await inventory_service.apply_deltas(session, user.Id, user.Username, {item_unique_name: -quantity})
+            if not deduction.ok:
                 raise Exception("Insufficient quantity of item to list.")
-            # Deduct the quantity from the user's inventory
-            user_item.Quantity -= quantity
-            session.add(user_item)
             # Create the market listing
             new_listing = Market(
                 SellerId=user.Id,
@@ -356,24 +325,22 @@ async def create_market_listing(user: User, item_unique_name: str, quantity: int
                 ExpireDate=datetime.now() + timedelta(days=3)
             )
             session.add(new_listing)
-            await session.commit()
+            await commit_unit(session)
             await session.refresh(new_listing)
             return new_listing
         except Exception as e:
-            await session.rollback()
+            await rollback_unit(session)
             raise e
 
 # Function to buy items from the market
-async def buy_market_item(buyer: User, listing_id: int, quantity: int):
-    async with AsyncSessionLocal() as session:
+async def buy_market_item(buyer: Principal, listing_id: int, quantity: int, session: AsyncSession = None):
+    async with session_scope(session) as session:
         try:
             # Fetch the listing
+            # Lock the listing so concurrent buyers cannot take the same quantity
             listing_query = select(Market).filter(
                 Market.Id == listing_id
-            ).options(
-                selectinload(Market.item),
-                selectinload(Market.seller)
-            )
+            ).with_for_update()
             result = await session.execute(listing_query)
             listing = result.scalar_one_or_none()
             if not listing:
@@ -384,38 +351,17 @@ async def buy_market_item(buyer: User, listing_id: int, quantity: int):
                 raise Exception("Cannot buy your own listing.")
             # Calculate total price
             total_price = listing.Price * quantity
-            if buyer.Gold < total_price:
+            # Move the gold from buyer to seller, fails if the buyer's balance would go negative
+            buyer_gold_balance = await inventory_service.transfer_gold(session, buyer.Id, listing.SellerId, total_price)
+            if buyer_gold_balance is None:
                 raise Exception("Insufficient gold to complete the purchase.")
-            # Deduct gold from buyer
-            buyer.Gold -= total_price
-            session.add(buyer)
-            # Add gold to seller
-            seller_query = select(User).filter(User.Id == listing.SellerId)
-            seller_result = await session.execute(seller_query)
-            seller = seller_result.scalar_one_or_none()
-            if seller:
-                seller.Gold += total_price
-                session.add(seller)
             # Add item to buyer's inventory
-            buyer_item_query = select(UserItem).filter(
-                UserItem.UserId == buyer.Id,
-                UserItem.UniqueName == listing.ItemUniqueName
-            )
-            buyer_item_result = await session.execute(buyer_item_query)
-            buyer_item = buyer_item_result.scalar_one_or_none()
-            if buyer_item:
-                buyer_item.Quantity += quantity
-            else:
-                buyer_item = UserItem(
-                    UserId=buyer.Id,
-                    Username=buyer.Username,
-                    UniqueName=listing.ItemUniqueName,
-                    Quantity=quantity
-                )
-                session.add(buyer_item)
+            await settle_user_tools(session, buyer.Id)
+            await inventory_service.apply_deltas(session, buyer.Id, buyer.Username, {listing.ItemUniqueName: quantity})
 
-            # Save the transaction to market history
-            await save_market_transaction(
+            # Save the transaction to market history, committed together with the purchase
+            add_market_transaction(
+                session,
                 buyer_id=buyer.Id,
                 seller_id=listing.SellerId,
                 buyer_username=buyer.Username, 
@@ -430,52 +376,44 @@ async def buy_market_item(buyer: User, listing_id: int, quantity: int):
                 await session.delete(listing)
             else:
                 session.add(listing)
-            await session.commit()
-            await session.refresh(buyer)  # Refresh buyer to get updated Gold
+            await commit_unit(session)
             return {
                 'total_price': total_price,
                 'item_unique_name': listing.ItemUniqueName,
-                'item_display_name': listing.item.Name,
+                'item_display_name': (await get_game_catalog()).items[listing.ItemUniqueName].Name,
                 'quantity_bought': quantity,
-                'buyer_gold_balance': buyer.Gold
+                'buyer_gold_balance': buyer_gold_balance
             }
         except Exception as e:
-            await session.rollback()
-            raise e
-        
-# Function to save the transaction to market history
-async def save_market_transaction(
-        buyer_id: str, seller_id: str, buyer_username: str, 
-        seller_username : str, item_unique_name: str,
-        quantity: int, price: float
-        ):
-    async with AsyncSessionLocal() as session:
-        try:
-            new_transaction = MarketHistory(
-                BuyerId=buyer_id,
-                BuyerUsername=buyer_username,
-                SellerId=seller_id,
-                SellerUsername=seller_username,
-                ItemUniqueName=item_unique_name,
-                Quantity=quantity,
-                Price=price,
-                BuyingDate=datetime.now()
-            )
-            session.add(new_transaction)
-            await session.commit()
-            await session.refresh(new_transaction)
-            return new_transaction
-        except Exception as e:
-            await session.rollback()
+            await rollback_unit(session)
             raise e
         
+# Function to add a transaction to market history in the session, the caller commits
+def add_market_transaction(
+        session: AsyncSession, buyer_id: str, seller_id: str, buyer_username: str,
+        seller_username: str, item_unique_name: str, quantity: int, price: float
+        ) -> MarketHistory:
+    new_transaction = MarketHistory(
+        BuyerId=buyer_id,
+        BuyerUsername=buyer_username,
+        SellerId=seller_id,
+        SellerUsername=seller_username,
+        ItemUniqueName=item_unique_name,
+        Quantity=quantity,
+        Price=price,
+        BuyingDate=datetime.now()
+    )
+    session.add(new_transaction)
+    return new_transaction
+
 # Function to get transaction history
 async def get_transaction_history(
     start_date: datetime,
     end_date: datetime,
-    item_unique_name: str
+    item_unique_name: str,
+    session: AsyncSession = None
 ) -> List[MarketHistory]:
-    async with AsyncSessionLocal() as session:
+    async with session_scope(session) as session:
         try:
             query = select(MarketHistory).filter(
                     MarketHistory.BuyingDate >= start_date,
@@ -492,14 +430,11 @@ async def get_transaction_history(
             raise e
         
 # Function to see user's active market listings
-async def fetch_user_market_listings(ListCreator: User) -> List[MarketListing]:
-    async with AsyncSessionLocal() as session:
+async def fetch_user_market_listings(ListCreator: Principal, session: AsyncSession = None) -> List[MarketListing]:
+    async with session_scope(session) as session:
         try:
             result = await session.execute(
                 select(Market)
-                .options(
-                    selectinload(Market.item)
-                )
                 .filter(Market.SellerId == ListCreator.Id)
                 .order_by(Market.ListCreatedAt.desc())
             )
@@ -508,19 +443,20 @@ async def fetch_user_market_listings(ListCreator: User) -> List[MarketListing]:
             if not listings:
                 raise Exception("No active listings found.")
             
+            catalog = await get_game_catalog()
             market_listings = []
             for listing in listings:
 
                 if listing.ExpireDate < datetime.now():
-                    await cancel_market_listing(listing.Id, ListCreator.Id)
+                    await cancel_market_listing(listing.Id, ListCreator.Id, session=session)
 
                 market_listings.append(MarketListing(
                     id=listing.Id,
                     seller_id=str(listing.SellerId),
                     seller_username=listing.SellerUsername,
                     item_unique_name=listing.ItemUniqueName,
-                    item_display_name=listing.item.Name,
-                    item_description=listing.item.ItemDescription,
+                    item_display_name=catalog.items[listing.ItemUniqueName].Name,
+                    item_description=catalog.items[listing.ItemUniqueName].ItemDescription,
                     quantity=listing.Quantity,
                     price=listing.Price,
                     list_created_at=listing.ListCreatedAt,
@@ -530,17 +466,17 @@ async def fetch_user_market_listings(ListCreator: User) -> List[MarketListing]:
             return market_listings
         
         except Exception as e:
-            await session.rollback()
+            await rollback_unit(session)
             raise e
     
 # Function to cancel a market listing
-async def cancel_market_listing(listing_id : int, seller_id : str):
-    async with AsyncSessionLocal() as session:
+async def cancel_market_listing(listing_id : int, seller_id : str, session: AsyncSession = None):
+    async with session_scope(session) as session:
         try:
             # Fetch the listing
             listing_query = select(Market).filter(
                 Market.Id == listing_id
-            )
+            ).with_for_update()
             result = await session.execute(listing_query)
             listing = result.scalar_one_or_none()
 
@@ -550,67 +486,43 @@ async def cancel_market_listing(listing_id : int, seller_id : str):
                 raise Exception("Unauthorized to cancel this listing.")
             
             # Return the quantity to the seller's inventory
-            seller_item_query = select(UserItem).filter(
-                UserItem.UserId == listing.SellerId,
-                UserItem.UniqueName == listing.ItemUniqueName
-                )
-            seller_item_result = await session.execute(seller_item_query)
-            seller_item = seller_item_result.scalar_one_or_none()
-
-            if seller_item:
-                seller_item.Quantity += listing.Quantity
-
-            else:
-                seller_item = UserItem(
-                    UserId=listing.SellerId,
-                    Username=listing.SellerUsername,
-                    UniqueName=listing.ItemUniqueName,
-                    Quantity=listing.Quantity
-                )
-                session.add(seller_item)
+            await settle_user_tools(session, listing.SellerId)
+            await inventory_service.apply_deltas(
+                session, listing.SellerId, listing.SellerUsername, {listing.ItemUniqueName: listing.Quantity}
+            )
 
             # Delete the listing
             await session.delete(listing)
-            await session.commit()
+            await commit_unit(session)
             return True
         
         except Exception as e:
-            await session.rollback()
+            await rollback_unit(session)
             raise e
         
 # Function to quick-sell an item for the user
-async def quick_sell_user_item(user: User, item_unique_name: str, quantity: int):
-    async with AsyncSessionLocal() as session:
+async def quick_sell_user_item(user: Principal, item_unique_name: str, quantity: int, session: AsyncSession = None):
+    async with session_scope(session) as session:
         try:
             # Fetch the user item
             print(item_unique_name)
             print(user.Id)
             print(quantity)
-            user_item_query = select(UserItem).where(
-                UserItem.UserId == user.Id,
-                UserItem.UniqueName == item_unique_name
-            )
-            result = await session.execute(user_item_query)
-            user_item = result.scalar_one_or_none()
-            if not user_item or user_item.Quantity < quantity:
-                raise Exception("Insufficient quantity of item to sell.")
-            # Fetch the item's sell price
-            item_query = select(Item).filter(Item.UniqueName == item_unique_name)
-            item_result = await session.execute(item_query)
-            item = item_result.scalar_one_or_none()
+            await settle_user_tools(session, user.Id)
+            # Look up the item's sell price
+            item = (await get_game_catalog()).items.get(item_unique_name)
             if not item:
                 raise Exception("Item not found.")
             total_price = item.GoldValue * quantity
-            # Deduct the quantity from the user's inventory
-            user_item.Quantity -= quantity
-            session.add(user_item)
+            # Deduct the quantity from the user's inventory if they have enough of the item
+            deduction = await inventory_service.apply_deltas(session, user.Id, user.Username, {item_unique_name: -quantity})
+            if not deduction.ok:
+                raise Exception("Insufficient quantity of item to sell.")
             # Add gold to the user
-            user.Gold += total_price
-            session.add(user)
-            await session.commit()
-            await session.refresh(user)
+            await inventory_service.apply_gold(session, user.Id, total_price)
+            await commit_unit(session)
         except Exception as e:
-            await session.rollback()
+            await rollback_unit(session)
             raise e
         
 # Function to save chat message from user         
@@ -628,8 +540,8 @@ async def save_chat_message(user_id: uuid.UUID, username: str, message_text: str
         return chat_message
     
 # Function to fetch user category level and XP progress.
-async def fetch_user_category_xp(user_identifier: str) -> List[CategoryProgress]:
-    async with AsyncSessionLocal() as session:
+async def fetch_user_category_xp(user_identifier: str, session: AsyncSession = None) -> List[CategoryProgress]:
+    async with session_scope(session) as session:
         try:
             # Try to parse user_identifier as UUID
             try:
@@ -649,13 +561,23 @@ async def fetch_user_category_xp(user_identifier: str) -> List[CategoryProgress]
             if not user:
                 raise Exception("User not found.")
 
+            if await settle_user_tools(session, user.Id):
+                await commit_unit(session)
+                await session.refresh(user, attribute_names=["category_xp"])
+
             # Fetch UserCategoryXP entries for the user
             user_category_xp_list = user.category_xp  # Already loaded via selectinload
+            if state_cache_enabled():
+                state = await state_cache.get_user(user.Id)
+                user_category_xp_list = [
+                    CachedCategoryXP(category, current_xp, level) for category, (current_xp, level) in state.xp.items()
+                ]
 
             if not user_category_xp_list:
                 # User has no category XP entries
                 return []
 
+            catalog = await get_game_catalog()
             categories_progress = []
 
             for ucxp in user_category_xp_list:
@@ -663,26 +585,8 @@ async def fetch_user_category_xp(user_identifier: str) -> List[CategoryProgress]
                 current_xp = ucxp.CurrentXP
                 category_level = ucxp.CategoryLevel
 
-                # Fetch CategoryLevels for the category
-                category_levels_result = await session.execute(
-                    select(CategoryLevels)
-                    .filter(CategoryLevels.Category == category)
-                    .order_by(CategoryLevels.Level.asc())
-                )
-                category_levels = category_levels_result.scalars().all()
-
-                # Find current and next level starting XP
-                current_level_xp = None
-                next_level_xp = None
-
-                for idx, cl in enumerate(category_levels):
-                    if cl.Level == category_level:
-                        current_level_xp = cl.StartingXp
-                        if idx + 1 < len(category_levels):
-                            next_level_xp = category_levels[idx + 1].StartingXp
-                        else:
-                            next_level_xp = None  # Max level reached
-                        break
+                # Find current and next level starting XP, next is None at max level
+                current_level_xp, next_level_xp = catalog.level_starting_xp(category, category_level)
 
                 if current_level_xp is None:
                     current_level_xp = 1 # Default to 1 if not found
@@ -711,5 +615,5 @@ async def fetch_user_category_xp(user_identifier: str) -> List[CategoryProgress]
             return categories_progress
 
         except Exception as e:
-            await session.rollback()
+            await rollback_unit(session)
             raise e
\ No newline at end of file
@@ -479,4 +479,23 @@ class UserCategoryXPResponse(BaseModel):
     :type Categories: List[CategoryProgress
     """
 
-    Categories: List[CategoryProgress]
\ No newline at end of file
+    Categories: List[CategoryProgress]
+
+class CatalogReloadResponse(BaseModel):
+    """
+    Response model for an admin reload of the game catalog.
+
+    :param status: Status of the reload
+    :type status: str
+    :param version: Catalog version now served
+    :type version: str
+    :param previous_version: Catalog version served before the reload
+    :type previous_version: Optional[str]
+    :param changed: Whether the static data changed and the new version was broadcast
+    :type changed: bool
+    """
+
+    status: str
+    version: str
+    previous_version: Optional[str]
+    changed: bool
@@ -1,14 +1,19 @@
 # API/auth.py
 
+import time
+import uuid
+from collections import OrderedDict, namedtuple
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from fastapi import Depends, HTTPException, status, WebSocket
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from Database.models import User
+from .password_hashing import password_hasher
 from Database.database import AsyncSessionLocal
 from sqlalchemy.future import select
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
 from dotenv import load_dotenv
 from os import getenv
 
@@ -19,17 +24,23 @@ SECRET_KEY = getenv("SECRET_KEY")
 ALGORITHM = getenv("JWT_ALGORITHM")
 ACCESS_TOKEN_EXPIRE_DAYS = getenv("JWT_TOKEN_EXPIRE_DAYS") 
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"])
+# Seconds an authenticated user's identity is served from memory, bounds how long a rename
+# or deletion in another worker takes to show. Changes committed in this worker invalidate at once.
+PRINCIPAL_CACHE_TTL = float(getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+
+# Comma separated usernames allowed to call the admin endpoints
+ADMIN_USERNAMES = {name.strip() for name in getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-# Utility functions for password hashing and verification
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# Utility functions for password hashing and verification, bcrypt runs in the hashing pool.
+# Both raise PasswordHasherSaturated when the pool's queue is full.
+async def verify_password(plain_password, hashed_password):
+    return await password_hasher.verify(plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await password_hasher.hash(password)
 
 # Function to authenticate user credentials
 async def authenticate_user(username: str, password: str):
@@ -38,10 +49,150 @@ async def authenticate_user(username: str, password: str):
             select(User).filter(User.Username == username)
         )
         user = result.scalar_one_or_none()
-        if user and verify_password(password, user.Password):
-            return user
+    # The session is not held while the password is verified
+    if user and await verify_password(password, user.Password):
+        return user
     return None
 
+# The authenticated user of a request. Only the identity, balances such as Gold
+# and TotalLevel change all the time and are read fresh where they are needed.
+Principal = namedtuple("Principal", ["Id", "Username", "Email"])
+
+
+class PrincipalCache:
+    """
+    Bounded TTL/LRU cache of the principals behind access tokens, keyed by token.
+    A hit is served without decoding the token again: it was verified when
+    cached and an entry never outlives the token's exp.
+
+    :ivar invalidations: Incremented by every invalidation. A lookup started
+        before an invalidation does not cache the row it read.
+    """
+
+    def __init__(self, max_entries: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_CACHE_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()  # token -> (expires at, Principal)
+        self._tokens_by_user = {}  # user id -> tokens
+        self.invalidations = 0
+
+    def get(self, token: str) -> Optional[Principal]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        expires_at, principal = entry
+        if self.clock() >= expires_at:
+            self._remove(token)
+            return None
+        self._entries.move_to_end(token)
+        return principal
+
+    def put(self, token: str, principal: Principal, token_exp: Optional[float] = None, invalidations: int = None):
+        """
+        :param invalidations: Value of self.invalidations when the principal was read,
+            it is not cached if a user was invalidated since.
+        """
+        if self.max_entries <= 0:
+            return
+        if invalidations is not None and invalidations != self.invalidations:
+            return
+        expires_at = self.clock() + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, self.clock() + token_exp - time.time())
+        self._remove(token)
+        self._entries[token] = (expires_at, principal)
+        self._tokens_by_user.setdefault(principal.Id, set()).add(token)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        self.invalidations += 1
+        for token in list(self._tokens_by_user.get(user_id, ())):
+            self._remove(token)
+
+    def _remove(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        user_id = entry[1].Id
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+
+principal_cache = PrincipalCache()
+
+
+# A renamed or deleted user is dropped from the cache once the change commits, dropping it
+# on flush would let a concurrent lookup cache the row from before the commit again
+def _record_principal_change(user: User):
+    session = object_session(user)
+    if session is not None:
+        session.info.setdefault("changed_principals", set()).add(user.Id)
+
+
+@event.listens_for(User, "after_update")
+def _user_updated(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.Username.history.has_changes() or state.attrs.Email.history.has_changes():
+        _record_principal_change(target)
+
+
+@event.listens_for(User, "after_delete")
+def _user_deleted(mapper, connection, target):
+    _record_principal_change(target)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_principals(session):
+    # A savepoint's commit is not final, the outer transaction's is
+    if session.in_nested_transaction():
+        return
+    for user_id in session.info.pop("changed_principals", ()):
+        principal_cache.invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_principals(session):
+    if not session.in_nested_transaction():
+        session.info.pop("changed_principals", None)
+
+
+async def _principal_for_token(token: str) -> Optional[Principal]:
+    """
+    Returns the principal a valid access token belongs to, or None.
+    Tokens carry the user id in uid; older tokens only have the username in sub.
+    """
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    user_id, username = payload.get("uid"), payload.get("sub")
+    query = select(User.Id, User.Username, User.Email)
+    if user_id is not None:
+        try:
+            query = query.filter(User.Id == uuid.UUID(user_id))
+        except ValueError:
+            return None
+    elif username is not None:
+        query = query.filter(User.Username == username)
+    else:
+        return None
+    invalidations = principal_cache.invalidations
+    async with AsyncSessionLocal() as session:
+        row = (await session.execute(query)).one_or_none()
+    if row is None:
+        return None
+    principal = Principal(*row)
+    principal_cache.put(token, principal, payload.get("exp"), invalidations)
+    return principal
+
 # Function to create access token
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -52,27 +203,21 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 # Dependency to get the current user from the token
 async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(User).filter(User.Username == username)
+    user = await _principal_for_token(token)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
         )
-        user = result.scalar_one_or_none()
-        if user is None:
-            raise credentials_exception
-        return user
+    return user
     
+# Dependency to get the current user, restricted to admins
+async def get_current_admin_user(current_user: Principal = Depends(get_current_user)):
+    if current_user.Username not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
+    return current_user
+
 # Dependency to get the current user from the websocket
 async def get_current_user_websocket(websocket: WebSocket):
     auth_header = websocket.headers.get("Authorization")
@@ -80,19 +225,8 @@ async def get_current_user_websocket(websocket: WebSocket):
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return None
     token = auth_header[len("Bearer "):]
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
-            return None
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(select(User).filter(User.Username == username))
-            user = result.scalar_one_or_none()
-            if user is None:
-                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
-                return None
-            return user
-    except JWTError:
+    user = await _principal_for_token(token)
+    if user is None:
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
-        return None
\ No newline at end of file
+        return None
+    return user
@@ -0,0 +1,40 @@
+# API/encoded_responses.py
+
+import hashlib
+from collections import namedtuple
+from fastapi import Request, Response, status
+from pydantic import TypeAdapter
+
+# A response body serialized once, with the strong ETag of its bytes
+EncodedJSON = namedtuple("EncodedJSON", ["body", "etag"])
+
+
+def encode_json(response_type, value) -> EncodedJSON:
+    """
+    Serializes value as response_type, e.g. List[ToolRecipes], the same way
+    FastAPI would serialize it as the endpoint's response_model.
+    """
+    body = TypeAdapter(response_type).dump_json(value)
+    return EncodedJSON(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    If-None-Match uses the weak comparison: W/"x" matches "x".
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in if_none_match.split(","))
+
+
+def encoded_json_response(request: Request, encoded: EncodedJSON) -> Response:
+    """
+    Returns the pre-encoded body, or 304 Not Modified when the client already holds it.
+    Clients revalidate on every use, a catalog reload changes the ETag.
+    """
+    headers = {"ETag": encoded.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), encoded.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=encoded.body, media_type="application/json", headers=headers)
@@ -0,0 +1,267 @@
+# API/metrics.py
+
+import math
+from Database.database import engine, async_engine, pool_wait_metrics
+from Database.query_accounting import all_query_metrics
+from GameServer.tick_scheduler import all_loop_metrics, DURATION_BUCKETS
+
+# Counters are per process, with several uvicorn workers each worker reports its own.
+# Loops running in a separate tick service are exported by its coordinator (tick_service --metrics-port).
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs) -> str:
+    rendered = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return "{" + rendered + "}" if rendered else ""
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == math.inf else repr(float(bound))
+
+
+class Counter:
+    """
+    Monotonic count per label values, e.g. trades.inc(1, ("market",)).
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, amount: float = 1, labels=()):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, _labels(zip(self.labelnames, labels)), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, labels=()):
+        self.values[labels] = value
+
+    def dec(self, amount: float = 1, labels=()):
+        self.inc(-amount, labels)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram per label values, buckets are upper bounds in seconds.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self.values = {}  # labels -> [bucket counts (not cumulative), sum, count]
+
+    def observe(self, value: float, labels=()):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][i] += 1
+                break
+        entry[1] += value
+        entry[2] += 1
+
+    def samples(self):
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                pairs = (*zip(self.labelnames, labels), ("le", _format_bound(bound)))
+                yield f"{self.name}_bucket", _labels(pairs), cumulative
+            yield f"{self.name}_sum", _labels(zip(self.labelnames, labels)), total
+            yield f"{self.name}_count", _labels(zip(self.labelnames, labels)), count
+
+
+class CollectedMetric:
+    """
+    Metric whose samples are read at scrape time, from state kept elsewhere.
+
+    :param collect: Callable returning (name suffix, ((label, value), ...), value) tuples.
+    """
+
+    def __init__(self, name: str, kind: str, help_text: str, collect):
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.collect = collect
+
+    def samples(self):
+        for suffix, pairs, value in self.collect():
+            yield f"{self.name}{suffix}", _labels(pairs), value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {float(value)!r}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# Updated by the API
+request_latency = registry.register(Histogram(
+    "idlecrafter_http_request_duration_seconds", "HTTP request latency per route.", ("method", "route", "status")
+))
+requests_in_flight = registry.register(Gauge(
+    "idlecrafter_http_requests_in_flight", "HTTP requests being handled."
+))
+websocket_connections = registry.register(Gauge(
+    "idlecrafter_websocket_connections", "Open chat WebSocket connections."
+))
+websocket_connections_opened = registry.register(Counter(
+    "idlecrafter_websocket_connections_opened_total", "Chat WebSocket connections accepted."
+))
+broadcast_latency = registry.register(Histogram(
+    "idlecrafter_websocket_broadcast_duration_seconds", "Time to send one chat message to every connection."
+))
+market_trades = registry.register(Counter(
+    "idlecrafter_market_trades_total", "Completed market purchases."
+))
+market_trade_gold = registry.register(Counter(
+    "idlecrafter_market_trade_gold_total", "Gold paid in completed market purchases."
+))
+password_hash_latency = registry.register(Histogram(
+    "idlecrafter_password_hash_duration_seconds", "Password hashing and verification time, including the queue wait.",
+    ("operation",)
+))
+password_hash_pending = registry.register(Gauge(
+    "idlecrafter_password_hash_pending", "Password hashes waiting or running in the hashing pool."
+))
+password_hash_rejected = registry.register(Counter(
+    "idlecrafter_password_hash_rejected_total", "Logins and signups refused because the hashing pool was saturated.",
+    ("operation",)
+))
+# Reported as 0 before the first change
+for _metric in (requests_in_flight, websocket_connections, websocket_connections_opened, market_trades, market_trade_gold,
+                password_hash_pending):
+    _metric.inc(0)
+
+
+def _collect_pools():
+    for label, pool in (("sync", engine.pool), ("async", async_engine.pool)):
+        yield "", (("engine", label), ("state", "size")), pool.size()
+        yield "", (("engine", label), ("state", "checked_out")), pool.checkedout()
+        yield "", (("engine", label), ("state", "overflow")), max(pool.overflow(), 0)
+
+
+def _collect_pool_waits():
+    for label, metrics in pool_wait_metrics.items():
+        cumulative = 0
+        for bound, count in zip(metrics.buckets, metrics.counts):
+            cumulative += count
+            yield "_bucket", (("engine", label), ("le", _format_bound(bound))), cumulative
+        yield "_sum", (("engine", label),), metrics.total
+        yield "_count", (("engine", label),), metrics.count
+
+
+def _collect_loop_durations(series):
+    def collect():
+        # LoopMetrics keeps cumulative bucket counts already
+        for pairs, snapshot in series():
+            for bound in DURATION_BUCKETS:
+                yield "_bucket", (*pairs, ("le", _format_bound(bound))), snapshot["duration_buckets"][bound]
+            yield "_sum", pairs, snapshot["duration_sum"]
+            yield "_count", pairs, snapshot["runs"]
+    return collect
+
+
+def _collect_loops(series, field: str):
+    def collect():
+        for pairs, snapshot in series():
+            yield "", pairs, snapshot[field]
+    return collect
+
+
+def register_loop_metrics(registry: MetricsRegistry, series):
+    """
+    Registers the game loop metrics, read from series() at scrape time.
+
+    :param series: Callable returning (((label, value), ...), LoopMetrics snapshot) pairs.
+    """
+    registry.register(CollectedMetric(
+        "idlecrafter_tick_duration_seconds", "histogram", "Duration of game loop runs.", _collect_loop_durations(series)
+    ))
+    registry.register(CollectedMetric(
+        "idlecrafter_tick_lag_seconds", "gauge", "Seconds the last run started behind its slot.",
+        _collect_loops(series, "lag")
+    ))
+    registry.register(CollectedMetric(
+        "idlecrafter_tick_max_lag_seconds", "gauge", "Largest lag of any run.", _collect_loops(series, "max_lag")
+    ))
+    registry.register(CollectedMetric(
+        "idlecrafter_tick_errors_total", "counter", "Failed game loop runs.", _collect_loops(series, "errors")
+    ))
+    registry.register(CollectedMetric(
+        "idlecrafter_tick_skipped_total", "counter", "Ticks dropped after an overrun.", _collect_loops(series, "skipped")
+    ))
+    registry.register(CollectedMetric(
+        "idlecrafter_tick_merged_total", "counter", "Ticks merged into a later run.", _collect_loops(series, "merged")
+    ))
+    registry.register(CollectedMetric(
+        "idlecrafter_tick_rows_total", "counter", "Rows processed by game loop runs.", _collect_loops(series, "rows")
+    ))
+
+
+def _local_loops():
+    for name, snapshot in all_loop_metrics().items():
+        yield (("loop", name),), snapshot
+
+
+def _collect_queries(field: str):
+    def collect():
+        for name, snapshot in all_query_metrics().items():
+            yield "", (("unit", name),), snapshot[field]
+    return collect
+
+
+registry.register(CollectedMetric(
+    "idlecrafter_db_pool_connections", "gauge", "Connections of the database pools.", _collect_pools
+))
+registry.register(CollectedMetric(
+    "idlecrafter_db_pool_checkout_wait_seconds", "histogram", "Time spent waiting for a pooled connection.",
+    _collect_pool_waits
+))
+register_loop_metrics(registry, _local_loops)
+registry.register(CollectedMetric(
+    "idlecrafter_db_queries_total", "counter", "Statements sent per route or loop.", _collect_queries("queries")
+))
+registry.register(CollectedMetric(
+    "idlecrafter_db_rows_total", "counter", "Rows returned or changed per route or loop.", _collect_queries("rows")
+))
+registry.register(CollectedMetric(
+    "idlecrafter_db_time_seconds_total", "counter", "Statement execution time per route or loop.", _collect_queries("db_time")
+))
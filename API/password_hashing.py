@@ -0,0 +1,69 @@
+# API/password_hashing.py
+
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from .metrics import password_hash_latency, password_hash_rejected, password_hash_pending
+from . import password_worker
+
+# Processes hashing and verifying passwords, bcrypt would otherwise block the event loop
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(2, os.cpu_count() or 1))))
+# Hashes waiting or running beyond which logins and signups are refused with 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+
+
+class PasswordHasherSaturated(Exception):
+    """Raised when PASSWORD_HASH_MAX_PENDING hashes are already pending."""
+    pass
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a small process pool with a bounded queue. Requests beyond
+    the bound fail fast with PasswordHasherSaturated instead of queueing, so a
+    login storm sheds load rather than delaying every login for minutes.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor = None
+
+    def start(self):
+        if self._executor is None:
+            # Spawned, forking a worker with a running event loop and open connections is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+    async def _run(self, operation: str, fn, *args):
+        if self.pending >= self.max_pending:
+            password_hash_rejected.inc(1, (operation,))
+            raise PasswordHasherSaturated("Too many logins in progress, try again shortly.")
+        self.start()
+        self.pending += 1
+        password_hash_pending.set(self.pending)
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+            password_hash_pending.set(self.pending)
+            password_hash_latency.observe(time.perf_counter() - start, (operation,))
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", password_worker.hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run("verify", password_worker.verify_password, plain_password, hashed_password)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
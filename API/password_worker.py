@@ -0,0 +1,14 @@
+# API/password_worker.py
+
+from passlib.context import CryptContext
+
+# Runs in the password hashing processes, kept free of heavy imports so they start fast
+pwd_context = CryptContext(schemes=["bcrypt"])
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
@@ -0,0 +1,328 @@
+# Benchmarks/load_test.py
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+import httpx
+import websockets
+from Benchmarks.tick_benchmark import percentile, _git_revision
+
+DEFAULT_STAGES = "10:30,50:30,100:30"
+# WebSocket round trips are reported under this name, next to the HTTP routes
+CHAT_ENDPOINT = "WS /ws/chat"
+
+
+class LatencyRecorder:
+    """
+    Latency samples per stage and endpoint. Endpoints are named by route,
+    e.g. "GET /user/items", so parametrised URLs share one entry.
+    """
+
+    def __init__(self):
+        self.stage = None
+        self.samples = {}  # (stage, endpoint) -> [seconds]
+        self.errors = {}  # (stage, endpoint) -> count
+
+    def record(self, endpoint: str, seconds: float, ok: bool):
+        key = (self.stage, endpoint)
+        self.samples.setdefault(key, []).append(seconds)
+        if not ok:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def stage_report(self, stage: str, duration: float) -> dict:
+        endpoints = {}
+        for (sample_stage, endpoint), latencies in sorted(self.samples.items()):
+            if sample_stage != stage:
+                continue
+            endpoints[endpoint] = {
+                "requests": len(latencies),
+                "errors": self.errors.get((stage, endpoint), 0),
+                "throughput_rps": len(latencies) / duration if duration else 0.0,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+            }
+        return endpoints
+
+
+class PlayerSession:
+    """
+    One scripted player: logs in, joins the chat, then loops polling the
+    inventory and tools, crafting, trading on the market and chatting until
+    the stage ends. Requests that the game rejects (e.g. not enough items)
+    are recorded as errors but do not end the session.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, ws_url: str, recorder: LatencyRecorder,
+                 username: str, password: str, think_time: float, rng: random.Random):
+        self.client = client
+        self.ws_url = ws_url
+        self.recorder = recorder
+        self.username = username
+        self.password = password
+        self.think_time = think_time
+        self.rng = rng
+        self.headers = {}
+        self.items = {}  # UniqueName -> (quantity, gold value)
+        self.recipes = None
+        self._chat = None
+        self._chat_reader = None
+        self._chat_waiters = {}  # message text -> Future
+
+    async def request(self, method: str, path: str, endpoint: str = None, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, headers=self.headers, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.record(endpoint or f"{method} {path}", time.perf_counter() - start, False)
+            return None
+        self.recorder.record(endpoint or f"{method} {path}", time.perf_counter() - start, response.is_success)
+        return response if response.is_success else None
+
+    async def login(self) -> bool:
+        response = await self.request("POST", "/token", data={"username": self.username, "password": self.password})
+        if response is None:
+            return False
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return True
+
+    async def join_chat(self):
+        try:
+            self._chat = await websockets.connect(self.ws_url, extra_headers=self.headers)
+        except (OSError, websockets.WebSocketException):
+            self.recorder.record(CHAT_ENDPOINT, 0.0, False)
+            return
+        self._chat_reader = asyncio.create_task(self._read_chat())
+
+    async def _read_chat(self):
+        # Every client receives every broadcast, only our own messages are awaited
+        try:
+            async for raw in self._chat:
+                waiter = self._chat_waiters.pop(json.loads(raw).get("text"), None)
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(None)
+        except websockets.WebSocketException:
+            pass
+
+    async def chat(self):
+        if self._chat is None:
+            return
+        text = f"load test {uuid.uuid4().hex[:12]}"
+        waiter = self._chat_waiters[text] = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        try:
+            await self._chat.send(json.dumps({"text": text}))
+            await asyncio.wait_for(waiter, timeout=10)
+            ok = True
+        except (asyncio.TimeoutError, websockets.WebSocketException):
+            self._chat_waiters.pop(text, None)
+            ok = False
+        self.recorder.record(CHAT_ENDPOINT, time.perf_counter() - start, ok)
+
+    async def poll(self):
+        response = await self.request("GET", "/user/items")
+        if response is not None:
+            self.items = {
+                item["item_unique_name"]: (item["item_quantity"], item["item_gold_value"])
+                for items in response.json()["items_by_category"].values() for item in items
+            }
+        await self.request("GET", "/user/tools")
+
+    async def craft(self):
+        if self.recipes is None:
+            response = await self.request("GET", "/item-crafting-recipes")
+            if response is None:
+                return
+            self.recipes = [recipe for tool in response.json() for recipe in tool["recipe_list"]]
+        craftable = [
+            recipe for recipe in self.recipes
+            if all(self.items.get(i["input_item_unique_name"], (0, None))[0] >= i["input_item_quantity"] for i in recipe["input_items"])
+        ]
+        if craftable:
+            recipe = self.rng.choice(craftable)
+            await self.request("POST", "/craft/item", json={
+                "item_unique_name": recipe["output_item_unique_name"], "quantity": 1
+            })
+
+    async def trade(self):
+        sellable = [(name, value) for name, (quantity, value) in self.items.items() if quantity > 0 and value]
+        if sellable:
+            unique_name, gold_value = self.rng.choice(sellable)
+            await self.request("POST", "/market/list", json={
+                "item_unique_name": unique_name, "quantity": 1, "price": round(gold_value * 1.1, 2)
+            })
+        response = await self.request("GET", "/market/listings")
+        if response is None:
+            return
+        others = [listing for listing in response.json()["listings"] if listing["seller_username"] != self.username]
+        if others:
+            listing = min(others, key=lambda l: l["price"])
+            await self.request("POST", "/market/buy", json={"listing_id": listing["id"], "quantity": 1})
+
+    async def run(self, stop_at: float):
+        if not await self.login():
+            return
+        await self.join_chat()
+        try:
+            while time.monotonic() < stop_at:
+                await self.poll()
+                await self.craft()
+                await self.trade()
+                await self.chat()
+                if self.think_time > 0:
+                    await asyncio.sleep(self.rng.uniform(0, 2 * self.think_time))
+        finally:
+            if self._chat is not None:
+                await self._chat.close()
+                await self._chat_reader
+
+
+def parse_stages(spec: str):
+    """
+    Parses "10:30,50:30" into [(concurrency, seconds), ...].
+    """
+    stages = []
+    for part in filter(None, spec.split(",")):
+        concurrency, _, seconds = part.partition(":")
+        stages.append((int(concurrency), float(seconds)))
+    return stages
+
+
+async def run_load_test(base_url: str, stages, username_prefix: str, num_players: int, password: str,
+                        think_time: float, seed: int) -> dict:
+    """
+    Runs the stages one after another, each with its number of concurrent
+    player sessions drawn from the generated players <prefix>0..<prefix>N-1.
+
+    :return: Per stage, the latency and throughput of every endpoint.
+    """
+    rng = random.Random(seed)
+    recorder = LatencyRecorder()
+    ws_url = base_url.replace("http", "ws", 1) + "/ws/chat"
+    report = []
+    max_concurrency = max(concurrency for concurrency, _ in stages)
+    limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        for concurrency, seconds in stages:
+            stage = f"{concurrency}x{seconds:g}s"
+            recorder.stage = stage
+            players = rng.sample(range(num_players), min(concurrency, num_players))
+            start = time.monotonic()
+            await asyncio.gather(*(
+                PlayerSession(
+                    client, ws_url, recorder, f"{username_prefix}{index}", password, think_time,
+                    random.Random(rng.getrandbits(32))
+                ).run(start + seconds)
+                for index in players
+            ))
+            duration = time.monotonic() - start
+            endpoints = recorder.stage_report(stage, duration)
+            report.append({"concurrency": concurrency, "duration": duration, "endpoints": endpoints})
+            total = sum(metrics["requests"] for metrics in endpoints.values())
+            print(f"Stage {stage}: {total} requests, {total / duration:.0f} req/s.")
+            for endpoint, metrics in endpoints.items():
+                print(f"  {endpoint:<28} {metrics['throughput_rps']:>8.1f} req/s  p50 {metrics['p50_ms']:>7.1f} ms  "
+                      f"p95 {metrics['p95_ms']:>7.1f} ms  p99 {metrics['p99_ms']:>7.1f} ms  errors {metrics['errors']}")
+    return report
+
+
+def compare_reports(baseline: dict, current: dict):
+    """
+    Prints the change of throughput and latency per stage and endpoint between two reports.
+    """
+    baseline_endpoints = {
+        (stage["concurrency"], endpoint): metrics
+        for stage in baseline["stages"] for endpoint, metrics in stage["endpoints"].items()
+    }
+    print(f"{'users':>6} {'endpoint':<28} {'metric':<16} {'baseline':>10} {'current':>10} {'change':>8}")
+    for stage in current["stages"]:
+        for endpoint, metrics in stage["endpoints"].items():
+            previous = baseline_endpoints.get((stage["concurrency"], endpoint))
+            if previous is None:
+                continue
+            for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "errors"):
+                old, new = previous[metric], metrics[metric]
+                change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+                print(f"{stage['concurrency']:>6} {endpoint:<28} {metric:<16} {old:>10.1f} {new:>10.1f} {change:>8}")
+
+
+def start_server(port: int, workers: int):
+    """
+    Starts uvicorn serving API.api_app:app and waits for /health.
+    """
+    process = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "API.api_app:app",
+        "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers), "--log-level", "warning",
+    ], env=os.environ.copy())
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The API server exited with code {process.returncode}.")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health").is_success:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("The API server did not become healthy within 60 seconds.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the HTTP and WebSocket API with scripted player sessions.")
+    parser.add_argument("--base-url", default=None, help="Running API to test, by default one is started locally")
+    parser.add_argument("--port", type=int, default=8100, help="Port of the locally started API")
+    parser.add_argument("--workers", type=int, default=1, help="Uvicorn workers of the locally started API")
+    parser.add_argument("--stages", default=DEFAULT_STAGES, help="Comma-separated concurrency:seconds ramp")
+    parser.add_argument("--players", type=int, default=1000, help="Generated players to draw sessions from")
+    parser.add_argument("--username-prefix", default="player_", help="Username prefix of the generated players")
+    parser.add_argument("--password", default="password", help="Password of the generated players")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean pause between session loops in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the sessions")
+    parser.add_argument("--output", default=None, help="JSON file for the report")
+    parser.add_argument("--baseline", default=None, help="Earlier report to compare against")
+    args = parser.parse_args()
+
+    # Players come from python -m GenerateData.generate_world with the same prefix and password
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = start_server(args.port, args.workers)
+        base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        stages = asyncio.run(run_load_test(
+            base_url.rstrip("/"), parse_stages(args.stages), args.username_prefix, args.players,
+            args.password, args.think_time, args.seed
+        ))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "revision": _git_revision(),
+        "started_at": datetime.now().isoformat(),
+        "base_url": base_url,
+        "workers": args.workers if server is not None else None,
+        "think_time": args.think_time,
+        "stages": stages,
+    }
+    output = args.output or f"loadtest-{report['revision'] or 'local'}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {output}.")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare_reports(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Benchmarks/population.py
+
+import random
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from Database.database import engine
+from GenerateData.generate_world import copy_rows
+
+# Tables holding player state, emptied before a population is seeded
+PLAYER_TABLES = (
+    "inventory_ledger", "chat_history", "market_history", "market",
+    "user_category_xp", "user_items", "user_tools", "users",
+)
+# Stored for every synthetic user, nobody logs in during a benchmark
+BENCHMARK_PASSWORD_HASH = "!benchmark"
+
+
+class ToolMix:
+    """
+    Tools given to every synthetic user.
+
+    :param repeating: Enabled repeating tools per user, drawn from the catalog's repeating tools.
+    :param crafting: Occupied crafting tools per user, each with a long-running craft.
+    :param max_tier: Highest tool tier handed out.
+    """
+
+    def __init__(self, repeating: int = 3, crafting: int = 1, max_tier: int = 3):
+        self.repeating = repeating
+        self.crafting = crafting
+        self.max_tier = max_tier
+
+    @classmethod
+    def parse(cls, spec: str):
+        """
+        Parses "repeating=3,crafting=1,max_tier=3".
+        """
+        values = {}
+        for part in filter(None, spec.split(",")):
+            key, _, value = part.partition("=")
+            values[key.strip()] = int(value)
+        return cls(**values)
+
+    def as_dict(self) -> dict:
+        return {"repeating": self.repeating, "crafting": self.crafting, "max_tier": self.max_tier}
+
+
+def seed_population(catalog, num_users: int, tool_mix: ToolMix, seed: int = 0) -> dict:
+    """
+    Replaces all player state with num_users synthetic users built from the
+    game catalog: tools per tool_mix, the resources their drop tables consume
+    and one XP row per category.
+
+    :return: Number of rows written per table.
+    """
+    rng = random.Random(seed)
+    now = datetime.now()
+
+    repeating_tools = [
+        key for key, tool in catalog.tools.items()
+        if tool.isRepeating and key[1] <= tool_mix.max_tier and catalog.drop_tables.get(key)
+    ]
+    crafting_tools = [
+        (key, recipes[0]) for key, recipes in catalog.recipes_by_tool.items()
+        if key in catalog.tools and key[1] <= tool_mix.max_tier and not catalog.tools[key].isRepeating
+    ]
+    resources = sorted({
+        drop.ResourceUniqueName for key in repeating_tools for drop in catalog.drop_tables[key]
+        if drop.ResourceUniqueName
+    } | {recipe.InputItemUniqueName for _, recipe in crafting_tools})
+    categories = sorted(catalog.level_thresholds)
+
+    users = [(uuid.UUID(int=rng.getrandbits(128), version=4), f"bench_user_{i}") for i in range(num_users)]
+
+    def user_rows():
+        for user_id, username in users:
+            yield (user_id, username, f"{username}@bench.invalid", BENCHMARK_PASSWORD_HASH, now, 1000.0, 100.0, len(categories))
+
+    def user_tool_rows():
+        for user_id, username in users:
+            for tool_id, (tool_name, tier) in enumerate(rng.sample(repeating_tools, min(tool_mix.repeating, len(repeating_tools))), 1):
+                yield (user_id, username, tool_name, tool_id, tier, now, True, False, None, None, None)
+            for tool_id, ((tool_name, tier), recipe) in enumerate(rng.sample(crafting_tools, min(tool_mix.crafting, len(crafting_tools))), 1):
+                # Due on every tick of the benchmark, see reset_crafting_tools
+                yield (user_id, username, tool_name, tool_id, tier, now, True, True,
+                       now - timedelta(hours=1), recipe.OutputItemUniqueName, 1_000_000)
+
+    def user_item_rows():
+        for user_id, username in users:
+            for unique_name in resources:
+                yield (user_id, username, unique_name, rng.randint(1_000, 1_000_000))
+
+    def user_xp_rows():
+        for user_id, username in users:
+            for category in categories:
+                yield (user_id, username, category, 0, 1, now)
+
+    counts = {}
+    with engine.connect() as conn:
+        conn.execute(text(f"TRUNCATE {', '.join(PLAYER_TABLES)} RESTART IDENTITY CASCADE"))
+        counts["users"] = copy_rows(conn, "users", (
+            "Id", "Username", "Email", "Password", "UserCreatedAt", "Gold", "Energy", "TotalLevel"
+        ), user_rows())
+        counts["user_tools"] = copy_rows(conn, "user_tools", (
+            "UserId", "Username", "ToolUniqueName", "ToolId", "Tier", "AcquiredAt", "isEnabled", "isOccupied",
+            "LastUsed", "OngoingCraftingItemUniqueName", "OngoingRemainedQuantity"
+        ), user_tool_rows())
+        counts["user_items"] = copy_rows(conn, "user_items", ("UserId", "Username", "UniqueName", "Quantity"), user_item_rows())
+        counts["user_category_xp"] = copy_rows(conn, "user_category_xp", (
+            "UserId", "Username", "Category", "CurrentXP", "CategoryLevel", "LastUpdated"
+        ), user_xp_rows())
+        conn.commit()
+        conn.execute(text(f"ANALYZE {', '.join(PLAYER_TABLES)}"))
+        conn.commit()
+    return counts
+
+
+def reset_crafting_tools():
+    """
+    Moves LastUsed of every occupied tool an hour back, so the next crafting
+    run finds all of them due.
+    """
+    with engine.begin() as conn:
+        conn.execute(
+            text('UPDATE user_tools SET "LastUsed" = :last_used, "OngoingRemainedQuantity" = 1000000 WHERE "isOccupied"'),
+            {"last_used": datetime.now() - timedelta(hours=1)}
+        )
@@ -0,0 +1,214 @@
+# Benchmarks/tick_benchmark.py
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import resource
+import subprocess
+import time
+from datetime import datetime
+
+DEFAULT_POPULATIONS = "1000,10000,100000"
+ENGINES = ("repeating_tools", "crafting")
+
+
+class QueryCounter:
+    """
+    Counts the statements sent by an engine, an executemany counts once.
+    """
+
+    def __init__(self, sync_engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def reset(self):
+        self.count = 0
+
+
+def percentile(values, q: float) -> float:
+    """
+    Nearest-rank percentile of values, q in [0, 100].
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+async def _measure_ticks(tick_fn, ticks: int, counter: QueryCounter, prepare=None) -> dict:
+    latencies, queries, rows = [], [], []
+    for _ in range(ticks):
+        if prepare is not None:
+            await prepare()
+        counter.reset()
+        start = time.perf_counter()
+        rows.append(await tick_fn() or 0)
+        latencies.append(time.perf_counter() - start)
+        queries.append(counter.count)
+    total_time = sum(latencies)
+    return {
+        "ticks": ticks,
+        "rows_per_tick": sum(rows) / ticks,
+        "tool_ticks_per_sec": sum(rows) / total_time if total_time else 0.0,
+        "queries_per_tick": sum(queries) / ticks,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+
+async def _run_engines(engines, ticks: int, warmup: int) -> dict:
+    # Imported here so each child process creates its own engines
+    from Database.database import async_engine, AsyncSessionLocal
+    from GameServer.crafting_scheduler import CraftingScheduler
+    from GameServer.repeating_tools_engine import process_repeating_tools_async
+    from Benchmarks.population import reset_crafting_tools
+
+    counter = QueryCounter(async_engine.sync_engine)
+    results = {}
+
+    if "repeating_tools" in engines:
+        for _ in range(warmup):
+            await process_repeating_tools_async()
+        results["repeating_tools"] = await _measure_ticks(process_repeating_tools_async, ticks, counter)
+
+    if "crafting" in engines:
+        # No periodic resync during a run, the heap is rebuilt before every tick
+        scheduler = CraftingScheduler(resync_interval=86400)
+
+        async def prepare():
+            await asyncio.to_thread(reset_crafting_tools)
+            async with AsyncSessionLocal() as session:
+                await scheduler.rebuild(session)
+
+        for _ in range(warmup):
+            await prepare()
+            await scheduler.process_due()
+        results["crafting"] = await _measure_ticks(scheduler.process_due, ticks, counter, prepare)
+
+    # Linux reports kilobytes
+    peak_memory_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    for result in results.values():
+        result["peak_memory_mb"] = peak_memory_mb
+    await async_engine.dispose()
+    return results
+
+
+def _child_main(engines, ticks: int, warmup: int, result_queue):
+    result_queue.put(asyncio.run(_run_engines(engines, ticks, warmup)))
+
+
+def run_population(num_users: int, ticks: int, warmup: int, tool_mix, engines, seed: int) -> dict:
+    """
+    Seeds num_users synthetic users and runs the engines in a fresh process,
+    so the peak memory is that of the tick engines alone.
+    """
+    from GameServer.game_catalog import load_game_catalog
+    from Benchmarks.population import seed_population
+
+    catalog = asyncio.run(load_game_catalog())
+    start = time.perf_counter()
+    rows = seed_population(catalog, num_users, tool_mix, seed)
+    print(f"Seeded {num_users} users in {time.perf_counter() - start:.1f}s: {rows}")
+
+    context = multiprocessing.get_context("spawn")
+    result_queue = context.Queue()
+    process = context.Process(target=_child_main, args=(engines, ticks, warmup, result_queue))
+    process.start()
+    results = result_queue.get()
+    process.join()
+    return {"users": num_users, "seeded_rows": rows, "engines": results}
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare_results(baseline: dict, current: dict):
+    """
+    Prints the change of every metric between two result files.
+    """
+    baseline_runs = {(run["users"], engine): metrics for run in baseline["runs"] for engine, metrics in run["engines"].items()}
+    print(f"{'users':>8} {'engine':<16} {'metric':<20} {'baseline':>12} {'current':>12} {'change':>8}")
+    for run in current["runs"]:
+        for engine, metrics in run["engines"].items():
+            previous = baseline_runs.get((run["users"], engine))
+            if previous is None:
+                continue
+            for metric in ("tool_ticks_per_sec", "queries_per_tick", "p50_ms", "p99_ms", "peak_memory_mb"):
+                old, new = previous.get(metric), metrics.get(metric)
+                if old is None or new is None:
+                    continue
+                change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+                print(f"{run['users']:>8} {engine:<16} {metric:<20} {old:>12.2f} {new:>12.2f} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tick engines against synthetic populations.")
+    parser.add_argument("--users", default=DEFAULT_POPULATIONS, help="Comma-separated population sizes")
+    parser.add_argument("--ticks", type=int, default=10, help="Measured ticks per engine and population")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured ticks before measuring")
+    parser.add_argument("--tool-mix", default="repeating=3,crafting=1,max_tier=3", help="Tools per synthetic user")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="Comma-separated engines to run")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the population")
+    parser.add_argument("--output", default=None, help="JSON file for the results")
+    parser.add_argument("--baseline", default=None, help="Earlier results file to compare against")
+    parser.add_argument("--force", action="store_true", help="Allow a database whose name does not contain 'bench'")
+    args = parser.parse_args()
+
+    from Database.database import engine, Base
+    import Database.models  # Registers the tables for create_all
+    from GenerateData.import_game_data import import_game_data
+    from Benchmarks.population import ToolMix
+
+    # Seeding truncates every player table
+    database_name = engine.url.database or ""
+    if "bench" not in database_name and not args.force:
+        print(f"Refusing to wipe player tables of database '{database_name}', use a throwaway *bench* database or --force.")
+        raise SystemExit(1)
+
+    # The populations are built from the real GameData catalog
+    Base.metadata.create_all(bind=engine)
+    import_game_data()
+
+    tool_mix = ToolMix.parse(args.tool_mix)
+    engines = [name for name in args.engines.split(",") if name in ENGINES]
+    report = {
+        "revision": _git_revision(),
+        "started_at": datetime.now().isoformat(),
+        "tool_mix": tool_mix.as_dict(),
+        "ticks": args.ticks,
+        "runs": [],
+    }
+    for num_users in (int(size) for size in args.users.split(",")):
+        run = run_population(num_users, args.ticks, args.warmup, tool_mix, engines, args.seed)
+        report["runs"].append(run)
+        for engine_name, metrics in run["engines"].items():
+            print(f"{num_users} users, {engine_name}: {metrics['tool_ticks_per_sec']:.0f} tool-ticks/s, "
+                  f"{metrics['queries_per_tick']:.1f} queries/tick, p50 {metrics['p50_ms']:.1f} ms, "
+                  f"p99 {metrics['p99_ms']:.1f} ms, peak {metrics['peak_memory_mb']:.0f} MB")
+
+    output = args.output or f"benchmark-{report['revision'] or 'local'}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}.")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare_results(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 # Database/database.py
 
-from sqlalchemy import create_engine
+import math
+import time
+from contextlib import asynccontextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from dotenv import load_dotenv
@@ -11,15 +15,161 @@ load_dotenv()
 DATABASE_URL = os.getenv("DB_URL")
 ASYNC_DATABASE_URL = os.getenv("ASYNC_DB_URL")
 
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, math.inf)
+
+
+class PoolWaitMetrics:
+    """
+    Histogram of the time spent getting a connection from a pool, including
+    opening a new one while the pool is not full.
+    """
+
+    def __init__(self, buckets=POOL_WAIT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.total += seconds
+        self.count += 1
+
+
+pool_wait_metrics = {"sync": PoolWaitMetrics(), "async": PoolWaitMetrics()}
+
+
+class _TimedCheckout:
+    wait_metrics = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.wait_metrics.observe(time.perf_counter() - start)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    wait_metrics = pool_wait_metrics["sync"]
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    wait_metrics = pool_wait_metrics["async"]
+
+
 # Synchronous Engine and Session
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, poolclass=TimedQueuePool)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
 # Asynchronous Engine and Session
-async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False, poolclass=TimedAsyncQueuePool)
 AsyncSessionLocal = sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
 
 Base = declarative_base()
 
 
+@asynccontextmanager
+async def session_scope(session: AsyncSession = None):
+    """
+    Yields the given session, or a new AsyncSessionLocal session that is
+    closed when the block exits.
+    """
+    if session is not None:
+        yield session
+        return
+    async with AsyncSessionLocal() as new_session:
+        yield new_session
+
+
+async def request_session():
+    """
+    FastAPI dependency providing one session and transaction per request.
+    Data-access functions given this session only flush (see commit_unit), the
+    transaction is committed once when the endpoint returns and rolled back if
+    it raises, so a request checks out a single pooled connection.
+    """
+    async with AsyncSessionLocal() as session:
+        session.info["shared_transaction"] = True
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+        await session.commit()
+
+
+def is_shared_session(session: AsyncSession) -> bool:
+    """
+    True for a session whose transaction spans several units of work, e.g. a
+    request or a batch of user actor commands. Its owner commits or rolls back.
+    """
+    return session.info.get("shared_transaction", False)
+
+
+async def commit_unit(session: AsyncSession):
+    """
+    Commits a unit of work, or only flushes it into a shared transaction.
+    """
+    if is_shared_session(session):
+        await session.flush()
+    else:
+        await session.commit()
+
+
+async def rollback_unit(session: AsyncSession):
+    """
+    Rolls back a failed unit of work. A shared transaction is left to its
+    owner, which rolls back the unit's savepoint when the error reaches it.
+    """
+    if not is_shared_session(session):
+        await session.rollback()
+
+
+def _after_commit_callbacks(session: AsyncSession) -> list:
+    sync_session = session.sync_session
+    callbacks = sync_session.info.get("after_commit_callbacks")
+    if callbacks is None:
+        callbacks = sync_session.info["after_commit_callbacks"] = []
+
+        # A savepoint's commit is not final, only the outermost transaction's is
+        @event.listens_for(sync_session, "after_commit")
+        def _run(sess):
+            if sess.in_nested_transaction():
+                return
+            while callbacks:
+                callbacks.pop(0)()
+
+        @event.listens_for(sync_session, "after_rollback")
+        def _forget(sess):
+            if not sess.in_nested_transaction():
+                callbacks.clear()
+    return callbacks
+
+
+def after_commit_unit(session: AsyncSession, callback):
+    """
+    Calls callback() once the unit of work committed by commit_unit is durable.
+    That is at once for a session of its own, and when its owner commits for a
+    shared transaction. Dropped if the shared transaction is rolled back.
+    """
+    if is_shared_session(session):
+        _after_commit_callbacks(session).append(callback)
+    else:
+        callback()
+
+
+def after_commit_point(session: AsyncSession):
+    """
+    Returns a function that drops the after_commit_unit callbacks registered
+    on session after this call, for a savepoint that is rolled back on its own.
+    """
+    callbacks = _after_commit_callbacks(session)
+    mark = len(callbacks)
 
+    def rollback_to_point():
+        del callbacks[mark:]
+    return rollback_to_point
@@ -1,8 +1,8 @@
 # Database/models.py
 
 from sqlalchemy import (
-    Column, Integer, String, ForeignKey, Float, DateTime, Boolean,
-    ForeignKeyConstraint, UniqueConstraint, and_, Text
+    Column, Integer, BigInteger, String, ForeignKey, Float, DateTime, Boolean,
+    ForeignKeyConstraint, UniqueConstraint, Index, and_, Text, text
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID as pgUUID
@@ -223,6 +223,10 @@ class UserItem(Base):
     UniqueName = Column(String, ForeignKey('items.UniqueName'), nullable=False)
     Quantity = Column(Integer, default=0)
 
+    __table_args__ = (
+        UniqueConstraint('UserId', 'UniqueName', name='unique_user_item'),
+    )
+
     # Relationships
     user = relationship('User', back_populates='items')
     item = relationship('Item', back_populates='user_items')
@@ -242,6 +246,7 @@ class UserTool(Base):
     LastUsed = Column(DateTime, default=None, nullable=True)
     OngoingCraftingItemUniqueName = Column(String, ForeignKey('items.UniqueName'), nullable=True)
     OngoingRemainedQuantity = Column(Integer, nullable=True)
+    LastSettled = Column(DateTime, default=None, nullable=True)
 
     __table_args__ = (
         ForeignKeyConstraint(
@@ -249,6 +254,8 @@ class UserTool(Base):
             ['tools.UniqueName', 'tools.Tier'],
             name='fk_user_tools_tool'
         ),
+        # The crafting loop looks up the recently started crafts on every tick
+        Index('ix_user_tools_occupied_last_used', 'LastUsed', postgresql_where=text('"isOccupied"')),
     )
 
     # Relationships
@@ -331,5 +338,27 @@ class UserCategoryXP(Base):
     CategoryLevel = Column(Integer, nullable=False)
     LastUpdated = Column(DateTime, default=datetime.now(), nullable=False)
 
+    __table_args__ = (
+        UniqueConstraint('UserId', 'Category', name='unique_user_category_xp'),
+    )
+
     # Relationships
-    user = relationship('User', back_populates='category_xp')
\ No newline at end of file
+    user = relationship('User', back_populates='category_xp')
+
+class InventoryLedger(Base):
+    __tablename__ = 'inventory_ledger'
+
+    # Append-only inventory deltas written by the game loops, folded into
+    # user_items by the ledger compactor. No foreign keys, to keep bulk inserts cheap.
+    Id = Column(BigInteger, primary_key=True)
+    UserId = Column(pgUUID(as_uuid=True), nullable=False)
+    Username = Column(String, nullable=False)
+    UniqueName = Column(String, nullable=False)
+    Delta = Column(Integer, nullable=False)
+    Source = Column(String, nullable=False)
+    TickId = Column(BigInteger, nullable=True)
+    CreatedAt = Column(DateTime, default=datetime.now, nullable=False)
+
+    __table_args__ = (
+        Index('ix_inventory_ledger_user', 'UserId', 'UniqueName'),
+    )
@@ -0,0 +1,177 @@
+# Database/query_accounting.py
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from .database import engine, async_engine
+
+# "true": responses carry X-DB-Queries, X-DB-Rows and X-DB-Time-Ms headers.
+QUERY_DEBUG_HEADERS = os.getenv("QUERY_DEBUG_HEADERS", "false").lower() == "true"
+# A request or tick sending the same statement this often is reported as a likely N+1
+QUERY_REPEAT_WARN_THRESHOLD = int(os.getenv("QUERY_REPEAT_WARN_THRESHOLD", "10"))
+
+
+class QueryStats:
+    """
+    Statements sent to the database by one unit of work (a request or a tick),
+    on either engine. An executemany counts as one statement.
+
+    :ivar db_time: Seconds spent executing the statements, including the round trips.
+    :ivar statements: SQL text -> times it was sent, parameters not included.
+    :ivar parent: Stats of the enclosing scope, which count the same statements.
+    """
+
+    __slots__ = ("queries", "rows", "db_time", "statements", "parent")
+
+    def __init__(self, parent=None):
+        self.queries = 0
+        self.rows = 0
+        self.db_time = 0.0
+        self.statements = {}
+        self.parent = parent
+
+    def max_repeats(self) -> int:
+        return max(self.statements.values(), default=0)
+
+    def repeated_statements(self, threshold: int):
+        """
+        (count, statement) of the statements sent at least threshold times, most repeated first.
+        """
+        return sorted(
+            ((count, statement) for statement, count in self.statements.items() if count >= threshold),
+            reverse=True
+        )
+
+
+_current_stats: ContextVar = ContextVar("query_stats", default=None)
+
+
+def current_query_stats():
+    return _current_stats.get()
+
+
+@contextmanager
+def query_scope():
+    """
+    Accounts the statements of the enclosed block, including tasks and
+    threads started from it, to a new QueryStats, which is yielded.
+    Scopes nest: a statement counts in the stats of every enclosing scope,
+    e.g. in a test's budget and in the request's own stats.
+    """
+    stats = QueryStats(_current_stats.get())
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def assert_query_budget(max_queries: int, max_repeats: int = None):
+    """
+    Fails with QueryBudgetExceeded when the enclosed block sends more than
+    max_queries statements, or one statement more than max_repeats times,
+    so N+1 regressions fail the tests:
+
+        with assert_query_budget(3, max_repeats=1):
+            await fetch_user_category_xp(user_id)
+    """
+    with query_scope() as stats:
+        yield stats
+    problems = []
+    if stats.queries > max_queries:
+        problems.append(f"{stats.queries} queries, budget {max_queries}")
+    if max_repeats is not None and stats.max_repeats() > max_repeats:
+        problems.append(f"a statement repeated {stats.max_repeats()} times, budget {max_repeats}")
+    if problems:
+        statements = "\n".join(f"  {count}x {statement}" for count, statement in stats.repeated_statements(1))
+        raise QueryBudgetExceeded(f"Query budget exceeded: {', '.join(problems)}.\n{statements}")
+
+
+class QueryMetrics:
+    """
+    Query totals of all units of work with the same name, e.g. a route.
+    """
+
+    __slots__ = ("units", "queries", "rows", "db_time", "max_queries", "n_plus_one")
+
+    def __init__(self):
+        self.units = 0
+        self.queries = 0
+        self.rows = 0
+        self.db_time = 0.0
+        self.max_queries = 0
+        self.n_plus_one = 0
+
+    def observe(self, stats: QueryStats):
+        self.units += 1
+        self.queries += stats.queries
+        self.rows += stats.rows
+        self.db_time += stats.db_time
+        self.max_queries = max(self.max_queries, stats.queries)
+        if stats.max_repeats() >= QUERY_REPEAT_WARN_THRESHOLD:
+            self.n_plus_one += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "units": self.units,
+            "queries": self.queries,
+            "rows": self.rows,
+            "db_time": self.db_time,
+            "max_queries": self.max_queries,
+            "n_plus_one": self.n_plus_one,
+            "queries_per_unit": self.queries / self.units if self.units else 0.0,
+        }
+
+
+_query_metrics = {}
+
+
+def record_query_stats(name: str, stats: QueryStats):
+    """
+    Adds a finished unit of work to the process-wide metrics of name and
+    reports statements it repeated QUERY_REPEAT_WARN_THRESHOLD times or more.
+    """
+    metrics = _query_metrics.get(name)
+    if metrics is None:
+        metrics = _query_metrics[name] = QueryMetrics()
+    metrics.observe(stats)
+    for count, statement in stats.repeated_statements(QUERY_REPEAT_WARN_THRESHOLD):
+        print(f"Possible N+1 in {name}: statement sent {count} times: {' '.join(statement.split())[:200]}")
+
+
+def all_query_metrics() -> dict:
+    return {name: metrics.snapshot() for name, metrics in _query_metrics.items()}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats.get() is not None:
+        context._query_start_time = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    start = getattr(context, "_query_start_time", None)
+    if stats is None or start is None:
+        return
+    elapsed = time.perf_counter() - start
+    rows = cursor.rowcount if cursor.rowcount and cursor.rowcount > 0 else 0
+    while stats is not None:
+        stats.db_time += elapsed
+        stats.queries += 1
+        stats.rows += rows
+        stats.statements[statement] = stats.statements.get(statement, 0) + 1
+        stats = stats.parent
+
+
+# The async engine's events fire on its sync core, in the greenlet SQLAlchemy
+# runs it in, which shares the awaiting task's context.
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,79 @@
+# GameServer/catalog_channel.py
+
+import asyncio
+import os
+from sqlalchemy import text
+from Database.database import async_engine
+
+# "postgres": LISTEN/NOTIFY, reaches every API and tick worker connected to the database.
+# "local": in-process stand-in, for single-process setups.
+CATALOG_CHANNEL_BACKEND = os.getenv("CATALOG_CHANNEL_BACKEND", "postgres")
+CATALOG_CHANNEL_NAME = "idlecrafter_catalog"
+
+
+class LocalCatalogChannel:
+    """
+    In-process pub/sub stand-in, delivers published versions to the subscribers of this process.
+    """
+
+    def __init__(self):
+        self._subscribers = []
+
+    async def publish(self, version: str):
+        for callback in list(self._subscribers):
+            callback(version)
+
+    async def listen(self, callback):
+        """
+        Calls callback(version) for every published version until cancelled.
+        """
+        self._subscribers.append(callback)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self._subscribers.remove(callback)
+
+
+class PostgresCatalogChannel:
+    """
+    Postgres LISTEN/NOTIFY channel, the payload is the catalog version.
+    """
+
+    def __init__(self, channel: str = CATALOG_CHANNEL_NAME):
+        self.channel = channel
+
+    async def publish(self, version: str):
+        async with async_engine.connect() as conn:
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": version})
+
+    async def listen(self, callback):
+        """
+        Calls callback(version) for every notification until cancelled or the
+        listening connection is lost, in which case ConnectionError is raised.
+        """
+        async with async_engine.connect() as conn:
+            raw_connection = await conn.get_raw_connection()
+            driver_connection = raw_connection.driver_connection
+            lost = asyncio.Event()
+
+            def on_notification(connection, pid, channel, payload):
+                callback(payload)
+
+            driver_connection.add_termination_listener(lambda connection: lost.set())
+            await driver_connection.add_listener(self.channel, on_notification)
+            try:
+                await lost.wait()
+                raise ConnectionError(f"Lost the LISTEN connection of channel '{self.channel}'.")
+            finally:
+                if not driver_connection.is_closed():
+                    await driver_connection.remove_listener(self.channel, on_notification)
+
+
+_local_channel = LocalCatalogChannel()
+
+
+def make_catalog_channel():
+    if CATALOG_CHANNEL_BACKEND == "postgres":
+        return PostgresCatalogChannel()
+    return _local_channel
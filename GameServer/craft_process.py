@@ -6,26 +6,28 @@ from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from sqlalchemy import select
-from Database.models import (
-    User, UserItem, UserTool, Tool, Item, CraftingRecipe
-)
-from Database.database import AsyncSessionLocal
+from Database.models import User, UserTool
+from Database.database import session_scope, commit_unit, rollback_unit, after_commit_unit
+from .crafting_scheduler import crafting_scheduler
+from .game_catalog import get_game_catalog
+from .inventory_service import inventory_service
+from .offline_progress import settle_user_tools
 import uuid
 
-async def craft_item(user_identifier: str, output_item_unique_name: str, quantity: int):
+async def craft_item(user_identifier: str, output_item_unique_name: str, quantity: int, session: AsyncSession = None):
     """
     Asynchronous function to handle crafting requests.
 
     :param user_identifier: UserId (UUID as string) or Username.
     :param output_item_unique_name: UniqueName of the item to craft.
     :param quantity: Quantity of the item to craft.
+    :param session: Session to run in, e.g. a user actor's shared session. A new session if None.
     """
-    async with AsyncSessionLocal() as session:
+    async with session_scope(session) as session:
         try:
             # Step 1: Retrieve the user
             user_query = select(User).options(
-                selectinload(User.tools).selectinload(UserTool.tool),
-                selectinload(User.items)
+                selectinload(User.tools)
             )
             try:
                 # Try to parse user_identifier as UUID
@@ -42,14 +44,12 @@ async def craft_item(user_identifier: str, output_item_unique_name: str, quantit
                 print("User not found.")
                 raise HTTPException(status_code=404, detail="User not found.")
 
+            # Settle repeating tool production before checking the inventory
+            await settle_user_tools(session, user.Id)
+
             # Step 2: Retrieve the crafting recipes for the output item
-            recipe_query = select(CraftingRecipe).filter(
-                CraftingRecipe.OutputItemUniqueName == output_item_unique_name
-            ).options(
-                selectinload(CraftingRecipe.tool)
-            )
-            recipe_entries_result = await session.execute(recipe_query)
-            recipe_entries = recipe_entries_result.scalars().all()
+            catalog = await get_game_catalog()
+            recipe_entries = catalog.recipes_by_output.get(output_item_unique_name, ())
 
             if not recipe_entries:
                 print(f"No crafting recipe found for item '{output_item_unique_name}'.")
@@ -76,31 +76,26 @@ async def craft_item(user_identifier: str, output_item_unique_name: str, quantit
 
                 total_input_requirements[input_item_name] = total_quantity_needed
 
-            # Step 5: Check if the user has enough input items
-            user_items_dict = {ui.UniqueName: ui for ui in user.items}
-            missing_items = []
+            # Step 5: Deduct input items from the user's inventory, fails if the user lacks any of them
+            deduction = await inventory_service.apply_deltas(
+                session, user.Id, user.Username,
+                {input_item_name: -total_needed for input_item_name, total_needed in total_input_requirements.items()}
+            )
 
-            for input_item_name, total_needed in total_input_requirements.items():
-                user_item = user_items_dict.get(input_item_name)
-                if not user_item or user_item.Quantity < total_needed:
-                    missing_items.append({
+            if not deduction.ok:
+                missing_items = [
+                    {
                         "item": input_item_name,
-                        "required": total_needed,
-                        "available": user_item.Quantity if user_item else 0
-                    })
-
-            if missing_items:
+                        "required": total_input_requirements[input_item_name],
+                        "available": available
+                    }
+                    for input_item_name, available in deduction.failed.items()
+                ]
                 print(f"User lacks required input items: {missing_items}")
                 missing_items_str = ', '.join([f"{mi['required']} x '{mi['item']}'" for mi in missing_items])
                 raise HTTPException(status_code=400, detail=f"Insufficient input items: {missing_items_str}")
 
-            # Step 6: Deduct input items from the user's inventory
-            for input_item_name, total_needed in total_input_requirements.items():
-                user_item = user_items_dict[input_item_name]
-                user_item.Quantity -= total_needed
-                session.add(user_item)  # Mark as updated
-
-            # Step 7: Update UserTool for ongoing crafting
+            # Step 6: Update UserTool for ongoing crafting
             user_tool.isOccupied = True
             user_tool.LastUsed = datetime.now()
             user_tool.OngoingCraftingItemUniqueName = output_item_unique_name
@@ -108,17 +103,21 @@ async def craft_item(user_identifier: str, output_item_unique_name: str, quantit
             session.add(user_tool)
 
             # Commit the transaction
-            await session.commit()
+            await commit_unit(session)
+
+            # Let the crafting scheduler know when the first unit is due, once the craft is committed
+            tool_id, started_at, duration, user_id = user_tool.Id, user_tool.LastUsed, recipe_entries[0].GenerationDuration, user.Id
+            after_commit_unit(session, lambda: crafting_scheduler.schedule(tool_id, started_at, duration, user_id))
 
             print(f"Crafting started for user '{user.Username}': {quantity} x '{output_item_unique_name}' using tool '{tool_unique_name}'.")
 
             return {"status": "success", "message": "Crafting started."}
 
         except HTTPException as http_exc:
-            await session.rollback()
+            await rollback_unit(session)
             print(f"HTTPException during crafting: {http_exc.detail}")
             raise http_exc  # Re-raise to be handled by FastAPI
         except Exception as e:
-            await session.rollback()
+            await rollback_unit(session)
             print(f"Error during crafting: {e}")
             raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
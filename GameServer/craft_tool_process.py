@@ -6,26 +6,27 @@ from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from sqlalchemy import select, and_, func
-from Database.models import (
-    User, UserItem, UserTool, Tool, Item, ToolCraftingRecipe, UserCategoryXP, CategoryLevels
-)
-from Database.database import AsyncSessionLocal
+from Database.models import User, UserTool, UserCategoryXP
+from Database.database import session_scope, commit_unit, rollback_unit
+from .game_catalog import get_game_catalog
+from .inventory_service import inventory_service
+from .offline_progress import settle_user_tools
 import uuid
 
-async def craft_tool(user_identifier: str, output_tool_unique_name: str, tier: int):
+async def craft_tool(user_identifier: str, output_tool_unique_name: str, tier: int, session: AsyncSession = None):
     """
     Asynchronous function to handle tool crafting requests.
 
     :param user_identifier: UserId (UUID as string) or Username.
     :param output_tool_unique_name: UniqueName of the tool to craft.
     :param tier: The tier of the tool to craft.
+    :param session: Session to run in, e.g. a user actor's shared session. A new session if None.
     """
-    async with AsyncSessionLocal() as session:
+    async with session_scope(session) as session:
         try:
             # Step 1: Retrieve the user
             user_query = select(User).options(
-                selectinload(User.items),
-                selectinload(User.tools).selectinload(UserTool.tool),
+                selectinload(User.tools),
                 selectinload(User.category_xp)  # Load user's category XP
             )
             try:
@@ -43,25 +44,20 @@ async def craft_tool(user_identifier: str, output_tool_unique_name: str, tier: i
                 print("User not found.")
                 raise HTTPException(status_code=404, detail="User not found.")
 
+            # Settle repeating tool production before checking the inventory and levels
+            if await settle_user_tools(session, user.Id):
+                await session.refresh(user, attribute_names=["category_xp"])
+
             # Step 2: Retrieve the tool
-            tool_query = select(Tool).filter(
-                Tool.UniqueName == output_tool_unique_name,
-                Tool.Tier == tier
-            )
-            tool_result = await session.execute(tool_query)
-            tool = tool_result.scalars().one_or_none()
+            catalog = await get_game_catalog()
+            tool = catalog.tools.get((output_tool_unique_name, tier))
 
             if not tool:
                 print(f"Tool '{output_tool_unique_name}' with Tier {tier} not found in the database.")
                 raise HTTPException(status_code=404, detail=f"Tool '{output_tool_unique_name}' with Tier {tier} not found.")
 
             # Step 3: Retrieve all crafting recipes for the tool and tier
-            recipe_query = select(ToolCraftingRecipe).filter(
-                ToolCraftingRecipe.OutputToolUniqueName == output_tool_unique_name,
-                ToolCraftingRecipe.OutputToolTier == tier
-            )
-            recipe_result = await session.execute(recipe_query)
-            recipes = recipe_result.scalars().all()
+            recipes = catalog.tool_recipes.get((output_tool_unique_name, tier), ())
 
             if not recipes:
                 print(f"No crafting recipe found for tool '{output_tool_unique_name}' with Tier {tier}.")
@@ -85,33 +81,23 @@ async def craft_tool(user_identifier: str, output_tool_unique_name: str, tier: i
                 )
             # --- End of Level Check Addition ---
 
-            # Step 4: Check if the user has enough input items
-            user_items_dict = {ui.UniqueName: ui for ui in user.items}
-
-            missing_items = []
-            for recipe in recipes:
-                required_quantity = recipe.InputQuantity
-                input_item_name = recipe.InputItemUniqueName
-                user_item = user_items_dict.get(input_item_name)
-
-                if not user_item or user_item.Quantity < required_quantity:
-                    missing_quantity = required_quantity - (user_item.Quantity if user_item else 0)
-                    missing_items.append(f"{missing_quantity} x '{input_item_name}'")
+            # Step 4: Deduct input items from the user's inventory, fails if the user lacks any of them
+            required_quantities = {recipe.InputItemUniqueName: recipe.InputQuantity for recipe in recipes}
+            deduction = await inventory_service.apply_deltas(
+                session, user.Id, user.Username,
+                {input_item_name: -required_quantity for input_item_name, required_quantity in required_quantities.items()}
+            )
 
-            if missing_items:
+            if not deduction.ok:
+                missing_items = [
+                    f"{required_quantities[input_item_name] - available} x '{input_item_name}'"
+                    for input_item_name, available in deduction.failed.items()
+                ]
                 missing_items_str = ', '.join(missing_items)
                 print(f"User lacks required input items: {missing_items_str}")
                 raise HTTPException(status_code=400, detail=f"Missing required input items: {missing_items_str}")
 
-            # Step 5: Deduct input items from the user's inventory
-            for recipe in recipes:
-                required_quantity = recipe.InputQuantity
-                input_item_name = recipe.InputItemUniqueName
-                user_item = user_items_dict[input_item_name]
-                user_item.Quantity -= required_quantity
-                session.add(user_item)  # Mark as updated
-
-            # Step 6: Check user's existing tools
+            # Step 5: Check user's existing tools
             user_tools_of_type = [
                 ut for ut in user.tools if ut.ToolUniqueName == output_tool_unique_name
             ]
@@ -125,7 +111,7 @@ async def craft_tool(user_identifier: str, output_tool_unique_name: str, tier: i
                         # Upgrade the existing tool's Tier
                         existing_user_tool.Tier = tier
                         session.add(existing_user_tool)
-                        await session.commit()
+                        await commit_unit(session)
                         print(f"User's existing tool '{output_tool_unique_name}' upgraded to Tier {tier}.")
                         return {"status": "success", "message": f"Upgraded tool '{output_tool_unique_name}' to Tier {tier}."}
                     else:
@@ -140,10 +126,11 @@ async def craft_tool(user_identifier: str, output_tool_unique_name: str, tier: i
                         ToolId=1,
                         Tier=tier,
                         AcquiredAt=datetime.now(),
-                        isEnabled=True
+                        isEnabled=True,
+                        LastSettled=datetime.now()
                     )
                     session.add(new_user_tool)
-                    await session.commit()
+                    await commit_unit(session)
                     print(f"User '{user.Username}' crafted tool '{output_tool_unique_name}' at Tier {tier}.")
                     return {"status": "success", "message": f"Crafted tool '{output_tool_unique_name}' at Tier {tier}."}
             else:
@@ -165,18 +152,19 @@ async def craft_tool(user_identifier: str, output_tool_unique_name: str, tier: i
                         ToolId=next_multiple_tool_id,
                         Tier=tier,
                         AcquiredAt=datetime.utcnow(),
-                        isEnabled=True
+                        isEnabled=True,
+                        LastSettled=datetime.now()
                     )
                     session.add(new_user_tool)
-                    await session.commit()
+                    await commit_unit(session)
                     print(f"User '{user.Username}' crafted tool '{output_tool_unique_name}' at Tier {tier}.")
                     return {"status": "success", "message": f"Crafted tool '{output_tool_unique_name}' at Tier {tier}."}
 
         except HTTPException as http_exc:
-            await session.rollback()
+            await rollback_unit(session)
             print(f"HTTPException during tool crafting: {http_exc.detail}")
             raise http_exc  # Re-raise to be handled by FastAPI
         except Exception as e:
-            await session.rollback()
+            await rollback_unit(session)
             print(f"Error during tool crafting: {e}")
             raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
@@ -0,0 +1,282 @@
+# GameServer/crafting_scheduler.py
+
+import heapq
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from Database.models import UserTool
+from Database.database import AsyncSessionLocal
+from .game_catalog import get_game_catalog
+from .repeating_tools_engine import TickDeltas, load_user_state, apply_tick_deltas
+from .sharding import Shard, user_in_shard, user_shard_clause
+
+# Full re-read of the occupied tools, drops stale heap entries.
+CRAFTING_RESYNC_SECONDS = float(os.getenv("CRAFTING_RESYNC_SECONDS", "60"))
+# Every tick reads the crafts started since the previous tick, this far back, so crafts
+# committed a little after their LastUsed was set, or on a host with a skewed clock, are not missed.
+CRAFTING_SCAN_OVERLAP_SECONDS = float(os.getenv("CRAFTING_SCAN_OVERLAP_SECONDS", "30"))
+
+
+class CraftingScheduler:
+    """
+    Min-heap of next-completion timestamps for occupied tools.
+
+    Each heap entry is (due_at, user_tool_id) where due_at is the time the next
+    unit of the ongoing craft finishes (LastUsed + GenerationDuration). A tick
+    only pops the entries that are due and loads just those tools, so the cost
+    follows the number of finished crafts instead of the number of occupied tools.
+    Stale heap entries are skipped lazily by comparing with self._due.
+
+    Crafts started in other processes, e.g. API workers next to a separate
+    tick service, are picked up by a scan of the recently started crafts on
+    every tick, so they are scheduled within one tick of being committed.
+
+    With a shard set, only the tools of users in that shard are scheduled.
+    """
+
+    def __init__(self, resync_interval: float = CRAFTING_RESYNC_SECONDS, shard: Shard = None):
+        self._heap = []
+        self._due = {}  # user_tool_id -> due_at of its live heap entry
+        self._resync_interval = resync_interval
+        self._last_sync = None
+        self._last_scan = None
+        self.shard = shard
+
+    def __len__(self):
+        return len(self._due)
+
+    def reset(self):
+        """
+        Drops the heap, it is rebuilt from the database on the next tick.
+        """
+        self._heap = []
+        self._due = {}
+        self._last_sync = None
+        self._last_scan = None
+
+    def set_shard(self, shard: Shard):
+        """
+        Switches to another shard, the heap is rebuilt on the next tick.
+        """
+        self.shard = shard
+        self.reset()
+
+    def schedule(self, user_tool_id: int, last_used: datetime, generation_duration: float, user_id=None):
+        """
+        Schedules the next unit of an ongoing craft.
+
+        Before the first rebuild this is a no-op, the rebuild picks the craft up
+        from the database. That is also the case in processes that never run the
+        crafting loop, where the loop's scan of new crafts finds it instead.
+
+        :param user_tool_id: Id of the occupied UserTool.
+        :param last_used: Time the current unit started (UserTool.LastUsed).
+        :param generation_duration: Seconds per unit from the CraftingRecipe.
+        :param user_id: Owner of the tool, crafts of users outside the shard are ignored.
+        """
+        if self._last_sync is None:
+            return
+        if user_id is not None and not user_in_shard(user_id, self.shard):
+            return
+        due_at = last_used + timedelta(seconds=generation_duration)
+        self._due[user_tool_id] = due_at
+        heapq.heappush(self._heap, (due_at, user_tool_id))
+
+    def unschedule(self, user_tool_id: int):
+        self._due.pop(user_tool_id, None)
+
+    def next_due(self):
+        """
+        Returns the earliest scheduled completion time, or None if nothing is scheduled.
+        """
+        while self._heap:
+            due_at, user_tool_id = self._heap[0]
+            if self._due.get(user_tool_id) == due_at:
+                return due_at
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now: datetime):
+        """
+        Removes and returns the ids of all tools whose next unit is due at now.
+        """
+        due_ids = []
+        while self._heap and self._heap[0][0] <= now:
+            due_at, user_tool_id = heapq.heappop(self._heap)
+            if self._due.get(user_tool_id) == due_at:
+                del self._due[user_tool_id]
+                due_ids.append(user_tool_id)
+        return due_ids
+
+    def _retry(self, user_tool_ids, now: datetime):
+        """
+        Makes tools that could not be processed due again on the next tick.
+        """
+        for user_tool_id in user_tool_ids:
+            self.schedule(user_tool_id, now, 0)
+
+    def needs_resync(self, now: datetime) -> bool:
+        return self._last_sync is None or (now - self._last_sync).total_seconds() >= self._resync_interval
+
+    async def _load_due_times(self, session, started_after: datetime = None):
+        """
+        Returns (user_tool_id, due_at) of the occupied UserTools in the shard.
+
+        :param started_after: Only the tools whose current unit started after this time, all if None.
+        """
+        catalog = await get_game_catalog()
+        query = (
+            select(UserTool.Id, UserTool.LastUsed, UserTool.ToolUniqueName, UserTool.OngoingCraftingItemUniqueName)
+            .filter(UserTool.isOccupied == True, UserTool.LastUsed.isnot(None))
+        )
+        if started_after is not None:
+            query = query.filter(UserTool.LastUsed > started_after)
+        if self.shard is not None:
+            query = query.filter(user_shard_clause(UserTool.UserId, self.shard))
+        result = await session.execute(query)
+        due_times = []
+        for user_tool_id, last_used, tool_unique_name, crafting_item_name in result:
+            recipes = catalog.crafting_recipes_for(tool_unique_name, crafting_item_name)
+            if not recipes:
+                continue
+            # Same row process_due completes units with
+            due_times.append((user_tool_id, last_used + timedelta(seconds=recipes[0].GenerationDuration)))
+        return due_times
+
+    async def rebuild(self, session):
+        """
+        Rebuilds the heap from every occupied UserTool in the database.
+        """
+        now = datetime.now()
+        due_times = await self._load_due_times(session)
+        self._due = dict(due_times)
+        self._heap = [(due_at, user_tool_id) for user_tool_id, due_at in due_times]
+        heapq.heapify(self._heap)
+        self._last_sync = self._last_scan = now
+
+    async def scan_new_crafts(self, session):
+        """
+        Schedules the crafts started since the previous scan, minus CRAFTING_SCAN_OVERLAP_SECONDS.
+        Tools that are already scheduled for the same time are left as they are.
+        """
+        now = datetime.now()
+        started_after = self._last_scan - timedelta(seconds=CRAFTING_SCAN_OVERLAP_SECONDS)
+        for user_tool_id, due_at in await self._load_due_times(session, started_after):
+            if self._due.get(user_tool_id) != due_at:
+                self._due[user_tool_id] = due_at
+                heapq.heappush(self._heap, (due_at, user_tool_id))
+        self._last_scan = now
+
+    async def process_due(self) -> int:
+        """
+        Completes the crafted units of every tool that is due and reschedules
+        the tools that still have quantity remaining.
+
+        :return: Number of tools processed.
+        """
+        async with AsyncSessionLocal() as session:
+            try:
+                current_time = datetime.now()
+                if self.needs_resync(current_time):
+                    await self.rebuild(session)
+                else:
+                    await self.scan_new_crafts(session)
+
+                due_ids = self.pop_due(current_time)
+                if not due_ids:
+                    return 0
+
+                # Step 1: Fetch and lock the due UserTools. Rows locked by another
+                # process are skipped here and retried on the next tick.
+                result = await session.execute(
+                    select(UserTool).filter(UserTool.Id.in_(due_ids)).with_for_update(skip_locked=True)
+                )
+                locked_tools = result.scalars().all()
+                skipped_ids = set(due_ids) - {ut.Id for ut in locked_tools}
+                due_tools = [ut for ut in locked_tools if ut.isOccupied]
+                if not due_tools:
+                    await session.commit()
+                    self._retry(skipped_ids, current_time)
+                    return 0
+
+                # Step 2: Fetch XP of all due users at once,
+                # recipes, items and levels come from the game catalog
+                catalog = await get_game_catalog()
+                _, category_xp = await load_user_state(session, list({ut.UserId for ut in due_tools}))
+
+                rescheduled = []
+                deltas = TickDeltas(source="crafting", tick_id=int(current_time.timestamp() * 1000))
+                for user_tool in due_tools:
+                    user_id = user_tool.UserId
+                    crafting_item_name = user_tool.OngoingCraftingItemUniqueName
+                    item = catalog.items.get(crafting_item_name)
+                    last_used = user_tool.LastUsed
+
+                    recipes = catalog.crafting_recipes_for(user_tool.ToolUniqueName, crafting_item_name)
+                    recipe = recipes[0] if recipes else None
+                    if not recipe or item is None or last_used is None:
+                        print(f"No crafting recipe found for tool '{user_tool.ToolUniqueName}' and item '{crafting_item_name}'.")
+                        continue
+
+                    generation_duration = recipe.GenerationDuration
+                    elapsed_time = (current_time - last_used).total_seconds()
+                    crafted_quantity = min(int(elapsed_time // generation_duration), user_tool.OngoingRemainedQuantity)
+
+                    if crafted_quantity <= 0:
+                        rescheduled.append((user_tool.Id, last_used, generation_duration))
+                        continue
+
+                    # Step 3: Collect the output for the user's inventory
+                    output_quantity = crafted_quantity * recipe.OutputQuantity
+                    deltas.add_item(user_id, crafting_item_name, output_quantity)
+                    deltas.usernames[user_id] = user_tool.Username
+
+                    # Step 4: Update UserTool
+                    user_tool.OngoingRemainedQuantity -= crafted_quantity
+                    if user_tool.OngoingRemainedQuantity <= 0:
+                        # Crafting is complete
+                        user_tool.isOccupied = False
+                        user_tool.OngoingCraftingItemUniqueName = None
+                        user_tool.OngoingRemainedQuantity = None
+                        user_tool.LastUsed = None
+                        print(f"Crafting completed for user '{user_tool.Username}': '{crafting_item_name}'")
+                    else:
+                        user_tool.LastUsed = last_used + timedelta(seconds=crafted_quantity * generation_duration)
+                        rescheduled.append((user_tool.Id, user_tool.LastUsed, generation_duration))
+
+                    # --- XP Yielding Functionality ---
+                    xp_to_add = output_quantity * (item.XPYield or 0)
+                    category = item.Category
+                    user_xp = category_xp.setdefault(user_id, {})
+                    xp_entry = user_xp.setdefault(category, [0, 1])
+                    xp_entry[0] += xp_to_add
+                    key = (user_id, category)
+                    deltas.xp_deltas[key] = deltas.xp_deltas.get(key, 0) + xp_to_add
+
+                    new_level = catalog.level_for_xp(category, xp_entry[0], xp_entry[1])
+                    if new_level > xp_entry[1]:
+                        xp_entry[1] = new_level
+                        print(f"User '{user_tool.Username}' leveled up in category '{category}' to level {new_level}.")
+                        # All of the user's XP rows are loaded, so the sum matches the database
+                        deltas.total_levels[user_id] = sum(level for _, level in user_xp.values())
+                    deltas.levels[key] = xp_entry[1]
+                    # --- End of XP Yielding Functionality ---
+
+                # Add all crafted items and XP with one bulk statement per table
+                await apply_tick_deltas(session, deltas)
+                await session.commit()
+
+                for user_tool_id, last_used, generation_duration in rescheduled:
+                    self.schedule(user_tool_id, last_used, generation_duration)
+                self._retry(skipped_ids, current_time)
+                return len(due_tools)
+
+            except Exception as e:
+                await session.rollback()
+                # Force a rebuild so the popped tools are picked up again
+                self._last_sync = None
+                print(f"Error processing ongoing crafting: {e}")
+                return 0
+
+
+crafting_scheduler = CraftingScheduler()
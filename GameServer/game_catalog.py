@@ -0,0 +1,350 @@
+# GameServer/game_catalog.py
+
+import asyncio
+import hashlib
+from bisect import bisect_right
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Optional
+from sqlalchemy import select
+from Database.database import async_engine
+from Database.models import (
+    Item, Tool, ToolGeneratableItem, CraftingRecipe, ToolCraftingRecipe, CategoryLevels
+)
+from .catalog_channel import make_catalog_channel
+
+
+# Immutable copies of the static game data rows. Attribute names follow the
+# ORM models so code reading them works the same with either.
+
+@dataclass(frozen=True)
+class ItemDef:
+    UniqueName: str
+    Name: str
+    Category: str
+    GoldValue: Optional[float]
+    Probability: Optional[float]
+    isLegendary: Optional[bool]
+    isCraftable: Optional[bool]
+    ItemDescription: Optional[str]
+    XPYield: Optional[int]
+
+
+@dataclass(frozen=True)
+class ToolDef:
+    UniqueName: str
+    Name: str
+    Category: str
+    isRepeating: Optional[bool]
+    ProbabilityBoost: Optional[float]
+    ToolDescription: Optional[str]
+    StorageCapacity: Optional[int]
+    Tier: int
+    isMultipleCraftable: Optional[bool]
+    maxCraftingNumber: Optional[int]
+
+
+@dataclass(frozen=True)
+class DropDef:
+    ToolUniqueName: str
+    ToolTier: int
+    ItemUniqueName: str
+    ResourceUniqueName: Optional[str]
+    ResourceQuantity: Optional[int]
+    OutputItemQuantity: int
+
+
+@dataclass(frozen=True)
+class CraftingRecipeDef:
+    InputItemUniqueName: str
+    InputQuantity: int
+    ToolUniqueName: str
+    ToolTier: int
+    OutputItemUniqueName: str
+    OutputQuantity: int
+    GenerationDuration: Optional[float]
+
+
+@dataclass(frozen=True)
+class ToolCraftingRecipeDef:
+    InputItemUniqueName: str
+    InputQuantity: int
+    OutputToolUniqueName: str
+    OutputToolTier: int
+    GenerationDuration: Optional[float]
+    Category: Optional[str]
+    MinimumCategoryLevel: Optional[int]
+
+
+@dataclass(frozen=True)
+class ToolUpgradeStep:
+    """
+    One craftable tier of a tool in the tool-upgrade graph.
+
+    :param Inputs: (ItemUniqueName, item Name, InputQuantity) of every input item of the recipe.
+    """
+    Tier: int
+    Name: str
+    Category: Optional[str]
+    MinimumCategoryLevel: int
+    isMultipleCraftable: bool
+    maxCraftingNumber: int
+    Inputs: tuple
+
+
+def catalog_version(*tables) -> str:
+    """
+    Order-independent content hash of the static tables.
+    """
+    digest = hashlib.sha256()
+    for rows in tables:
+        for line in sorted(repr(row) for row in rows):
+            digest.update(line.encode())
+        digest.update(b"\x00")
+    return digest.hexdigest()[:16]
+
+
+def _group(rows, key):
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(key(row), []).append(row)
+    return MappingProxyType({k: tuple(v) for k, v in grouped.items()})
+
+
+class GameCatalog:
+    """
+    Process-wide, immutable snapshot of the static game tables with O(1) indexes.
+
+    :ivar version: Content hash of all rows, equal in every worker that loaded the same data.
+    :ivar items: UniqueName -> ItemDef
+    :ivar tools: (UniqueName, Tier) -> ToolDef
+    :ivar tool_tiers: Tool UniqueName -> sorted tiers
+    :ivar drop_tables: (ToolUniqueName, ToolTier) -> DropDefs in table order
+    :ivar recipes_by_output: OutputItemUniqueName -> CraftingRecipeDefs (one per input item)
+    :ivar recipes_by_tool: (ToolUniqueName, ToolTier) -> CraftingRecipeDefs
+    :ivar recipes_by_input: InputItemUniqueName -> CraftingRecipeDefs
+    :ivar tool_recipes: (OutputToolUniqueName, OutputToolTier) -> ToolCraftingRecipeDefs
+    :ivar tool_recipe_tiers: OutputToolUniqueName -> sorted tiers that have a recipe
+    :ivar tool_upgrade_graph: OutputToolUniqueName -> ToolUpgradeSteps by ascending tier
+    :ivar level_thresholds: Category -> (StartingXp ascending, Level ascending)
+    """
+
+    def __init__(self, items, tools, drops, crafting_recipes, tool_crafting_recipes, category_levels):
+        self.version = catalog_version(items, tools, drops, crafting_recipes, tool_crafting_recipes, category_levels)
+        self.items = MappingProxyType({item.UniqueName: item for item in items})
+        self.tools = MappingProxyType({(tool.UniqueName, tool.Tier): tool for tool in tools})
+        self.tool_tiers = MappingProxyType({
+            name: tuple(sorted(tool.Tier for tool in group))
+            for name, group in _group(tools, lambda t: t.UniqueName).items()
+        })
+        self.drop_tables = _group(drops, lambda d: (d.ToolUniqueName, d.ToolTier))
+
+        self.recipes_by_output = _group(crafting_recipes, lambda r: r.OutputItemUniqueName)
+        self.recipes_by_tool = _group(crafting_recipes, lambda r: (r.ToolUniqueName, r.ToolTier))
+        self.recipes_by_input = _group(crafting_recipes, lambda r: r.InputItemUniqueName)
+        self._recipes_by_tool_name_output = _group(
+            crafting_recipes, lambda r: (r.ToolUniqueName, r.OutputItemUniqueName)
+        )
+
+        self.tool_recipes = _group(tool_crafting_recipes, lambda r: (r.OutputToolUniqueName, r.OutputToolTier))
+        self.tool_recipe_tiers = MappingProxyType({
+            name: tuple(sorted({r.OutputToolTier for r in group}))
+            for name, group in _group(tool_crafting_recipes, lambda r: r.OutputToolUniqueName).items()
+        })
+
+        self.tool_upgrade_graph = self._build_tool_upgrade_graph()
+
+        self.level_thresholds = MappingProxyType({
+            category: (
+                tuple(level.StartingXp for level in group),
+                tuple(level.Level for level in group),
+            )
+            for category, group in _group(
+                sorted(category_levels, key=lambda l: (l.Category, l.Level)), lambda l: l.Category
+            ).items()
+        })
+
+        self._derived = {}
+
+    def _build_tool_upgrade_graph(self):
+        graph = {}
+        for tool_name, tiers in self.tool_recipe_tiers.items():
+            steps = []
+            for tier in tiers:
+                tool = self.tools.get((tool_name, tier))
+                if tool is None:
+                    continue
+                recipes = self.tool_recipes[(tool_name, tier)]
+                steps.append(ToolUpgradeStep(
+                    Tier=tier,
+                    Name=tool.Name,
+                    Category=recipes[0].Category,
+                    MinimumCategoryLevel=recipes[0].MinimumCategoryLevel or 0,
+                    isMultipleCraftable=bool(tool.isMultipleCraftable),
+                    # Tools that are not multiple craftable are owned once per tier
+                    maxCraftingNumber=(tool.maxCraftingNumber or 1) if tool.isMultipleCraftable else 1,
+                    Inputs=tuple(
+                        (recipe.InputItemUniqueName, self.items[recipe.InputItemUniqueName].Name, recipe.InputQuantity)
+                        for recipe in recipes if recipe.InputItemUniqueName in self.items
+                    ),
+                ))
+            if steps:
+                graph[tool_name] = tuple(steps)
+        return MappingProxyType(graph)
+
+    def crafting_recipes_for(self, tool_unique_name: str, output_item_unique_name: str):
+        """
+        Recipe rows for an output item on a tool, any tier, as the crafting loop looks them up.
+        """
+        return self._recipes_by_tool_name_output.get((tool_unique_name, output_item_unique_name), ())
+
+    def level_for_xp(self, category: str, current_xp: int, current_level: int) -> int:
+        """
+        Returns the level reached with current_xp, never lower than current_level.
+        """
+        thresholds = self.level_thresholds.get(category)
+        if not thresholds:
+            return current_level
+        starting_xps, levels = thresholds
+        idx = bisect_right(starting_xps, current_xp)
+        if idx == 0:
+            return current_level
+        return max(levels[idx - 1], current_level)
+
+    def level_starting_xp(self, category: str, level: int):
+        """
+        Returns (StartingXp of level, StartingXp of the next level or None at max level),
+        or (None, None) if the level is not defined for the category.
+        """
+        starting_xps, levels = self.level_thresholds.get(category, ((), ()))
+        idx = bisect_right(levels, level) - 1
+        if idx < 0 or levels[idx] != level:
+            return None, None
+        next_xp = starting_xps[idx + 1] if idx + 1 < len(levels) else None
+        return starting_xps[idx], next_xp
+
+    def derived(self, key, builder):
+        """
+        Memoizes a value computed from this snapshot, e.g. index arrays for the tick engine
+        or a catalog-only API response. A reload swaps in a new snapshot with an empty memo,
+        so every derived value is rebuilt exactly once per catalog version.
+        """
+        value = self._derived.get(key)
+        if value is None:
+            value = self._derived[key] = builder()
+        return value
+
+
+async def fetch_game_catalog(conn) -> GameCatalog:
+    """
+    Reads every static table and builds a new catalog snapshot.
+    """
+    items = [ItemDef(**row._mapping) for row in await conn.execute(select(
+        Item.UniqueName, Item.Name, Item.Category, Item.GoldValue, Item.Probability,
+        Item.isLegendary, Item.isCraftable, Item.ItemDescription, Item.XPYield
+    ))]
+    tools = [ToolDef(**row._mapping) for row in await conn.execute(select(
+        Tool.UniqueName, Tool.Name, Tool.Category, Tool.isRepeating, Tool.ProbabilityBoost,
+        Tool.ToolDescription, Tool.StorageCapacity, Tool.Tier, Tool.isMultipleCraftable, Tool.maxCraftingNumber
+    ))]
+    drops = [DropDef(**row._mapping) for row in await conn.execute(select(
+        ToolGeneratableItem.ToolUniqueName, ToolGeneratableItem.ToolTier, ToolGeneratableItem.ItemUniqueName,
+        ToolGeneratableItem.ResourceUniqueName, ToolGeneratableItem.ResourceQuantity,
+        ToolGeneratableItem.OutputItemQuantity
+    ).order_by(ToolGeneratableItem.Id))]
+    crafting_recipes = [CraftingRecipeDef(**row._mapping) for row in await conn.execute(select(
+        CraftingRecipe.InputItemUniqueName, CraftingRecipe.InputQuantity, CraftingRecipe.ToolUniqueName,
+        CraftingRecipe.ToolTier, CraftingRecipe.OutputItemUniqueName, CraftingRecipe.OutputQuantity,
+        CraftingRecipe.GenerationDuration
+    ).order_by(CraftingRecipe.Id))]
+    tool_crafting_recipes = [ToolCraftingRecipeDef(**row._mapping) for row in await conn.execute(select(
+        ToolCraftingRecipe.InputItemUniqueName, ToolCraftingRecipe.InputQuantity,
+        ToolCraftingRecipe.OutputToolUniqueName, ToolCraftingRecipe.OutputToolTier,
+        ToolCraftingRecipe.GenerationDuration, ToolCraftingRecipe.Category, ToolCraftingRecipe.MinimumCategoryLevel
+    ).order_by(ToolCraftingRecipe.Id))]
+    category_levels = (await conn.execute(select(
+        CategoryLevels.Category, CategoryLevels.Level, CategoryLevels.StartingXp
+    ))).all()
+    return GameCatalog(items, tools, drops, crafting_recipes, tool_crafting_recipes, category_levels)
+
+
+_catalog: Optional[GameCatalog] = None
+_catalog_lock = asyncio.Lock()
+
+
+async def load_game_catalog() -> GameCatalog:
+    """
+    Loads the catalog from the database and makes it the process-wide snapshot.
+
+    Readers hold on to the snapshot they got from get_game_catalog, so the swap
+    is a single reference assignment and never mixes rows of two versions.
+    """
+    global _catalog
+    async with async_engine.connect() as conn:
+        catalog = await fetch_game_catalog(conn)
+    if _catalog is None or _catalog.version != catalog.version:
+        _catalog = catalog
+        print(f"Game catalog version {catalog.version} loaded.")
+    return _catalog
+
+
+async def reload_game_catalog() -> GameCatalog:
+    """
+    Rebuilds the catalog from the database, swaps it in and broadcasts the new
+    version so every other worker reloads as well.
+    """
+    previous_version = _catalog.version if _catalog is not None else None
+    async with _catalog_lock:
+        catalog = await load_game_catalog()
+    if catalog.version != previous_version:
+        await make_catalog_channel().publish(catalog.version)
+    return catalog
+
+
+async def run_catalog_listener(retry_interval: float = 5):
+    """
+    Reloads the catalog whenever another worker broadcasts a version this process
+    does not have. Runs until cancelled.
+    """
+    channel = make_catalog_channel()
+    pending = asyncio.Queue()
+
+    def on_version(version):
+        pending.put_nowait(version)
+
+    async def apply_versions():
+        while True:
+            version = await pending.get()
+            if _catalog is not None and _catalog.version == version:
+                continue
+            try:
+                async with _catalog_lock:
+                    await load_game_catalog()
+            except Exception as e:
+                print(f"Error reloading game catalog version {version}: {e}")
+
+    reloader = asyncio.create_task(apply_versions())
+    try:
+        while True:
+            try:
+                await channel.listen(on_version)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Game catalog listener disconnected: {e}")
+            await asyncio.sleep(retry_interval)
+            # Reload on reconnect in case a broadcast was missed while disconnected
+            pending.put_nowait(None)
+    finally:
+        reloader.cancel()
+
+
+async def get_game_catalog() -> GameCatalog:
+    """
+    Returns the process-wide catalog, loading it on first use.
+    """
+    if _catalog is None:
+        async with _catalog_lock:
+            if _catalog is None:
+                await load_game_catalog()
+    return _catalog
@@ -0,0 +1,166 @@
+# GameServer/inventory_ledger.py
+
+import os
+from datetime import datetime
+from sqlalchemy import select, insert, text, func, literal, union_all
+from Database.database import async_engine
+from Database.models import InventoryLedger, UserItem
+
+# "direct": the game loops upsert user_items.
+# "ledger": the game loops append to inventory_ledger and the compactor folds it into user_items.
+INVENTORY_WRITE_MODE = os.getenv("INVENTORY_WRITE_MODE", "direct")
+LEDGER_COMPACT_INTERVAL = float(os.getenv("LEDGER_COMPACT_INTERVAL", "5"))
+LEDGER_COMPACT_BATCH = int(os.getenv("LEDGER_COMPACT_BATCH", "50000"))
+
+
+def ledger_enabled() -> bool:
+    return INVENTORY_WRITE_MODE == "ledger"
+
+
+async def append_ledger_rows(conn, item_deltas: dict, usernames: dict, source: str, tick_id: int = None):
+    """
+    Appends inventory deltas to the ledger with one bulk INSERT, no row of
+    user_items is touched.
+
+    :param item_deltas: {(UserId, UniqueName): delta}
+    :param usernames: {UserId: Username}
+    :param source: Producer of the deltas, e.g. "repeating_tools" or "crafting".
+    :param tick_id: Id of the tick that produced the deltas, if any.
+    """
+    now = datetime.now()
+    rows = [
+        {
+            "UserId": user_id,
+            "Username": usernames[user_id],
+            "UniqueName": unique_name,
+            "Delta": delta,
+            "Source": source,
+            "TickId": tick_id,
+            "CreatedAt": now,
+        }
+        for (user_id, unique_name), delta in item_deltas.items()
+        if delta != 0
+    ]
+    if rows:
+        await conn.execute(insert(InventoryLedger.__table__), rows)
+
+
+# Moves ledger rows into user_items in one statement. Existing balances are
+# updated with the summed delta (clamped at zero like the direct upsert), the
+# remaining keys are inserted. ON CONFLICT covers rows created concurrently.
+_FOLD_SQL = """
+WITH moved AS (
+    DELETE FROM inventory_ledger
+    WHERE "Id" IN (
+        SELECT "Id" FROM inventory_ledger
+        {where}
+        ORDER BY "Id"
+        {limit}
+        FOR UPDATE {skip_locked}
+    )
+    RETURNING "UserId", "Username", "UniqueName", "Delta"
+), summed AS (
+    SELECT "UserId", max("Username") AS "Username", "UniqueName", sum("Delta") AS "Delta"
+    FROM moved
+    GROUP BY "UserId", "UniqueName"
+), updated AS (
+    UPDATE user_items
+    SET "Quantity" = greatest(user_items."Quantity" + summed."Delta", 0)
+    FROM summed
+    WHERE user_items."UserId" = summed."UserId" AND user_items."UniqueName" = summed."UniqueName"
+    RETURNING user_items."UserId", user_items."UniqueName"
+), inserted AS (
+    INSERT INTO user_items ("UserId", "Username", "UniqueName", "Quantity")
+    SELECT summed."UserId", summed."Username", summed."UniqueName", greatest(summed."Delta", 0)
+    FROM summed
+    WHERE NOT EXISTS (
+        SELECT 1 FROM updated
+        WHERE updated."UserId" = summed."UserId" AND updated."UniqueName" = summed."UniqueName"
+    )
+    ON CONFLICT ON CONSTRAINT unique_user_item
+    DO UPDATE SET "Quantity" = greatest(user_items."Quantity" + EXCLUDED."Quantity", 0)
+    RETURNING 1
+)
+SELECT (SELECT count(*) FROM moved), (SELECT count(*) FROM summed)
+"""
+
+_COMPACT_BATCH_SQL = text(_FOLD_SQL.format(where="", limit="LIMIT :batch_size", skip_locked="SKIP LOCKED"))
+_FOLD_USER_SQL = text(_FOLD_SQL.format(
+    where='WHERE "UserId" = :user_id', limit="", skip_locked=""
+))
+_FOLD_USER_ITEMS_SQL = text(_FOLD_SQL.format(
+    where='WHERE "UserId" = :user_id AND "UniqueName" = ANY(:unique_names)', limit="", skip_locked=""
+))
+
+
+async def fold_user_ledger(conn, user_id, unique_names=None) -> int:
+    """
+    Folds one user's ledger rows into their balances inside the caller's
+    transaction, so a guarded deduction sees every delta produced so far.
+    Waits for a compactor batch that holds some of the rows.
+
+    :param unique_names: Only fold these items, all items if None.
+    :return: Number of ledger rows folded.
+    """
+    if unique_names is None:
+        result = await conn.execute(_FOLD_USER_SQL, {"user_id": user_id})
+    else:
+        result = await conn.execute(_FOLD_USER_ITEMS_SQL, {"user_id": user_id, "unique_names": list(unique_names)})
+    moved, _ = result.one()
+    return moved
+
+
+async def compact_ledger(batch_size: int = LEDGER_COMPACT_BATCH) -> int:
+    """
+    Folds the oldest ledger rows into user_items, one batch per transaction,
+    until the ledger is drained. Rows locked by another compactor or by a
+    per-user fold are skipped and picked up later.
+
+    :return: Number of ledger rows folded.
+    """
+    total = 0
+    try:
+        while True:
+            async with async_engine.begin() as conn:
+                moved, balances = (await conn.execute(_COMPACT_BATCH_SQL, {"batch_size": batch_size})).one()
+            total += moved
+            if moved < batch_size:
+                break
+        if total:
+            print(f"Compacted {total} inventory ledger rows.")
+    except Exception as e:
+        print(f"Error compacting inventory ledger: {e}")
+    return total
+
+
+def user_items_with_tail_query(user_id):
+    """
+    Balances of one user plus their uncompacted ledger tail, as rows of
+    (UniqueName, Quantity). One statement, so a concurrent compaction is seen
+    either entirely or not at all.
+    """
+    balances = select(UserItem.UniqueName, UserItem.Quantity).filter(UserItem.UserId == user_id)
+    tail = select(
+        InventoryLedger.UniqueName, InventoryLedger.Delta.label("Quantity")
+    ).filter(InventoryLedger.UserId == user_id)
+    combined = union_all(balances, tail).subquery()
+    return (
+        select(
+            combined.c.UniqueName,
+            func.greatest(func.sum(combined.c.Quantity), literal(0)).label("Quantity")
+        )
+        .group_by(combined.c.UniqueName)
+    )
+
+
+def user_state_items_query(user_ids_query):
+    """
+    (UserId, UniqueName, Quantity) rows of balances and ledger deltas for the
+    users of user_ids_query, to be summed by the caller.
+    """
+    return union_all(
+        select(UserItem.UserId, UserItem.UniqueName, UserItem.Quantity)
+        .filter(UserItem.UserId.in_(user_ids_query)),
+        select(InventoryLedger.UserId, InventoryLedger.UniqueName, InventoryLedger.Delta)
+        .filter(InventoryLedger.UserId.in_(user_ids_query)),
+    )
@@ -0,0 +1,220 @@
+# GameServer/inventory_service.py
+
+from sqlalchemy import select, update, func, Integer, String, column, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from Database.models import UserItem, User
+from .inventory_ledger import ledger_enabled, append_ledger_rows, fold_user_ledger
+from .state_cache import state_cache, state_cache_enabled, undo_on_rollback
+
+
+class InventoryResult:
+    """
+    Outcome of InventoryService.apply_deltas.
+
+    :ivar applied: UniqueName -> Quantity after the change, for every applied delta.
+    :ivar failed: UniqueName -> Quantity available, for every delta that would have gone negative.
+    """
+
+    def __init__(self, applied=None, failed=None):
+        self.applied = applied or {}
+        self.failed = failed or {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+
+class InventoryService:
+    """
+    Inventory and gold changes as single-statement, relative updates.
+
+    Every statement reads and writes the row in the database, so concurrent
+    ticks and requests add up instead of overwriting each other, and no SELECT
+    is needed before the write. Works with an AsyncSession or AsyncConnection,
+    the caller owns the transaction.
+
+    In ledger mode (INVENTORY_WRITE_MODE=ledger) the game loops append to the
+    inventory ledger instead, and guarded deductions fold the user's ledger
+    rows for those items first, so they see every delta produced so far.
+
+    With the write-behind state cache enabled (STATE_CACHE_ENABLED=true) the
+    changes are applied to the cached state instead and undone if the
+    session's transaction rolls back; the ledger is not used.
+    """
+
+    async def apply_deltas(self, session, user_id, username: str, deltas: dict, all_or_nothing: bool = True) -> InventoryResult:
+        """
+        Adds deltas to one user's inventory.
+
+        Positive deltas are upserted. Negative deltas only apply where the
+        quantity stays non-negative, in one UPDATE ... FROM (VALUES ...) statement.
+
+        :param user_id: Id of the user.
+        :param username: Username, stored on newly created UserItem rows.
+        :param deltas: {UniqueName: delta}, zero deltas are ignored.
+        :param all_or_nothing: If any negative delta fails, apply none of the deltas.
+        :return: InventoryResult with the new quantities and the failed deltas.
+        """
+        negatives = {name: delta for name, delta in deltas.items() if delta < 0}
+        positives = {name: delta for name, delta in deltas.items() if delta > 0}
+        result = InventoryResult()
+        if not negatives and not positives:
+            return result
+
+        if state_cache_enabled():
+            state = await state_cache.get_user(user_id)
+            result.applied, result.failed = state_cache.apply_item_deltas(state, {**negatives, **positives}, all_or_nothing)
+            applied_deltas = {name: deltas[name] for name in result.applied}
+            undo_on_rollback(session, lambda: state_cache.apply_item_deltas(
+                state, {name: -delta for name, delta in applied_deltas.items()}, all_or_nothing=False
+            ))
+            return result
+
+        if negatives and ledger_enabled():
+            await fold_user_ledger(session, user_id, negatives)
+
+        if negatives:
+            # A savepoint is only needed to undo a partially applied batch
+            savepoint = await session.begin_nested() if all_or_nothing and len(negatives) > 1 else None
+            result.applied.update(await self._decrement(session, user_id, negatives))
+            failed_names = [name for name in negatives if name not in result.applied]
+            if failed_names:
+                if savepoint is not None:
+                    await savepoint.rollback()
+                result.failed = await self.fetch_quantities(session, user_id, failed_names)
+                if all_or_nothing:
+                    result.applied = {}
+                    return result
+            elif savepoint is not None:
+                await savepoint.commit()
+
+        if positives:
+            result.applied.update(await self._upsert(session, [
+                {"UserId": user_id, "Username": username, "UniqueName": name, "Quantity": delta}
+                for name, delta in positives.items()
+            ]))
+        return result
+
+    async def _decrement(self, session, user_id, negatives: dict) -> dict:
+        user_items = UserItem.__table__
+        delta_values = values(
+            column("UniqueName", String), column("Delta", Integer), name="deltas"
+        ).data(list(negatives.items()))
+        rows = await session.execute(
+            update(user_items)
+            .where(
+                user_items.c.UserId == user_id,
+                user_items.c.UniqueName == delta_values.c.UniqueName,
+                user_items.c.Quantity + delta_values.c.Delta >= 0
+            )
+            .values(Quantity=user_items.c.Quantity + delta_values.c.Delta)
+            .returning(user_items.c.UniqueName, user_items.c.Quantity)
+        )
+        return {name: quantity for name, quantity in rows}
+
+    async def _upsert(self, session, rows) -> dict:
+        user_items = UserItem.__table__
+        stmt = pg_insert(user_items).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            constraint='unique_user_item',
+            set_={"Quantity": user_items.c.Quantity + stmt.excluded.Quantity}
+        ).returning(user_items.c.UniqueName, user_items.c.Quantity)
+        return {name: quantity for name, quantity in await session.execute(stmt)}
+
+    async def apply_bulk_deltas(self, session, item_deltas: dict, usernames: dict, source: str = "direct", tick_id: int = None):
+        """
+        Adds deltas for many users in one upsert, clamping quantities at zero,
+        or appends them to the inventory ledger in ledger mode, or applies
+        them to the state cache when it is enabled.
+
+        Meant for the game loops, whose negative deltas are resources that were
+        checked against a snapshot of the same tick.
+
+        :param item_deltas: {(UserId, UniqueName): delta}
+        :param usernames: {UserId: Username}
+        :param source: Producer of the deltas, recorded in the ledger.
+        :param tick_id: Id of the producing tick, recorded in the ledger.
+        """
+        if state_cache_enabled():
+            await state_cache.apply_bulk_deltas(item_deltas)
+            return
+        if ledger_enabled():
+            await append_ledger_rows(session, item_deltas, usernames, source, tick_id)
+            return
+        rows = [
+            {"UserId": user_id, "Username": usernames[user_id], "UniqueName": unique_name, "Quantity": delta}
+            for (user_id, unique_name), delta in item_deltas.items()
+            if delta != 0
+        ]
+        if not rows:
+            return
+        user_items = UserItem.__table__
+        stmt = pg_insert(user_items)
+        stmt = stmt.on_conflict_do_update(
+            constraint='unique_user_item',
+            set_={"Quantity": func.greatest(user_items.c.Quantity + stmt.excluded.Quantity, 0)}
+        )
+        await session.execute(stmt, rows)
+
+    async def fetch_quantities(self, session, user_id, unique_names) -> dict:
+        """
+        Current quantities of the given items, 0 for items the user never had.
+        """
+        if state_cache_enabled():
+            state = await state_cache.get_user(user_id)
+            return {name: state.items.get(name, 0) for name in unique_names}
+        rows = await session.execute(
+            select(UserItem.UniqueName, UserItem.Quantity).filter(
+                UserItem.UserId == user_id,
+                UserItem.UniqueName.in_(list(unique_names))
+            )
+        )
+        quantities = {name: 0 for name in unique_names}
+        quantities.update({name: quantity for name, quantity in rows})
+        return quantities
+
+    async def apply_gold(self, session, user_id, delta: float):
+        """
+        Adds delta to the user's gold unless the balance would go negative.
+
+        :return: The new balance, or None if the user does not have enough gold.
+        """
+        if state_cache_enabled():
+            state = await state_cache.get_user(user_id)
+            balance = state_cache.apply_gold(state, delta)
+            if balance is not None:
+                undo_on_rollback(session, lambda: state_cache.apply_gold(state, -delta))
+            return balance
+        users = User.__table__
+        result = await session.execute(
+            update(users)
+            .where(users.c.Id == user_id, users.c.Gold + delta >= 0)
+            .values(Gold=users.c.Gold + delta)
+            .returning(users.c.Gold)
+        )
+        return result.scalar_one_or_none()
+
+    async def transfer_gold(self, session, payer_id, payee_id, amount: float):
+        """
+        Moves amount of gold from payer to payee unless the payer's balance would go negative.
+
+        Both user rows are locked in Id order first, so two users paying each
+        other at the same time cannot deadlock.
+
+        :return: The payer's new balance, or None if the payer does not have enough gold.
+        """
+        if not state_cache_enabled():
+            users = User.__table__
+            await session.execute(
+                select(users.c.Id)
+                .where(users.c.Id.in_([payer_id, payee_id]))
+                .order_by(users.c.Id)
+                .with_for_update()
+            )
+        balance = await self.apply_gold(session, payer_id, -amount)
+        if balance is not None:
+            await self.apply_gold(session, payee_id, amount)
+        return balance
+
+
+inventory_service = InventoryService()
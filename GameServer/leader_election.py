@@ -0,0 +1,194 @@
+# GameServer/leader_election.py
+
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+from sqlalchemy import text
+from Database.database import async_engine
+
+# "postgres": session-level advisory locks, works across hosts sharing the database.
+# "file": flock on a local file, for running several workers on one machine without Postgres locks.
+# "none": every process runs the loops (single-process setups).
+TICK_LEADER_BACKEND = os.getenv("TICK_LEADER_BACKEND", "postgres")
+TICK_LOCK_DIR = os.getenv("TICK_LOCK_DIR", tempfile.gettempdir())
+
+
+class PostgresAdvisoryLock:
+    """
+    Session-level pg_try_advisory_lock held on a dedicated connection.
+
+    Postgres releases the lock when the holding connection dies, so a crashed
+    leader frees it without any timeout on our side.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.key = int.from_bytes(hashlib.sha256(name.encode()).digest()[:8], "big", signed=True)
+        self._conn = None
+
+    async def try_acquire(self) -> bool:
+        try:
+            if self._conn is None:
+                self._conn = await async_engine.connect()
+                await self._conn.execution_options(isolation_level="AUTOCOMMIT")
+            result = await self._conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key})
+            acquired = bool(result.scalar())
+            if not acquired:
+                await self._close()
+            return acquired
+        except Exception as e:
+            print(f"Error acquiring advisory lock '{self.name}': {e}")
+            await self._close()
+            return False
+
+    async def is_held(self) -> bool:
+        if self._conn is None:
+            return False
+        try:
+            await self._conn.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            await self._close()
+            return False
+
+    async def release(self):
+        if self._conn is None:
+            return
+        try:
+            await self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+        except Exception:
+            pass
+        await self._close()
+
+    async def _close(self):
+        if self._conn is not None:
+            try:
+                await self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+
+class FileLock:
+    """
+    Exclusive flock on a local lock file, released by the OS when the holder dies.
+    """
+
+    def __init__(self, name: str, lock_dir: str = TICK_LOCK_DIR):
+        self.name = name
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+        self.path = os.path.join(lock_dir, f"idlecrafter-{safe_name}.lock")
+        self._fd = None
+
+    async def try_acquire(self) -> bool:
+        import fcntl
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    async def is_held(self) -> bool:
+        return self._fd is not None
+
+    async def release(self):
+        if self._fd is None:
+            return
+        import fcntl
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+
+class AlwaysLeader:
+    """
+    Lock stand-in for TICK_LEADER_BACKEND=none.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    async def try_acquire(self) -> bool:
+        return True
+
+    async def is_held(self) -> bool:
+        return True
+
+    async def release(self):
+        pass
+
+
+def make_tick_lock(loop_name: str, shard=None):
+    """
+    Creates the lock guarding one tick loop, optionally for one shard of users.
+
+    The unsharded lock of a loop is taken by the API's loop and by the tick
+    service coordinator for all of its shards, so only one of them runs the loop.
+    """
+    name = f"idlecrafter:{loop_name}" if shard is None else f"idlecrafter:{loop_name}:{shard}"
+    if TICK_LEADER_BACKEND == "postgres":
+        return PostgresAdvisoryLock(name)
+    if TICK_LEADER_BACKEND == "file":
+        return FileLock(name)
+    return AlwaysLeader(name)
+
+
+class LeaderElector:
+    """
+    Runs a tick function only while this process holds the loop's lock.
+
+    Followers retry the lock once per interval, so when the leader dies another
+    process takes over within one tick interval.
+    """
+
+    def __init__(self, lock, on_elected=None):
+        self.lock = lock
+        self.is_leader = False
+        self._on_elected = on_elected
+
+    async def try_lead(self) -> bool:
+        """
+        Checks that leadership is still held, or tries to acquire it.
+        """
+        if self.is_leader:
+            if await self.lock.is_held():
+                return True
+            self.is_leader = False
+            print(f"Lost leadership of '{self.lock.name}'.")
+        if await self.lock.try_acquire():
+            self.is_leader = True
+            print(f"Acquired leadership of '{self.lock.name}' (pid {os.getpid()}).")
+            if self._on_elected:
+                self._on_elected()
+        return self.is_leader
+
+    async def resign(self):
+        if self.is_leader:
+            self.is_leader = False
+        await self.lock.release()
+
+    async def run(self, tick_fn, interval: float, name: str = None, overrun: str = None):
+        """
+        Calls tick_fn on a fixed-rate grid of interval seconds while leader.
+
+        :param name: Name of the loop's metrics, the lock name if None.
+        :param overrun: Overrun policy of the TickScheduler, TICK_OVERRUN_POLICY if None.
+        """
+        # Imported here, tick_scheduler is only needed by processes that run loops
+        from .tick_scheduler import TickScheduler, TICK_OVERRUN_POLICY
+        scheduler = TickScheduler(name or self.lock.name, interval, overrun=overrun or TICK_OVERRUN_POLICY)
+
+        async def lead_and_tick():
+            if await self.try_lead():
+                return await tick_fn()
+            return None
+
+        try:
+            await scheduler.run(lead_and_tick)
+        finally:
+            await self.resign()
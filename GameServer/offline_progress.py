@@ -0,0 +1,167 @@
+# GameServer/offline_progress.py
+
+import math
+import os
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import select, update, and_, bindparam
+from Database.models import UserTool, Tool
+from .game_catalog import get_game_catalog
+from .repeating_tools_engine import (
+    TickDeltas, XP_MULTIPLIER, load_user_state,
+    apply_tick_deltas, total_level_after_level_up
+)
+
+# "tick": repeating tools are advanced by the background loop every TICK_SECONDS.
+# "lazy": production is settled on demand from the elapsed time since LastSettled.
+REPEATING_TOOLS_MODE = os.getenv("REPEATING_TOOLS_MODE", "tick")
+TICK_SECONDS = float(os.getenv("REPEATING_TOOLS_TICK_SECONDS", "5"))
+
+_rng = np.random.default_rng()
+
+
+def lazy_accrual_enabled() -> bool:
+    return REPEATING_TOOLS_MODE == "lazy"
+
+
+def settle_tool_ticks(user_id, username, tool, drop_table, ticks, user_items, user_xp, catalog, deltas, rng=_rng):
+    """
+    Applies `ticks` ticks of one tool in closed form.
+
+    The drop table rows are settled one after another: resource-consuming rows
+    run for as many ticks as the resource allows, the number of drops is a
+    binomial sample over those ticks, and the storage capacity caps both the
+    added quantity and the drops that yield XP.
+    """
+    storage_capacity = tool.StorageCapacity
+    probability_boost = tool.ProbabilityBoost or 1.0
+
+    for gen in drop_table:
+        item = catalog.items.get(gen.ItemUniqueName)
+        if item is None:
+            continue
+        output_item_quantity = gen.OutputItemQuantity or 1
+
+        # Resource cap: every tick consumes the resource whether or not it drops
+        runnable_ticks = ticks
+        resource_unique_name = gen.ResourceUniqueName
+        resource_quantity = gen.ResourceQuantity or 0
+        if resource_unique_name and resource_quantity > 0:
+            runnable_ticks = min(ticks, user_items.get(resource_unique_name, 0) // resource_quantity)
+            if runnable_ticks <= 0:
+                continue
+            consumed = runnable_ticks * resource_quantity
+            user_items[resource_unique_name] -= consumed
+            deltas.add_item(user_id, resource_unique_name, -consumed)
+
+        probability = min((item.Probability or 1.0) * probability_boost, 1.0)
+        drops = int(rng.binomial(runnable_ticks, probability))
+        if drops == 0:
+            continue
+
+        # Storage cap: drops stop counting once the item is full
+        current_quantity = user_items.get(item.UniqueName, 0)
+        if storage_capacity is not None:
+            room = max(storage_capacity - current_quantity, 0)
+            effective_drops = min(drops, math.ceil(room / output_item_quantity))
+            quantity_to_add = min(drops * output_item_quantity, room)
+        else:
+            effective_drops = drops
+            quantity_to_add = drops * output_item_quantity
+        if effective_drops == 0:
+            continue
+
+        user_items[item.UniqueName] = current_quantity + quantity_to_add
+        deltas.add_item(user_id, item.UniqueName, quantity_to_add)
+
+        # --- XP Yielding Functionality ---
+        xp_to_add = effective_drops * (item.XPYield or 0) * XP_MULTIPLIER
+        category = item.Category
+        xp_entry = user_xp.setdefault(category, [0, 1])
+        xp_entry[0] += xp_to_add
+        key = (user_id, category)
+        deltas.xp_deltas[key] = deltas.xp_deltas.get(key, 0) + xp_to_add
+
+        new_level = catalog.level_for_xp(category, xp_entry[0], xp_entry[1])
+        if new_level > xp_entry[1]:
+            xp_entry[1] = new_level
+            print(f"User '{username}' leveled up in category '{category}' to level {new_level}.")
+            deltas.total_levels[user_id] = total_level_after_level_up(
+                level for _, level in user_xp.values()
+            )
+        deltas.levels[key] = xp_entry[1]
+
+
+async def settle_user_tools(session, user_id, now: datetime = None) -> int:
+    """
+    Settles the production accrued by a user's repeating tools since LastSettled.
+
+    Does nothing unless REPEATING_TOOLS_MODE is "lazy". The changes are written
+    through the given session's connection and committed by the caller, so
+    callers that already loaded inventory objects must refresh them.
+
+    :param session: The AsyncSession of the calling request.
+    :param user_id: Id of the user whose tools are settled.
+    :param now: Settlement time, defaults to datetime.now().
+    :return: Number of tool ticks settled.
+    """
+    if not lazy_accrual_enabled():
+        return 0
+
+    now = now or datetime.now()
+    conn = await session.connection()
+
+    # Lock the user's tools so concurrent requests cannot settle the same interval twice
+    tool_rows = (await conn.execute(
+        select(UserTool.Id, UserTool.Username, UserTool.ToolUniqueName, UserTool.Tier, UserTool.LastSettled)
+        .join(Tool, and_(Tool.UniqueName == UserTool.ToolUniqueName, Tool.Tier == UserTool.Tier))
+        .filter(
+            UserTool.UserId == user_id,
+            Tool.isRepeating == True,
+            UserTool.isEnabled == True
+        )
+        .order_by(UserTool.Id)
+        .with_for_update(of=UserTool)
+    )).all()
+    if not tool_rows:
+        return 0
+
+    catalog = await get_game_catalog()
+    inventories, category_xp = await load_user_state(conn, [user_id])
+    user_items = inventories.get(user_id, {})
+    user_xp = category_xp.get(user_id, {})
+
+    deltas = TickDeltas(source="offline_progress")
+    settled_at = []
+    for user_tool in tool_rows:
+        deltas.usernames[user_id] = user_tool.Username
+        if user_tool.LastSettled is None:
+            # Tool was never settled, start accruing from now
+            settled_at.append({"b_id": user_tool.Id, "b_settled": now})
+            continue
+
+        ticks = int((now - user_tool.LastSettled).total_seconds() // TICK_SECONDS)
+        if ticks <= 0:
+            continue
+        tool = catalog.tools.get((user_tool.ToolUniqueName, user_tool.Tier))
+        if tool is not None:
+            settle_tool_ticks(
+                user_id, user_tool.Username, tool,
+                catalog.drop_tables.get((user_tool.ToolUniqueName, user_tool.Tier), ()),
+                ticks, user_items, user_xp, catalog, deltas
+            )
+            deltas.tool_ticks += ticks
+        # Keep the partial tick for the next settlement
+        settled_at.append({
+            "b_id": user_tool.Id,
+            "b_settled": user_tool.LastSettled + timedelta(seconds=ticks * TICK_SECONDS)
+        })
+
+    await apply_tick_deltas(conn, deltas)
+    if settled_at:
+        user_tools = UserTool.__table__
+        await conn.execute(
+            update(user_tools).where(user_tools.c.Id == bindparam("b_id")).values(LastSettled=bindparam("b_settled")),
+            settled_at
+        )
+    return deltas.tool_ticks
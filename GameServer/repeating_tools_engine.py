@@ -0,0 +1,329 @@
+# GameServer/repeating_tools_engine.py
+
+from datetime import datetime
+import os
+import random
+import time
+from sqlalchemy import select, update, and_, bindparam, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from Database.database import async_engine
+from Database.models import UserTool, Tool, UserItem, User, UserCategoryXP
+from .game_catalog import GameCatalog, get_game_catalog
+from .inventory_service import inventory_service
+from .inventory_ledger import ledger_enabled, user_state_items_query
+from .state_cache import state_cache, state_cache_enabled
+from .sharding import Shard, user_shard_clause
+
+XP_MULTIPLIER = 1  # For future development, can be modified or made dynamic
+# Users loaded, simulated and committed together by one tick chunk
+TICK_CHUNK_SIZE = int(os.getenv("TICK_CHUNK_SIZE", "1000"))
+
+
+class TickDeltas:
+    """
+    Inventory and XP changes produced by one tick of the repeating tools.
+
+    Item and XP values are deltas so they can be added on top of whatever is
+    in the database when the tick is written, instead of overwriting updates
+    made by API requests while the tick was being computed.
+
+    :param source: Producer of the deltas, recorded in the inventory ledger.
+    :param tick_id: Id of the tick, recorded in the inventory ledger.
+    """
+
+    def __init__(self, source: str = "repeating_tools", tick_id: int = None):
+        self.source = source
+        self.tick_id = tick_id
+        self.usernames = {}      # UserId -> Username
+        self.item_deltas = {}    # (UserId, ItemUniqueName) -> quantity delta
+        self.xp_deltas = {}      # (UserId, Category) -> XP delta
+        self.levels = {}         # (UserId, Category) -> CategoryLevel after the tick
+        self.total_levels = {}   # UserId -> TotalLevel, only for users who levelled up
+        self.tool_ticks = 0
+
+    def add_item(self, user_id, item_unique_name, quantity):
+        key = (user_id, item_unique_name)
+        self.item_deltas[key] = self.item_deltas.get(key, 0) + quantity
+
+
+def total_level_after_level_up(category_levels):
+    """
+    TotalLevel after a category level-up from a repeating tool: the sum of the
+    category levels (already including the new level) plus one, plus one on top.
+    """
+    return sum(category_levels) + 2
+
+
+def active_repeating_tools_query(shard: Shard = None):
+    """
+    Enabled user tools whose tool definition is repeating, ordered by owner.
+
+    :param shard: Only return the tools of users in this shard, all users if None.
+    """
+    query = select(
+        UserTool.Id, UserTool.UserId, UserTool.Username, UserTool.ToolUniqueName, UserTool.Tier
+    ).join(
+        Tool, and_(Tool.UniqueName == UserTool.ToolUniqueName, Tool.Tier == UserTool.Tier)
+    ).filter(
+        Tool.isRepeating == True,
+        UserTool.isEnabled == True
+    ).order_by(UserTool.UserId, UserTool.Id)
+    if shard is not None:
+        query = query.filter(user_shard_clause(UserTool.UserId, shard))
+    return query
+
+
+async def load_user_state(conn, user_ids_query):
+    """
+    Loads inventory quantities and category XP for the users selected by user_ids_query.
+
+    In ledger mode the quantities include the uncompacted ledger tail. With the
+    state cache enabled they are copies of the cached state, loading the users
+    that are not cached yet.
+
+    :param user_ids_query: SELECT of user ids, or a list of user ids.
+    :return: ({UserId: {UniqueName: Quantity}}, {UserId: {Category: [CurrentXP, CategoryLevel]}})
+    """
+    if state_cache_enabled():
+        user_ids = user_ids_query if isinstance(user_ids_query, list) else (await conn.execute(user_ids_query)).scalars().all()
+        states = await state_cache.get_users(user_ids)
+        inventories = {user_id: dict(state.items) for user_id, state in states.items()}
+        category_xp = {
+            user_id: {category: list(entry) for category, entry in state.xp.items()}
+            for user_id, state in states.items()
+        }
+        return inventories, category_xp
+
+    inventories = {}
+    if ledger_enabled():
+        item_rows = await conn.execute(user_state_items_query(user_ids_query))
+        for user_id, unique_name, quantity in item_rows:
+            user_items = inventories.setdefault(user_id, {})
+            user_items[unique_name] = user_items.get(unique_name, 0) + (quantity or 0)
+    else:
+        item_rows = await conn.execute(
+            select(UserItem.UserId, UserItem.UniqueName, UserItem.Quantity)
+            .filter(UserItem.UserId.in_(user_ids_query))
+        )
+        for user_id, unique_name, quantity in item_rows:
+            inventories.setdefault(user_id, {})[unique_name] = quantity or 0
+
+    category_xp = {}
+    xp_rows = await conn.execute(
+        select(UserCategoryXP.UserId, UserCategoryXP.Category, UserCategoryXP.CurrentXP, UserCategoryXP.CategoryLevel)
+        .filter(UserCategoryXP.UserId.in_(user_ids_query))
+    )
+    for user_id, category, current_xp, category_level in xp_rows:
+        category_xp.setdefault(user_id, {})[category] = [current_xp, category_level]
+
+    return inventories, category_xp
+
+
+def compute_tick_deltas(tool_rows, inventories, category_xp, catalog: GameCatalog, rng=random) -> TickDeltas:
+    """
+    Runs one tick for every tool in tool_rows against in-memory state, one
+    tool and drop table row at a time. Reference for the vectorized ToolSimulation.
+
+    Resources are consumed before the probability roll, a drop is skipped once
+    the item reached the tool's storage capacity, XP is yielded per successful
+    drop and levels are recomputed from the catalog's thresholds. inventories
+    and category_xp are updated in place so tools of the same user see each
+    other's changes within the tick.
+    """
+    deltas = TickDeltas()
+
+    for user_tool in tool_rows:
+        tool = catalog.tools.get((user_tool.ToolUniqueName, user_tool.Tier))
+        if tool is None:
+            continue
+        user_id = user_tool.UserId
+        deltas.usernames[user_id] = user_tool.Username
+        deltas.tool_ticks += 1
+
+        user_items = inventories.setdefault(user_id, {})
+        user_xp = category_xp.setdefault(user_id, {})
+        storage_capacity = tool.StorageCapacity
+        probability_boost = tool.ProbabilityBoost or 1.0
+
+        for gen in catalog.drop_tables.get((user_tool.ToolUniqueName, user_tool.Tier), ()):
+            item = catalog.items.get(gen.ItemUniqueName)
+            if item is None:
+                continue
+            output_item_quantity = gen.OutputItemQuantity or 1
+
+            # Resource requirement (if any)
+            resource_unique_name = gen.ResourceUniqueName
+            resource_quantity = gen.ResourceQuantity or 0
+            if resource_unique_name and resource_quantity > 0:
+                if user_items.get(resource_unique_name, 0) < resource_quantity:
+                    continue  # User lacks the resource, skip to next item
+                user_items[resource_unique_name] -= resource_quantity
+                deltas.add_item(user_id, resource_unique_name, -resource_quantity)
+
+            # Probability check
+            probability = (item.Probability or 1.0) * probability_boost
+            if rng.random() > probability:
+                continue
+
+            # Check storage capacity
+            current_quantity = user_items.get(item.UniqueName, 0)
+            if storage_capacity is not None and current_quantity >= storage_capacity:
+                continue
+            if storage_capacity is not None:
+                quantity_to_add = min(output_item_quantity, storage_capacity - current_quantity)
+            else:
+                quantity_to_add = output_item_quantity
+
+            user_items[item.UniqueName] = current_quantity + quantity_to_add
+            deltas.add_item(user_id, item.UniqueName, quantity_to_add)
+
+            # --- XP Yielding Functionality ---
+            xp_to_add = (item.XPYield or 0) * XP_MULTIPLIER
+            category = item.Category
+            xp_entry = user_xp.setdefault(category, [0, 1])
+            xp_entry[0] += xp_to_add
+            key = (user_id, category)
+            deltas.xp_deltas[key] = deltas.xp_deltas.get(key, 0) + xp_to_add
+
+            new_level = catalog.level_for_xp(category, xp_entry[0], xp_entry[1])
+            if new_level > xp_entry[1]:
+                xp_entry[1] = new_level
+                print(f"User '{user_tool.Username}' leveled up in category '{category}' to level {new_level}.")
+                deltas.total_levels[user_id] = total_level_after_level_up(
+                    level for _, level in user_xp.values()
+                )
+            deltas.levels[key] = xp_entry[1]
+
+    return deltas
+
+
+async def apply_tick_deltas(conn, deltas: TickDeltas):
+    """
+    Writes the deltas of a tick with one bulk statement per table, or applies
+    them to the state cache when it is enabled.
+    """
+    if state_cache_enabled():
+        await state_cache.apply_bulk_deltas(deltas.item_deltas, deltas.xp_deltas, deltas.levels, deltas.total_levels)
+        return
+
+    now = datetime.now()
+    user_category_xp = UserCategoryXP.__table__
+
+    await inventory_service.apply_bulk_deltas(
+        conn, deltas.item_deltas, deltas.usernames, source=deltas.source, tick_id=deltas.tick_id
+    )
+
+    xp_rows = [
+        {
+            "UserId": user_id,
+            "Username": deltas.usernames[user_id],
+            "Category": category,
+            "CurrentXP": xp_delta,
+            "CategoryLevel": deltas.levels[(user_id, category)],
+            "LastUpdated": now,
+        }
+        for (user_id, category), xp_delta in deltas.xp_deltas.items()
+    ]
+    if xp_rows:
+        stmt = pg_insert(user_category_xp)
+        stmt = stmt.on_conflict_do_update(
+            constraint='unique_user_category_xp',
+            set_={
+                "CurrentXP": user_category_xp.c.CurrentXP + stmt.excluded.CurrentXP,
+                "CategoryLevel": func.greatest(user_category_xp.c.CategoryLevel, stmt.excluded.CategoryLevel),
+                "LastUpdated": stmt.excluded.LastUpdated,
+            }
+        )
+        await conn.execute(stmt, xp_rows)
+
+    if deltas.total_levels:
+        users = User.__table__
+        await conn.execute(
+            update(users).where(users.c.Id == bindparam("b_user_id")).values(TotalLevel=bindparam("b_total_level")),
+            [{"b_user_id": user_id, "b_total_level": total} for user_id, total in deltas.total_levels.items()]
+        )
+
+
+def active_user_ids_page(shard: Shard = None, after_user_id=None, limit: int = None):
+    """
+    Next page of owners of enabled repeating tools, keyset-paginated by users.Id.
+
+    :param after_user_id: Last user id of the previous page, None for the first page.
+    :param limit: Maximum number of user ids on the page.
+    """
+    query = active_repeating_tools_query(shard).with_only_columns(UserTool.UserId).order_by(None).distinct()
+    if after_user_id is not None:
+        query = query.filter(UserTool.UserId > after_user_id)
+    return query.order_by(UserTool.UserId).limit(limit)
+
+
+async def tick_users(conn, user_ids, catalog: GameCatalog, tick_id: int = None, shard: Shard = None) -> int:
+    """
+    Runs one tick of the repeating tools of the given users and writes the
+    deltas through conn, the caller owns the transaction.
+
+    :return: Number of tool ticks processed.
+    """
+    tool_rows = (await conn.execute(
+        active_repeating_tools_query(shard).filter(UserTool.UserId.in_(user_ids))
+    )).all()
+    if not tool_rows:
+        return 0
+    inventories, category_xp = await load_user_state(conn, list(user_ids))
+
+    # Imported here, tool_simulation builds on the types defined in this module
+    from .tool_simulation import DropTableArrays, ToolSimulation
+    drops = catalog.derived("drop_table_arrays", lambda: DropTableArrays(catalog))
+    simulation = ToolSimulation(drops, tool_rows, inventories, category_xp)
+    deltas = simulation.tick()
+    deltas.tick_id = tick_id
+    await apply_tick_deltas(conn, deltas)
+    return deltas.tool_ticks
+
+
+async def process_repeating_tools_async(shard: Shard = None, chunk_size: int = None) -> int:
+    """
+    Runs one tick of every enabled repeating tool on the async engine.
+
+    Users are walked in keyset-paginated chunks of chunk_size, each chunk is
+    loaded, simulated by the vectorized ToolSimulation and written with bulk
+    INSERT ... ON CONFLICT DO UPDATE in its own transaction, so memory stays
+    bounded by the chunk. If a chunk fails its users are retried one by one
+    and only the failing users miss the tick.
+
+    :param shard: Only tick the tools of users in this shard, all users if None.
+    :param chunk_size: Users per chunk, TICK_CHUNK_SIZE if None.
+    :return: Number of tool ticks processed.
+    """
+    chunk_size = chunk_size or TICK_CHUNK_SIZE
+    tool_ticks = 0
+    after_user_id = None
+    try:
+        tick_id = int(time.time() * 1000)
+        catalog = await get_game_catalog()
+        while True:
+            async with async_engine.connect() as conn:
+                user_ids = (await conn.execute(
+                    active_user_ids_page(shard, after_user_id, chunk_size)
+                )).scalars().all()
+            if not user_ids:
+                break
+            after_user_id = user_ids[-1]
+
+            try:
+                async with async_engine.begin() as conn:
+                    tool_ticks += await tick_users(conn, user_ids, catalog, tick_id, shard)
+            except Exception as e:
+                print(f"Error processing repeating tools chunk of {len(user_ids)} users, retrying them one by one: {e}")
+                for user_id in user_ids:
+                    try:
+                        async with async_engine.begin() as conn:
+                            tool_ticks += await tick_users(conn, [user_id], catalog, tick_id, shard)
+                    except Exception as user_error:
+                        print(f"Error processing repeating tools of user {user_id}: {user_error}")
+
+            if len(user_ids) < chunk_size:
+                break
+    except Exception as e:
+        print(f"Error processing repeating tools: {e}")
+    return tool_ticks
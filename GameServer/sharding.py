@@ -0,0 +1,42 @@
+# GameServer/sharding.py
+
+from dataclasses import dataclass
+from sqlalchemy import String, BigInteger, cast, func, literal
+from sqlalchemy.dialects.postgresql import BIT
+
+
+@dataclass(frozen=True)
+class Shard:
+    """
+    Hash partition of users.Id: the users whose shard key modulo count equals index.
+    """
+    index: int
+    count: int
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+
+def user_shard_key(user_id) -> int:
+    """
+    Shard key of a user: the last 32 bits of the UUID, uniformly random for uuid4.
+    """
+    return int(str(user_id)[-8:], 16)
+
+
+def user_in_shard(user_id, shard: Shard) -> bool:
+    if shard is None:
+        return True
+    return user_shard_key(user_id) % shard.count == shard.index
+
+
+def user_shard_clause(user_id_column, shard: Shard):
+    """
+    SQL filter selecting the rows of user_id_column that belong to shard.
+
+    Computes the same key as user_shard_key: the last 8 hex digits of the UUID
+    read as an unsigned integer.
+    """
+    last_hex_digits = func.lpad(func.right(cast(user_id_column, String), 8), 16, '0')
+    shard_key = cast(cast(literal('x').concat(last_hex_digits), BIT(64)), BigInteger)
+    return shard_key % shard.count == shard.index
@@ -0,0 +1,535 @@
+# GameServer/state_cache.py
+
+import asyncio
+import glob
+import json
+import os
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import select, update, event, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from Database.database import async_engine
+from Database.models import User, UserItem, UserCategoryXP
+
+# Write-behind cache of UserItem, UserCategoryXP and User.Gold/TotalLevel for active users.
+# While a user is cached the cache is authoritative and the database lags by at most one
+# flush interval, so only one process may own the users: enable it for a single API worker
+# that also runs the tick loops (RUN_TICK_LOOPS_IN_API), never next to the tick service.
+STATE_CACHE_ENABLED = os.getenv("STATE_CACHE_ENABLED", "false").lower() == "true"
+STATE_CACHE_FLUSH_INTERVAL = float(os.getenv("STATE_CACHE_FLUSH_INTERVAL", "5"))
+STATE_CACHE_MAX_MB = float(os.getenv("STATE_CACHE_MAX_MB", "256"))
+STATE_CACHE_JOURNAL = os.getenv("STATE_CACHE_JOURNAL", "state_cache.journal")
+
+# Rough per-object costs of the cached dicts, used for the memory budget
+_USER_BYTES = 600
+_ENTRY_BYTES = 200
+
+
+class UserState:
+    """
+    Cached state of one user. items and xp hold absolute values, the dirty
+    sets name the keys changed since the last flush.
+    """
+
+    __slots__ = (
+        "user_id", "username", "items", "xp", "gold", "total_level",
+        "dirty_items", "dirty_xp", "dirty_user", "accounted_bytes"
+    )
+
+    def __init__(self, user_id, username, gold, total_level):
+        self.user_id = user_id
+        self.username = username
+        self.items = {}          # UniqueName -> Quantity
+        self.xp = {}             # Category -> [CurrentXP, CategoryLevel]
+        self.gold = gold
+        self.total_level = total_level
+        self.dirty_items = set()
+        self.dirty_xp = set()
+        self.dirty_user = False
+        self.accounted_bytes = 0
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self.dirty_items or self.dirty_xp or self.dirty_user)
+
+    def size(self) -> int:
+        return _USER_BYTES + _ENTRY_BYTES * (len(self.items) + len(self.xp))
+
+
+class StateCache:
+    """
+    LRU of UserState entries within a memory budget.
+
+    Mutations are synchronous, so they never interleave with each other, and
+    are appended to a local journal of absolute values before they return. The
+    flusher writes the dirty entries in one transaction per interval; the
+    journal is rotated at the start of a flush and removed once it committed,
+    so after a crash replaying the remaining journal files restores every
+    acknowledged change. Replaying is idempotent since the values are absolute.
+    """
+
+    def __init__(self, max_bytes: int, flush_interval: float, journal_path: str):
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.journal_path = journal_path
+        self._entries = OrderedDict()  # UserId -> UserState, least recently used first
+        self._bytes = 0
+        self._evictions = 0
+        self._journal = None
+        self._journal_seq = 0
+        self._flush_lock = asyncio.Lock()
+        self._flush_requested = asyncio.Event()
+        self.started = False
+
+    # --- Lifecycle ---
+
+    async def start(self):
+        """
+        Replays journal files left by a crash and opens a new journal.
+        """
+        await self.recover()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self.started = True
+
+    async def close(self):
+        """
+        Flushes every dirty entry and closes the journal, on graceful shutdown.
+        """
+        if not self.started:
+            return
+        await self.flush()
+        self.started = False
+        self._journal.close()
+        self._journal = None
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) == 0:
+            os.remove(self.journal_path)
+
+    async def run_flusher(self):
+        """
+        Flushes dirty entries every flush_interval seconds, or earlier when
+        eviction is blocked by dirty entries. Runs until cancelled.
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    # --- Reads ---
+
+    async def get_users(self, user_ids) -> dict:
+        """
+        Returns {UserId: UserState} for the given users, loading the missing
+        ones with one query per table. Unknown users are left out.
+        """
+        user_ids = list(dict.fromkeys(_as_uuid(user_id) for user_id in user_ids))
+        missing = [user_id for user_id in user_ids if user_id not in self._entries]
+        while missing:
+            evictions = self._evictions
+            loaded = await self._load(missing)
+            if evictions == self._evictions:
+                for state in loaded.values():
+                    self._insert(state)
+                break
+            # An entry evicted during the load may be newer than what was read, read it again
+            missing = [user_id for user_id in missing if user_id not in self._entries]
+
+        states = {}
+        for user_id in user_ids:
+            state = self._entries.get(user_id)
+            if state is not None:
+                self._entries.move_to_end(user_id)
+                states[user_id] = state
+        self._evict()
+        return states
+
+    async def get_user(self, user_id):
+        """
+        Returns the UserState of one user, or None if the user does not exist.
+        """
+        return (await self.get_users([user_id])).get(_as_uuid(user_id))
+
+    async def _load(self, user_ids) -> dict:
+        states = {}
+        async with async_engine.connect() as conn:
+            user_rows = await conn.execute(
+                select(User.Id, User.Username, User.Gold, User.TotalLevel).filter(User.Id.in_(user_ids))
+            )
+            for user_id, username, gold, total_level in user_rows:
+                states[user_id] = UserState(user_id, username, gold or 0, total_level or 1)
+            item_rows = await conn.execute(
+                select(UserItem.UserId, UserItem.UniqueName, UserItem.Quantity).filter(UserItem.UserId.in_(user_ids))
+            )
+            for user_id, unique_name, quantity in item_rows:
+                states[user_id].items[unique_name] = quantity or 0
+            xp_rows = await conn.execute(
+                select(UserCategoryXP.UserId, UserCategoryXP.Category, UserCategoryXP.CurrentXP, UserCategoryXP.CategoryLevel)
+                .filter(UserCategoryXP.UserId.in_(user_ids))
+            )
+            for user_id, category, current_xp, category_level in xp_rows:
+                states[user_id].xp[category] = [current_xp, category_level]
+        return states
+
+    # --- Mutations ---
+
+    def apply_item_deltas(self, state: UserState, deltas: dict, all_or_nothing: bool = True):
+        """
+        Adds deltas to the user's items. Negative deltas only apply where the
+        quantity stays non-negative.
+
+        :return: ({UniqueName: Quantity after the change}, {UniqueName: Quantity available} of failed deltas)
+        """
+        failed = {
+            name: state.items.get(name, 0)
+            for name, delta in deltas.items()
+            if delta < 0 and state.items.get(name, 0) + delta < 0
+        }
+        if failed and all_or_nothing:
+            return {}, failed
+        applied = {}
+        for name, delta in deltas.items():
+            if delta == 0 or name in failed:
+                continue
+            applied[name] = state.items[name] = state.items.get(name, 0) + delta
+        self._touch(state, items=applied)
+        return applied, failed
+
+    def apply_gold(self, state: UserState, delta: float):
+        """
+        Adds delta to the user's gold unless the balance would go negative.
+
+        :return: The new balance, or None if the user does not have enough gold.
+        """
+        if state.gold + delta < 0:
+            return None
+        state.gold += delta
+        self._touch(state, user=True)
+        return state.gold
+
+    async def apply_bulk_deltas(self, item_deltas: dict, xp_deltas: dict = None, levels: dict = None, total_levels: dict = None):
+        """
+        Applies the deltas of a game loop for many users, clamping quantities
+        at zero like the bulk database upsert.
+
+        :param item_deltas: {(UserId, UniqueName): delta}
+        :param xp_deltas: {(UserId, Category): XP delta}
+        :param levels: {(UserId, Category): CategoryLevel}, for every key of xp_deltas
+        :param total_levels: {UserId: TotalLevel}
+        """
+        xp_deltas = xp_deltas or {}
+        total_levels = total_levels or {}
+        user_ids = {user_id for user_id, _ in item_deltas} | {user_id for user_id, _ in xp_deltas} | set(total_levels)
+        states = await self.get_users(user_ids)
+        touched_items = {}
+        touched_xp = {}
+        for (user_id, unique_name), delta in item_deltas.items():
+            state = states.get(user_id)
+            if state is None or delta == 0:
+                continue
+            state.items[unique_name] = max(state.items.get(unique_name, 0) + delta, 0)
+            touched_items.setdefault(user_id, []).append(unique_name)
+        for (user_id, category), xp_delta in xp_deltas.items():
+            state = states.get(user_id)
+            if state is None:
+                continue
+            entry = state.xp.setdefault(category, [0, 1])
+            entry[0] += xp_delta
+            entry[1] = max(entry[1], levels[(user_id, category)])
+            touched_xp.setdefault(user_id, []).append(category)
+        for user_id, total in total_levels.items():
+            state = states.get(user_id)
+            if state is not None:
+                state.total_level = total
+        for user_id, state in states.items():
+            self._touch(
+                state, items=touched_items.get(user_id, ()), xp=touched_xp.get(user_id, ()),
+                user=user_id in total_levels
+            )
+
+    def _touch(self, state: UserState, items=(), xp=(), user: bool = False):
+        """
+        Marks keys dirty and journals their new absolute values.
+        """
+        if not items and not xp and not user:
+            return
+        state.dirty_items.update(items)
+        state.dirty_xp.update(xp)
+        state.dirty_user = state.dirty_user or user
+        if state.user_id in self._entries:
+            size = state.size()
+            self._bytes += size - state.accounted_bytes
+            state.accounted_bytes = size
+        record = {"u": str(state.user_id), "n": state.username}
+        if items:
+            record["i"] = {name: state.items[name] for name in items}
+        if xp:
+            record["x"] = {category: state.xp[category] for category in xp}
+        if user:
+            record["g"] = state.gold
+            record["t"] = state.total_level
+        if self._journal is not None:
+            # Written through to the OS so the change survives a crash of this process
+            self._journal.write(json.dumps(record) + "\n")
+            self._journal.flush()
+
+    # --- LRU ---
+
+    def _insert(self, state: UserState):
+        # A cached entry is newer than anything read from the database
+        if state.user_id in self._entries:
+            return
+        state.accounted_bytes = state.size()
+        self._entries[state.user_id] = state
+        self._bytes += state.accounted_bytes
+
+    def _evict(self):
+        """
+        Drops clean entries, least recently used first, until the cache fits
+        its budget. Dirty entries are flushed first and evicted afterwards.
+        """
+        if self._bytes <= self.max_bytes:
+            return
+        for user_id in list(self._entries):
+            if self._bytes <= self.max_bytes:
+                return
+            state = self._entries[user_id]
+            if not state.dirty:
+                del self._entries[user_id]
+                self._bytes -= state.accounted_bytes
+                self._evictions += 1
+        self._flush_requested.set()
+
+    # --- Flushing ---
+
+    async def flush(self) -> int:
+        """
+        Writes every dirty entry with one statement per table and removes the
+        journal files the write covered.
+
+        :return: Number of users written.
+        """
+        async with self._flush_lock:
+            dirty = [state for state in self._entries.values() if state.dirty]
+            if not dirty:
+                return 0
+            flushing_path = self._rotate_journal()
+
+            item_rows, xp_rows, user_rows = [], [], []
+            snapshot = []
+            now = datetime.now()
+            for state in dirty:
+                snapshot.append((state, state.dirty_items, state.dirty_xp, state.dirty_user))
+                item_rows.extend(
+                    {"UserId": state.user_id, "Username": state.username, "UniqueName": name, "Quantity": state.items[name]}
+                    for name in state.dirty_items
+                )
+                xp_rows.extend(
+                    {
+                        "UserId": state.user_id, "Username": state.username, "Category": category,
+                        "CurrentXP": state.xp[category][0], "CategoryLevel": state.xp[category][1], "LastUpdated": now
+                    }
+                    for category in state.dirty_xp
+                )
+                if state.dirty_user:
+                    user_rows.append({"b_user_id": state.user_id, "b_gold": state.gold, "b_total_level": state.total_level})
+                state.dirty_items, state.dirty_xp, state.dirty_user = set(), set(), False
+
+            try:
+                async with async_engine.begin() as conn:
+                    await write_absolute_state(conn, item_rows, xp_rows, user_rows)
+            except Exception as e:
+                # Mark the entries dirty again, the journal files stay for the next flush or a replay
+                for state, items, xp, user in snapshot:
+                    state.dirty_items |= items
+                    state.dirty_xp |= xp
+                    state.dirty_user = state.dirty_user or user
+                print(f"Error flushing state cache: {e}")
+                return 0
+
+            # Everything journaled before the rotation is in the database now
+            for path in self._journal_files():
+                if path != self.journal_path and _journal_seq(path) <= _journal_seq(flushing_path):
+                    os.remove(path)
+            self._evict()
+            return len(dirty)
+
+    def _rotate_journal(self) -> str:
+        self._journal_seq += 1
+        flushing_path = f"{self.journal_path}.{self._journal_seq}.flushing"
+        if self._journal is not None:
+            os.fsync(self._journal.fileno())
+            self._journal.close()
+            os.replace(self.journal_path, flushing_path)
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        return flushing_path
+
+    def _journal_files(self):
+        """
+        Journal files oldest first, the active journal last.
+        """
+        files = sorted(glob.glob(f"{glob.escape(self.journal_path)}.*.flushing"), key=_journal_seq)
+        if os.path.exists(self.journal_path):
+            files.append(self.journal_path)
+        return files
+
+    async def recover(self) -> int:
+        """
+        Writes the values of journal files left behind by a crash to the
+        database, later records overriding earlier ones.
+
+        :return: Number of journal records replayed.
+        """
+        files = self._journal_files()
+        if not files:
+            return 0
+        self._journal_seq = max((_journal_seq(path) for path in files if path != self.journal_path), default=0)
+        items, xps, users, usernames = {}, {}, {}, {}
+        replayed = 0
+        for path in files:
+            with open(path, encoding="utf-8") as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn last line from the crash, its change was never acknowledged
+                        continue
+                    user_id = uuid.UUID(record["u"])
+                    usernames[user_id] = record["n"]
+                    for name, quantity in record.get("i", {}).items():
+                        items[(user_id, name)] = quantity
+                    for category, (current_xp, level) in record.get("x", {}).items():
+                        xps[(user_id, category)] = (current_xp, level)
+                    if "g" in record:
+                        users[user_id] = (record["g"], record["t"])
+                    replayed += 1
+
+        now = datetime.now()
+        async with async_engine.begin() as conn:
+            await write_absolute_state(
+                conn,
+                [
+                    {"UserId": user_id, "Username": usernames[user_id], "UniqueName": name, "Quantity": quantity}
+                    for (user_id, name), quantity in items.items()
+                ],
+                [
+                    {
+                        "UserId": user_id, "Username": usernames[user_id], "Category": category,
+                        "CurrentXP": current_xp, "CategoryLevel": level, "LastUpdated": now
+                    }
+                    for (user_id, category), (current_xp, level) in xps.items()
+                ],
+                [
+                    {"b_user_id": user_id, "b_gold": gold, "b_total_level": total_level}
+                    for user_id, (gold, total_level) in users.items()
+                ],
+            )
+        for path in files:
+            os.remove(path)
+        print(f"Replayed {replayed} state cache journal records.")
+        return replayed
+
+
+async def write_absolute_state(conn, item_rows, xp_rows, user_rows):
+    """
+    Overwrites quantities, XP and gold with the given absolute values.
+    """
+    if item_rows:
+        user_items = UserItem.__table__
+        stmt = pg_insert(user_items)
+        stmt = stmt.on_conflict_do_update(
+            constraint='unique_user_item',
+            set_={"Quantity": stmt.excluded.Quantity}
+        )
+        await conn.execute(stmt, item_rows)
+    if xp_rows:
+        user_category_xp = UserCategoryXP.__table__
+        stmt = pg_insert(user_category_xp)
+        stmt = stmt.on_conflict_do_update(
+            constraint='unique_user_category_xp',
+            set_={
+                "CurrentXP": stmt.excluded.CurrentXP,
+                "CategoryLevel": stmt.excluded.CategoryLevel,
+                "LastUpdated": stmt.excluded.LastUpdated,
+            }
+        )
+        await conn.execute(stmt, xp_rows)
+    if user_rows:
+        users = User.__table__
+        await conn.execute(
+            update(users).where(users.c.Id == bindparam("b_user_id")).values(
+                Gold=bindparam("b_gold"), TotalLevel=bindparam("b_total_level")
+            ),
+            user_rows
+        )
+
+
+def _journal_seq(path: str) -> int:
+    if not path.endswith(".flushing"):
+        return 0
+    return int(path.rsplit(".", 2)[1])
+
+
+def _as_uuid(user_id):
+    return user_id if isinstance(user_id, uuid.UUID) else uuid.UUID(str(user_id))
+
+
+def _undo_list(session):
+    sync_session = getattr(session, "sync_session", None)
+    if sync_session is None:
+        return None
+    undo_list = sync_session.info.get("state_cache_undo")
+    if undo_list is None:
+        undo_list = sync_session.info["state_cache_undo"] = []
+
+        # Savepoints fire these too, a savepoint is undone through undo_point and
+        # its changes are kept or undone with the outermost transaction
+        @event.listens_for(sync_session, "after_commit")
+        def _forget(sess):
+            if not sess.in_nested_transaction():
+                undo_list.clear()
+
+        @event.listens_for(sync_session, "after_rollback")
+        def _undo(sess):
+            if sess.in_nested_transaction():
+                return
+            while undo_list:
+                undo_list.pop()()
+    return undo_list
+
+
+def undo_on_rollback(session, undo):
+    """
+    Calls undo() if the session's transaction is rolled back, so a cached
+    change made inside a failed request does not outlive it. Connections
+    without a session are not tracked.
+    """
+    undo_list = _undo_list(session)
+    if undo_list is not None:
+        undo_list.append(undo)
+
+
+def undo_point(session):
+    """
+    Returns a function that undoes the cached changes registered on session
+    after this call, for a savepoint that is rolled back on its own.
+    """
+    undo_list = _undo_list(session)
+    mark = len(undo_list) if undo_list is not None else 0
+
+    def rollback_to_point():
+        while undo_list and len(undo_list) > mark:
+            undo_list.pop()()
+    return rollback_to_point
+
+
+state_cache = StateCache(int(STATE_CACHE_MAX_MB * 1024 * 1024), STATE_CACHE_FLUSH_INTERVAL, STATE_CACHE_JOURNAL)
+
+
+def state_cache_enabled() -> bool:
+    """
+    True once this process started the cache, the other processes keep writing the database.
+    """
+    return STATE_CACHE_ENABLED and state_cache.started
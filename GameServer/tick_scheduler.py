@@ -0,0 +1,194 @@
+# GameServer/tick_scheduler.py
+
+import asyncio
+import math
+import os
+import random
+import time
+from Database.query_accounting import query_scope, record_query_stats
+
+# What a loop does with the ticks it missed while a run overran:
+# "catch_up": run them back to back, at most TICK_MAX_CATCH_UP, the rest are skipped.
+# "skip": drop them and continue on the next slot of the fixed-rate grid.
+# "merge": run once for all of them, for loops that settle the elapsed time themselves.
+TICK_OVERRUN_POLICY = os.getenv("TICK_OVERRUN_POLICY", "catch_up")
+TICK_MAX_CATCH_UP = int(os.getenv("TICK_MAX_CATCH_UP", "3"))
+# Random delay added to every run, spreads the ticks of many processes apart
+TICK_JITTER_SECONDS = float(os.getenv("TICK_JITTER_SECONDS", "0"))
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf)
+
+
+class LoopMetrics:
+    """
+    Counters of one game loop, cheap enough to update on every run.
+
+    :ivar duration_buckets: Cumulative run counts per upper bound of DURATION_BUCKETS.
+    :ivar lag: Seconds the last run started behind its slot on the fixed-rate grid.
+    :ivar rows: Rows (tool ticks, crafts, ledger rows) processed by all runs.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.runs = 0
+        self.errors = 0
+        self.rows = 0
+        self.last_rows = 0
+        self.skipped = 0
+        self.merged = 0
+        self.duration_buckets = [0] * len(DURATION_BUCKETS)
+        self.duration_sum = 0.0
+        self.last_duration = 0.0
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.last_run_at = None
+
+    def observe(self, duration: float, lag: float, rows=None, error: bool = False):
+        self.runs += 1
+        if error:
+            self.errors += 1
+        if isinstance(rows, int):
+            self.rows += rows
+            self.last_rows = rows
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if duration <= bound:
+                self.duration_buckets[i] += 1
+        self.duration_sum += duration
+        self.last_duration = duration
+        self.lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.last_run_at = time.time()
+
+    async def measure(self, tick_fn, lag: float = 0.0):
+        """
+        Awaits tick_fn() and records its duration, rows, queries and errors.
+        Exceptions are recorded and re-raised.
+        """
+        start = time.perf_counter()
+        with query_scope() as stats:
+            try:
+                rows = await tick_fn()
+            except Exception:
+                self.observe(time.perf_counter() - start, lag, error=True)
+                raise
+        self.observe(time.perf_counter() - start, lag, rows)
+        record_query_stats(f"tick {self.name}", stats)
+        return rows
+
+    def snapshot(self) -> dict:
+        return {
+            "runs": self.runs,
+            "errors": self.errors,
+            "rows": self.rows,
+            "last_rows": self.last_rows,
+            "skipped": self.skipped,
+            "merged": self.merged,
+            "duration_buckets": dict(zip(DURATION_BUCKETS, self.duration_buckets)),
+            "duration_sum": self.duration_sum,
+            "last_duration": self.last_duration,
+            "lag": self.lag,
+            "max_lag": self.max_lag,
+            "last_run_at": self.last_run_at,
+        }
+
+
+_loop_metrics = {}
+
+
+def loop_metrics(name: str) -> LoopMetrics:
+    """
+    Returns the process-wide metrics of a loop, creating them on first use.
+    """
+    metrics = _loop_metrics.get(name)
+    if metrics is None:
+        metrics = _loop_metrics[name] = LoopMetrics(name)
+    return metrics
+
+
+def all_loop_metrics() -> dict:
+    return {name: metrics.snapshot() for name, metrics in _loop_metrics.items()}
+
+
+class TickScheduler:
+    """
+    Fixed-rate scheduler: runs are due at start + k * interval regardless of
+    how long each run took, so the tick rate does not drift. Runs that
+    overrun their slot are handled by the overrun policy.
+
+    tick_fn returns the number of rows it processed, or None when it did no
+    work (e.g. not the leader), which is not recorded as a run.
+    """
+
+    def __init__(self, name: str, interval: float, overrun: str = TICK_OVERRUN_POLICY,
+                 max_catch_up: int = TICK_MAX_CATCH_UP, jitter: float = TICK_JITTER_SECONDS,
+                 clock=time.monotonic):
+        if overrun not in ("catch_up", "skip", "merge"):
+            raise ValueError(f"Unknown overrun policy '{overrun}'.")
+        self.name = name
+        self.interval = interval
+        self.overrun = overrun
+        self.max_catch_up = max_catch_up
+        self.jitter = jitter
+        self.clock = clock
+        self.metrics = loop_metrics(name)
+        self.lag = 0.0
+        self._next_due = None
+        self._catch_up_left = max_catch_up
+
+    async def run(self, tick_fn):
+        """
+        Calls tick_fn on the fixed-rate grid until cancelled.
+        """
+        while True:
+            await self.wait()
+            await self._run_once(tick_fn)
+
+    async def wait(self):
+        """
+        Sleeps until the next run is due and applies the overrun policy to the
+        ticks missed since the previous run. Sets self.lag for the run.
+        """
+        if self._next_due is None:
+            self._next_due = self.clock()
+        else:
+            self._next_due += self.interval
+        offset = random.uniform(0, self.jitter) if self.jitter > 0 else 0.0
+        delay = self._next_due + offset - self.clock()
+        if delay > 0:
+            await asyncio.sleep(delay)
+            self._catch_up_left = self.max_catch_up
+
+        # Lag behind the slot this run belongs to
+        self.lag = max(self.clock() - (self._next_due + offset), 0.0)
+        missed = int(self.lag // self.interval)
+        if not missed:
+            return
+        if self.overrun == "skip":
+            self.metrics.skipped += missed
+            self._next_due += missed * self.interval
+        elif self.overrun == "merge":
+            self.metrics.merged += missed
+            self._next_due += missed * self.interval
+        elif missed > self._catch_up_left:
+            # Catch up on at most max_catch_up ticks in a row, then drop the rest
+            skipped = missed - self._catch_up_left
+            self.metrics.skipped += skipped
+            self._next_due += skipped * self.interval
+            self._catch_up_left = 0
+        else:
+            self._catch_up_left -= 1
+
+    async def _run_once(self, tick_fn):
+        start = time.perf_counter()
+        with query_scope() as stats:
+            try:
+                rows = await tick_fn()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.metrics.observe(time.perf_counter() - start, self.lag, error=True)
+                print(f"Error in tick loop '{self.name}': {e}")
+                return
+        if rows is not None:
+            self.metrics.observe(time.perf_counter() - start, self.lag, rows)
+            record_query_stats(f"tick {self.name}", stats)
@@ -0,0 +1,366 @@
+# GameServer/tick_service.py
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .sharding import Shard
+
+TICK_INTERVAL_SECONDS = float(os.getenv("TICK_INTERVAL_SECONDS", "5"))
+# Loops whose global lock the coordinator holds while its workers tick them, the
+# API's loops take the same locks, so the two never run a loop at the same time.
+SERVICE_LOOPS = ("repeating_tools", "crafting")
+# Port the coordinator serves the workers' loop metrics on at /metrics, 0 disables it
+TICK_METRICS_PORT = int(os.getenv("TICK_METRICS_PORT", "0"))
+
+
+class Assignment:
+    """
+    Control message from the coordinator to a worker.
+
+    A shard of None pauses the worker. The worker acknowledges every
+    assignment with its generation once no tick of the previous shard is running.
+    """
+
+    def __init__(self, generation: int, shard: Shard = None, stop: bool = False):
+        self.generation = generation
+        self.shard = shard
+        self.stop = stop
+
+
+async def _worker_loop(worker_id: int, control_queue, ack_queue, interval: float, metrics_queue=None):
+    # Imported in the worker so every spawned process creates its own engines
+    from .repeating_tools_engine import process_repeating_tools_async
+    from .crafting_scheduler import CraftingScheduler
+    from .offline_progress import lazy_accrual_enabled
+    from .leader_election import LeaderElector, make_tick_lock
+    from .game_catalog import run_catalog_listener
+    from .inventory_ledger import ledger_enabled, compact_ledger
+    from .tick_scheduler import TickScheduler, loop_metrics, all_loop_metrics
+
+    scheduler = CraftingScheduler()
+    coordinator_pid = os.getppid()
+    # Paces the worker on a fixed-rate grid, each loop below records its own metrics
+    pacer = TickScheduler(f"tick_worker_{worker_id}", interval)
+    shard = None
+    electors = []
+    # Pick up catalog reloads broadcast by the API
+    catalog_listener = asyncio.create_task(run_catalog_listener())
+    # The ledger is compacted by one worker across all shards
+    compactor_elector = LeaderElector(make_tick_lock("ledger_compactor")) if ledger_enabled() else None
+
+    while True:
+        await pacer.wait()
+        # An orphaned worker stops, the coordinator's loop locks died with it
+        stopping = os.getppid() != coordinator_pid
+        # Adopt the latest assignment, only between ticks
+        while not stopping:
+            try:
+                assignment = control_queue.get_nowait()
+            except queue.Empty:
+                break
+            if assignment.stop:
+                stopping = True
+                break
+            # Give up the locks of the old shard before acknowledging
+            for elector in electors:
+                await elector.resign()
+            electors = []
+            shard = assignment.shard
+            if shard is not None:
+                scheduler.set_shard(shard)
+                # The coordinator holds the loops' global locks, the shard locks keep
+                # the workers of one partitioning apart during a rebalance
+                electors = [
+                    LeaderElector(make_tick_lock("repeating_tools", shard)),
+                    LeaderElector(make_tick_lock("crafting", shard), on_elected=scheduler.reset),
+                ]
+            ack_queue.put((worker_id, assignment.generation))
+            print(f"Tick worker {worker_id} assigned shard {shard}.")
+        if stopping:
+            for elector in electors:
+                await elector.resign()
+            if compactor_elector is not None:
+                await compactor_elector.resign()
+            catalog_listener.cancel()
+            return
+
+        if shard is not None:
+            repeating_elector, crafting_elector = electors
+            if not lazy_accrual_enabled() and await repeating_elector.try_lead():
+                await loop_metrics("repeating_tools").measure(lambda: process_repeating_tools_async(shard), pacer.lag)
+            if await crafting_elector.try_lead():
+                await loop_metrics("crafting").measure(scheduler.process_due, pacer.lag)
+        if compactor_elector is not None and await compactor_elector.try_lead():
+            await loop_metrics("ledger_compactor").measure(compact_ledger, pacer.lag)
+        if metrics_queue is not None:
+            metrics_queue.put((worker_id, all_loop_metrics()))
+
+
+def worker_main(worker_id: int, control_queue, ack_queue, interval: float, metrics_queue=None):
+    try:
+        asyncio.run(_worker_loop(worker_id, control_queue, ack_queue, interval, metrics_queue))
+    except KeyboardInterrupt:
+        pass
+
+
+class TickCoordinator:
+    """
+    Starts tick worker processes and assigns each one a hash partition of users.Id.
+
+    Whenever a worker joins or leaves, all workers are paused and acknowledge the
+    pause before the new partitioning is handed out, so no user is ticked by two
+    workers with different shard counts at the same time.
+
+    Shards are only handed out while the coordinator holds the global lock of
+    every loop in SERVICE_LOOPS. Until then, e.g. while API workers run their
+    own loops or another tick service is running, the workers stay paused.
+
+    With a metrics port, workers send their loop metrics after every tick and
+    the coordinator serves them at /metrics, labelled by worker.
+    """
+
+    def __init__(self, num_workers: int, interval: float = TICK_INTERVAL_SECONDS, respawn: bool = True,
+                 metrics_port: int = TICK_METRICS_PORT):
+        from .leader_election import make_tick_lock
+        self._context = multiprocessing.get_context("spawn")
+        self._ack_queue = self._context.Queue()
+        self._workers = {}  # worker_id -> (process, control_queue)
+        self._next_worker_id = 0
+        self._generation = 0
+        self._interval = interval
+        self._respawn = respawn
+        self._target_workers = num_workers
+        self._running = False
+        self._loop_locks = [make_tick_lock(loop_name) for loop_name in SERVICE_LOOPS]
+        self._leading = False
+        # The locks are async, a Postgres lock keeps its connection on this event loop
+        self._event_loop = asyncio.new_event_loop()
+        self._metrics_port = metrics_port
+        self._metrics_queue = self._context.Queue() if metrics_port else None
+        self._worker_metrics = {}  # worker_id -> {loop name: LoopMetrics snapshot} of its latest tick
+
+    def _spawn_worker(self):
+        worker_id = self._next_worker_id
+        self._next_worker_id += 1
+        control_queue = self._context.Queue()
+        process = self._context.Process(
+            target=worker_main,
+            args=(worker_id, control_queue, self._ack_queue, self._interval, self._metrics_queue),
+            name=f"tick-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        self._workers[worker_id] = (process, control_queue)
+        print(f"Tick worker {worker_id} started (pid {process.pid}).")
+
+    def _send_all(self, make_assignment):
+        self._generation += 1
+        for position, (worker_id, (process, control_queue)) in enumerate(sorted(self._workers.items())):
+            control_queue.put(make_assignment(self._generation, position))
+        return self._generation
+
+    def _wait_for_acks(self, generation: int, timeout: float):
+        pending = set(self._workers)
+        deadline = time.monotonic() + timeout
+        while pending and time.monotonic() < deadline:
+            try:
+                worker_id, acked_generation = self._ack_queue.get(timeout=0.5)
+            except queue.Empty:
+                pending -= {wid for wid in pending if not self._workers[wid][0].is_alive()}
+                continue
+            if acked_generation == generation:
+                pending.discard(worker_id)
+        if pending:
+            print(f"Tick workers {sorted(pending)} did not acknowledge generation {generation}.")
+
+    def _drain_metrics(self):
+        if self._metrics_queue is None:
+            return
+        while True:
+            try:
+                worker_id, snapshots = self._metrics_queue.get_nowait()
+            except queue.Empty:
+                return
+            if worker_id in self._workers:
+                self._worker_metrics[worker_id] = snapshots
+
+    def _loop_series(self):
+        for worker_id, snapshots in list(self._worker_metrics.items()):
+            for name, snapshot in snapshots.items():
+                yield (("loop", name), ("worker", str(worker_id))), snapshot
+
+    def _serve_metrics(self):
+        """
+        Serves the workers' loop metrics at /metrics on the metrics port, from a daemon thread.
+        """
+        # Imported here, only a coordinator with a metrics port renders metrics
+        from API.metrics import MetricsRegistry, register_loop_metrics
+        registry = MetricsRegistry()
+        register_loop_metrics(registry, self._loop_series)
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("", self._metrics_port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="tick-metrics", daemon=True).start()
+        print(f"Serving tick metrics on port {self._metrics_port}.")
+        return server
+
+    def _acquire_loop_locks(self) -> bool:
+        """
+        Takes the global lock of every loop in SERVICE_LOOPS, or none of them.
+        """
+        for lock in self._loop_locks:
+            if not self._event_loop.run_until_complete(lock.try_acquire()):
+                self._release_loop_locks()
+                return False
+        return True
+
+    def _loop_locks_held(self) -> bool:
+        return all(self._event_loop.run_until_complete(lock.is_held()) for lock in self._loop_locks)
+
+    def _release_loop_locks(self):
+        for lock in self._loop_locks:
+            self._event_loop.run_until_complete(lock.release())
+
+    def _update_leadership(self, reported_standby: bool) -> bool:
+        """
+        Acquires the loop locks or notices their loss, and assigns or pauses the workers accordingly.
+
+        :return: Whether the standby message has been printed.
+        """
+        if self._leading:
+            if self._loop_locks_held():
+                return reported_standby
+            print("Lost the tick loop locks, pausing the tick workers.")
+            self._leading = False
+            self._release_loop_locks()
+            self.rebalance()
+            return False
+        if self._acquire_loop_locks():
+            print(f"Tick service acquired the loop locks (pid {os.getpid()}).")
+            self._leading = True
+            self.rebalance()
+            return False
+        if not reported_standby:
+            print("The tick loops are run by another process (API workers with RUN_TICK_LOOPS_IN_API "
+                  "or another tick service), standing by until their locks are released.")
+        return True
+
+    def rebalance(self):
+        """
+        Pauses every worker, then hands out shards 0..n-1 of n live workers
+        if this coordinator holds the loop locks.
+        """
+        if not self._workers:
+            return
+        generation = self._send_all(lambda gen, position: Assignment(gen))
+        self._wait_for_acks(generation, timeout=self._interval * 4)
+        if not self._leading:
+            return
+        count = len(self._workers)
+        self._send_all(lambda gen, position: Assignment(gen, Shard(position, count)))
+        print(f"Rebalanced {count} tick workers.")
+
+    def add_worker(self):
+        self._target_workers += 1
+        self._spawn_worker()
+        self.rebalance()
+
+    def remove_worker(self):
+        if self._target_workers <= 1:
+            return
+        self._target_workers -= 1
+        worker_id = max(self._workers)
+        process, control_queue = self._workers.pop(worker_id)
+        self._worker_metrics.pop(worker_id, None)
+        control_queue.put(Assignment(self._generation, stop=True))
+        process.join(timeout=self._interval * 4)
+        self.rebalance()
+
+    def _reap_dead_workers(self) -> bool:
+        dead = [worker_id for worker_id, (process, _) in self._workers.items() if not process.is_alive()]
+        for worker_id in dead:
+            process, _ = self._workers.pop(worker_id)
+            self._worker_metrics.pop(worker_id, None)
+            print(f"Tick worker {worker_id} exited with code {process.exitcode}.")
+        return bool(dead)
+
+    def stop(self):
+        self._running = False
+
+    def run(self):
+        self._running = True
+        metrics_server = self._serve_metrics() if self._metrics_port else None
+        for _ in range(self._target_workers):
+            self._spawn_worker()
+        reported_standby = False
+
+        signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda *_: self.add_worker())
+            signal.signal(signal.SIGUSR2, lambda *_: self.remove_worker())
+
+        try:
+            while self._running:
+                reported_standby = self._update_leadership(reported_standby)
+                time.sleep(1)
+                self._drain_metrics()
+                if self._reap_dead_workers():
+                    if self._respawn:
+                        while len(self._workers) < self._target_workers:
+                            self._spawn_worker()
+                    self.rebalance()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for process, control_queue in self._workers.values():
+                control_queue.put(Assignment(self._generation, stop=True))
+            for process, _ in self._workers.values():
+                process.join(timeout=self._interval * 2)
+                if process.is_alive():
+                    process.terminate()
+            self._release_loop_locks()
+            self._event_loop.close()
+            if metrics_server is not None:
+                metrics_server.shutdown()
+            print("Tick service stopped.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the IdleCrafter game simulation in sharded worker processes.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of tick worker processes")
+    parser.add_argument("--interval", type=float, default=TICK_INTERVAL_SECONDS, help="Seconds between ticks")
+    parser.add_argument("--no-respawn", action="store_true", help="Do not replace workers that exit")
+    parser.add_argument("--metrics-port", type=int, default=TICK_METRICS_PORT,
+                        help="Serve the workers' loop metrics at /metrics on this port, 0 to disable")
+    args = parser.parse_args()
+
+    if os.getenv("STATE_CACHE_ENABLED", "false").lower() == "true":
+        # The API's state cache owns the cached users, ticks written here would be overwritten by its flushes
+        print("STATE_CACHE_ENABLED is set: run the tick loops in the API (RUN_TICK_LOOPS_IN_API) instead of the tick service.")
+        return
+
+    TickCoordinator(args.workers, args.interval, respawn=not args.no_respawn, metrics_port=args.metrics_port).run()
+
+
+if __name__ == "__main__":
+    main()
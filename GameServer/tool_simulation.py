@@ -0,0 +1,274 @@
+# GameServer/tool_simulation.py
+
+import numpy as np
+from .game_catalog import GameCatalog
+from .repeating_tools_engine import TickDeltas, XP_MULTIPLIER, total_level_after_level_up
+
+# Stand-in for "no storage capacity", small enough that adding to it never overflows int64
+NO_CAPACITY = np.iinfo(np.int64).max // 4
+
+
+def grouped_cumsum(keys, values):
+    """
+    Inclusive running sum of values within each group of equal keys, in input order.
+    """
+    if len(keys) == 0:
+        return values.copy()
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    sorted_values = values[order]
+    running = np.cumsum(sorted_values)
+    group_start = np.empty(len(keys), dtype=bool)
+    group_start[0] = True
+    group_start[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    start_idx = np.flatnonzero(group_start)
+    group_id = np.cumsum(group_start) - 1
+    base = running[start_idx] - sorted_values[start_idx]
+    result = np.empty_like(running)
+    result[order] = running - base[group_id]
+    return result
+
+
+class DropTableArrays:
+    """
+    Drop tables of every tool type flattened into arrays.
+
+    Tool types (UniqueName, Tier), items and categories get compact integer ids.
+    The drop table rows ("slots") of tool type t are slot_* [slot_offsets[t]:slot_offsets[t + 1]].
+    """
+
+    def __init__(self, catalog: GameCatalog):
+        self.catalog = catalog
+        self.item_names = sorted(catalog.items)
+        self.item_index = {name: idx for idx, name in enumerate(self.item_names)}
+        self.categories = sorted({item.Category for item in catalog.items.values()})
+        self.category_index = {category: idx for idx, category in enumerate(self.categories)}
+        self.tool_keys = list(catalog.tools)
+        self.tool_index = {key: idx for idx, key in enumerate(self.tool_keys)}
+
+        self.tool_capacity = np.array([
+            catalog.tools[key].StorageCapacity if catalog.tools[key].StorageCapacity is not None else NO_CAPACITY
+            for key in self.tool_keys
+        ], dtype=np.int64)
+
+        offsets = [0]
+        slot_item, slot_probability, slot_output = [], [], []
+        slot_resource, slot_resource_quantity, slot_xp, slot_category = [], [], [], []
+        for key in self.tool_keys:
+            tool = catalog.tools[key]
+            for gen in catalog.drop_tables.get(key, ()):
+                item = catalog.items.get(gen.ItemUniqueName)
+                if item is None:
+                    continue
+                resource_quantity = gen.ResourceQuantity or 0
+                has_resource = bool(gen.ResourceUniqueName) and resource_quantity > 0 \
+                    and gen.ResourceUniqueName in self.item_index
+                slot_item.append(self.item_index[item.UniqueName])
+                slot_probability.append((item.Probability or 1.0) * (tool.ProbabilityBoost or 1.0))
+                slot_output.append(gen.OutputItemQuantity or 1)
+                slot_resource.append(self.item_index[gen.ResourceUniqueName] if has_resource else -1)
+                slot_resource_quantity.append(resource_quantity if has_resource else 0)
+                slot_xp.append((item.XPYield or 0) * XP_MULTIPLIER)
+                slot_category.append(self.category_index[item.Category])
+            offsets.append(len(slot_item))
+
+        self.slot_offsets = np.array(offsets, dtype=np.int64)
+        self.slot_item = np.array(slot_item, dtype=np.int64)
+        self.slot_probability = np.array(slot_probability, dtype=np.float64)
+        self.slot_output = np.array(slot_output, dtype=np.int64)
+        self.slot_resource = np.array(slot_resource, dtype=np.int64)
+        self.slot_resource_quantity = np.array(slot_resource_quantity, dtype=np.int64)
+        self.slot_xp = np.array(slot_xp, dtype=np.int64)
+        self.slot_category = np.array(slot_category, dtype=np.int64)
+
+        # Category -> (StartingXp ascending, Level ascending) as arrays for searchsorted
+        self.level_thresholds = [
+            tuple(np.array(values, dtype=np.int64) for values in catalog.level_thresholds.get(category, ([], [])))
+            for category in self.categories
+        ]
+
+
+class ToolSimulation:
+    """
+    Struct-of-arrays state of the active repeating tools and their owners.
+
+    Users get compact ids in order of appearance in tool_rows, inventories are a
+    dense (users x items) array and XP/levels a dense (users x categories) array.
+    step() runs one tick for every tool instance with vectorized operations.
+
+    Resources are spent in slot order per inventory cell like compute_tick_deltas
+    does, a slot that cannot pay spends nothing. The remaining differences:
+    items dropped in a tick cannot be spent as a resource in the same tick,
+    capacity checks do not see resources spent in the same tick, and all
+    slots are rolled, so a given rng gives different drops.
+    """
+
+    def __init__(self, drops: DropTableArrays, tool_rows, inventories, category_xp):
+        self.drops = drops
+        self.user_ids = []
+        self.usernames = []
+        user_index = {}
+        inst_user, inst_type = [], []
+        for user_tool in tool_rows:
+            tool_type = drops.tool_index.get((user_tool.ToolUniqueName, user_tool.Tier))
+            if tool_type is None:
+                continue
+            idx = user_index.get(user_tool.UserId)
+            if idx is None:
+                idx = user_index[user_tool.UserId] = len(self.user_ids)
+                self.user_ids.append(user_tool.UserId)
+                self.usernames.append(user_tool.Username)
+            inst_user.append(idx)
+            inst_type.append(tool_type)
+        self.tool_count = len(inst_user)
+
+        n_users = len(self.user_ids)
+        self.n_items = len(drops.item_names)
+        self.n_categories = len(drops.categories)
+
+        self.inventory = np.zeros(n_users * self.n_items, dtype=np.int64)
+        self.xp = np.zeros(n_users * self.n_categories, dtype=np.int64)
+        self.levels = np.ones(n_users * self.n_categories, dtype=np.int64)
+        self.xp_exists = np.zeros(n_users * self.n_categories, dtype=bool)
+        for user_id, idx in user_index.items():
+            for unique_name, quantity in inventories.get(user_id, {}).items():
+                item = drops.item_index.get(unique_name)
+                if item is not None:
+                    self.inventory[idx * self.n_items + item] = quantity
+            for category, (current_xp, category_level) in category_xp.get(user_id, {}).items():
+                cat = drops.category_index.get(category)
+                if cat is not None:
+                    cell = idx * self.n_categories + cat
+                    self.xp[cell] = current_xp
+                    self.levels[cell] = category_level
+                    self.xp_exists[cell] = True
+
+        # Expand tool instances into their drop table slots, keeping per-user sequential order
+        inst_user = np.array(inst_user, dtype=np.int64)
+        inst_type = np.array(inst_type, dtype=np.int64)
+        slot_start = drops.slot_offsets[inst_type]
+        slot_count = drops.slot_offsets[inst_type + 1] - slot_start
+        total = int(slot_count.sum())
+        first_of_inst = np.cumsum(slot_count) - slot_count
+        slot = np.repeat(slot_start - first_of_inst, slot_count) + np.arange(total, dtype=np.int64)
+        slot_user = np.repeat(inst_user, slot_count)
+
+        self.slot_user = slot_user
+        self.probability = drops.slot_probability[slot]
+        self.output = drops.slot_output[slot]
+        self.capacity = np.repeat(drops.tool_capacity[inst_type], slot_count)
+        self.product_cell = slot_user * self.n_items + drops.slot_item[slot]
+        self.xp_yield = drops.slot_xp[slot]
+        self.xp_cell = slot_user * self.n_categories + drops.slot_category[slot]
+
+        resource = drops.slot_resource[slot]
+        self.resource_pos = np.flatnonzero(resource >= 0)
+        self.resource_cell = slot_user[self.resource_pos] * self.n_items + resource[self.resource_pos]
+        self.resource_cost = drops.slot_resource_quantity[slot][self.resource_pos]
+
+    def _affordable_resources(self):
+        """
+        Which resource slots can pay their cost. Cells whose slots together cost
+        more than the balance are settled one slot at a time, an unaffordable
+        slot leaves the balance to the later slots.
+        """
+        cells, costs = self.resource_cell, self.resource_cost
+        affordable = self.inventory[cells] >= grouped_cumsum(cells, costs)
+        if affordable.all():
+            return affordable
+        short = np.flatnonzero(np.isin(cells, cells[~affordable]))
+        balances = {}
+        for pos, cell, cost in zip(short.tolist(), cells[short].tolist(), costs[short].tolist()):
+            balance = balances.get(cell)
+            if balance is None:
+                balance = int(self.inventory[cell])
+            affordable[pos] = balance >= cost
+            balances[cell] = balance - cost if affordable[pos] else balance
+        return affordable
+
+    def step(self, rng=None):
+        """
+        Runs one tick and updates the in-memory state.
+
+        :return: (item_delta, xp_delta, levelled_up_cells) as flat arrays over the dense cells.
+        """
+        rng = rng or np.random.default_rng()
+        item_delta = np.zeros_like(self.inventory)
+        xp_delta = np.zeros_like(self.xp)
+
+        # Resources are consumed before the roll, in slot order within each inventory cell
+        active = np.ones(len(self.slot_user), dtype=bool)
+        if len(self.resource_pos):
+            affordable = self._affordable_resources()
+            active[self.resource_pos] = affordable
+            np.add.at(item_delta, self.resource_cell[affordable], -self.resource_cost[affordable])
+
+        # Batched probability roll
+        hit = np.flatnonzero(active & (rng.random(len(self.slot_user)) <= self.probability))
+
+        # Clipped capacity add, earlier hits on the same cell fill it first
+        cells = self.product_cell[hit]
+        output = self.output[hit]
+        start = self.inventory[cells] + grouped_cumsum(cells, output) - output
+        added = np.clip(np.minimum(output, self.capacity[hit] - start), 0, None)
+        np.add.at(item_delta, cells, added)
+
+        # XP accumulation for drops that were stored
+        stored = hit[added > 0]
+        xp_cells = self.xp_cell[stored]
+        np.add.at(xp_delta, xp_cells, self.xp_yield[stored])
+        self.xp_exists[xp_cells] = True
+
+        self.inventory += item_delta
+        self.xp += xp_delta
+
+        # Level recomputation for the XP cells that changed
+        changed = np.flatnonzero(xp_delta)
+        levelled_up = np.empty(0, dtype=np.int64)
+        if len(changed):
+            categories = changed % self.n_categories
+            new_levels = self.levels[changed].copy()
+            for cat in np.unique(categories):
+                starting_xps, levels = self.drops.level_thresholds[cat]
+                if len(starting_xps) == 0:
+                    continue
+                in_cat = categories == cat
+                idx = np.searchsorted(starting_xps, self.xp[changed[in_cat]], side='right')
+                reached = np.where(idx > 0, levels[np.maximum(idx - 1, 0)], new_levels[in_cat])
+                new_levels[in_cat] = np.maximum(new_levels[in_cat], reached)
+            levelled_up = changed[new_levels > self.levels[changed]]
+            self.levels[changed] = new_levels
+
+        return item_delta, xp_delta, levelled_up
+
+    def tick(self, rng=None) -> TickDeltas:
+        """
+        Runs one tick and returns its changes in the form apply_tick_deltas writes.
+        """
+        item_delta, xp_delta, levelled_up = self.step(rng)
+        deltas = TickDeltas()
+        deltas.tool_ticks = self.tool_count
+        deltas.usernames = dict(zip(self.user_ids, self.usernames))
+
+        cells = np.flatnonzero(item_delta)
+        users, items = np.divmod(cells, self.n_items)
+        deltas.item_deltas = dict(zip(
+            zip(map(self.user_ids.__getitem__, users.tolist()), map(self.drops.item_names.__getitem__, items.tolist())),
+            item_delta[cells].tolist()
+        ))
+
+        categories = self.drops.categories
+        cells = np.flatnonzero(xp_delta)
+        users, cats = np.divmod(cells, self.n_categories)
+        keys = list(zip(map(self.user_ids.__getitem__, users.tolist()), map(categories.__getitem__, cats.tolist())))
+        deltas.xp_deltas = dict(zip(keys, xp_delta[cells].tolist()))
+        deltas.levels = dict(zip(keys, self.levels[cells].tolist()))
+
+        if len(levelled_up):
+            level_matrix = np.where(self.xp_exists, self.levels, 0).reshape(-1, self.n_categories)
+            for cell in levelled_up.tolist():
+                user, cat = divmod(cell, self.n_categories)
+                print(f"User '{self.usernames[user]}' leveled up in category '{categories[cat]}' to level {self.levels[cell]}.")
+                deltas.total_levels[self.user_ids[user]] = total_level_after_level_up(level_matrix[user].tolist())
+
+        return deltas
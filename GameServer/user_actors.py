@@ -0,0 +1,155 @@
+# GameServer/user_actors.py
+
+import asyncio
+import os
+from Database.database import AsyncSessionLocal, after_commit_point
+from .state_cache import undo_point
+
+# "true": each user's state-changing commands run one after another in that user's actor task.
+# "false": every command opens its own session, concurrent commands rely on row locks.
+USER_ACTORS_ENABLED = os.getenv("USER_ACTORS_ENABLED", "false").lower() == "true"
+USER_ACTOR_BATCH_SIZE = int(os.getenv("USER_ACTOR_BATCH_SIZE", "32"))
+USER_ACTOR_IDLE_SECONDS = float(os.getenv("USER_ACTOR_IDLE_SECONDS", "30"))
+
+
+def user_actors_enabled() -> bool:
+    return USER_ACTORS_ENABLED
+
+
+class UserActor:
+    """
+    Single asyncio task that owns one user's mutations.
+
+    Commands are async callables taking a session. The actor takes every
+    queued command (up to batch_size) and runs them in order in one session
+    and transaction, each inside its own savepoint, so a failing command is
+    rolled back alone and reports its error to its caller. The batch is
+    committed once, and only then are the callers given their results.
+    """
+
+    def __init__(self, runtime, user_key, batch_size: int, idle_seconds: float):
+        self.runtime = runtime
+        self.user_key = user_key
+        self.batch_size = batch_size
+        self.idle_seconds = idle_seconds
+        self.queue = asyncio.Queue()
+        self.task = None
+        self._batch = []
+
+    def submit(self, command) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((command, future))
+        return future
+
+    async def run(self):
+        try:
+            while True:
+                try:
+                    first = await asyncio.wait_for(self.queue.get(), timeout=self.idle_seconds)
+                except asyncio.TimeoutError:
+                    # Idle, nothing can be queued between this check and the removal
+                    if self.queue.empty():
+                        return
+                    continue
+                batch = [first]
+                while len(batch) < self.batch_size and not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                self._batch = batch
+                await self._process(batch)
+                self._batch = []
+        finally:
+            self.runtime._retire(self)
+            # Fail the running batch and whatever was queued if the actor was cancelled
+            pending = self._batch
+            while not self.queue.empty():
+                pending.append(self.queue.get_nowait())
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(RuntimeError(f"User actor {self.user_key} stopped."))
+
+    async def _process(self, batch):
+        completed = []
+        async with AsyncSessionLocal() as session:
+            session.info["shared_transaction"] = True
+            try:
+                for command, future in batch:
+                    # The caller gave up waiting, e.g. the client disconnected
+                    if future.done():
+                        continue
+                    undo_cache = undo_point(session)
+                    drop_callbacks = after_commit_point(session)
+                    savepoint = await session.begin_nested()
+                    try:
+                        result = await command(session)
+                    except Exception as e:
+                        await savepoint.rollback()
+                        undo_cache()
+                        drop_callbacks()
+                        future.set_exception(e)
+                        continue
+                    await savepoint.commit()
+                    # Later commands re-read what this one changed
+                    session.expire_all()
+                    completed.append((future, result))
+                await session.commit()
+            except Exception as e:
+                print(f"Error committing commands of user {self.user_key}: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                await session.rollback()
+                return
+
+        for future, result in completed:
+            if not future.done():
+                future.set_result(result)
+
+
+class UserActorRuntime:
+    """
+    Registry of the live user actors of this process. An actor is started by
+    the first command for its user and retires after idle_seconds without one.
+    """
+
+    def __init__(self, batch_size: int = USER_ACTOR_BATCH_SIZE, idle_seconds: float = USER_ACTOR_IDLE_SECONDS):
+        self.batch_size = batch_size
+        self.idle_seconds = idle_seconds
+        self._actors = {}  # user key -> UserActor
+
+    def __len__(self):
+        return len(self._actors)
+
+    async def run(self, user_id, command, session=None):
+        """
+        Runs command(session) for the user and returns its result.
+
+        With actors enabled the command is queued to the user's actor, the
+        session is shared with the other commands of its batch and the
+        command must commit through Database.database.commit_unit. Otherwise
+        it runs right away with the given session, e.g. the request's, or
+        with None to open its own.
+        """
+        if not user_actors_enabled():
+            return await command(session)
+        user_key = str(user_id)
+        actor = self._actors.get(user_key)
+        if actor is None:
+            actor = self._actors[user_key] = UserActor(self, user_key, self.batch_size, self.idle_seconds)
+            actor.task = asyncio.create_task(actor.run())
+        return await actor.submit(command)
+
+    def _retire(self, actor: UserActor):
+        if self._actors.get(actor.user_key) is actor:
+            del self._actors[actor.user_key]
+
+    async def close(self):
+        """
+        Stops every actor, failing the commands still queued.
+        """
+        tasks = [actor.task for actor in self._actors.values() if actor.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+user_actors = UserActorRuntime()
@@ -6,12 +6,20 @@ from sqlalchemy.exc import IntegrityError
 from sqlalchemy import select
 from passlib.context import CryptContext
 import asyncio
+from datetime import datetime
 
 class UserAlreadyExistsError(Exception):
     """Exception raised when a username or email is already taken."""
     pass
 
-async def create_user(user_data):
+async def create_user(user_data, password_hash: str = None):
+    """
+    Creates a user with the initial tools and items.
+
+    :param user_data: Username, Email and Password of the user.
+    :param password_hash: Hash of the password computed by the caller, e.g. in the API's
+        password hashing pool. The password is hashed here if None.
+    """
     async with AsyncSessionLocal() as session:
         try:
             # Check if the username already exists
@@ -31,9 +39,10 @@ async def create_user(user_data):
                 raise UserAlreadyExistsError(f"Email '{user_data['Email']}' is already registered.")
 
             # Hash the password
-            password = user_data.get('Password')
-            pwd_context = CryptContext(schemes=["bcrypt"])
-            hashed_password = pwd_context.hash(password)
+            hashed_password = password_hash
+            if hashed_password is None:
+                pwd_context = CryptContext(schemes=["bcrypt"])
+                hashed_password = pwd_context.hash(user_data.get('Password'))
 
             # Create the User object
             new_user = User(
@@ -63,7 +72,7 @@ async def create_user(user_data):
                     ToolUniqueName=tool.UniqueName,
                     ToolId=1,
                     Tier=1,
-
+                    LastSettled=datetime.now()
                 )
                 session.add(user_tool)
                 print(f"Assigned tool '{tool.Name}' to user '{new_user.Username}'.")
@@ -0,0 +1,310 @@
+# GenerateData/generate_world.py
+
+import argparse
+import asyncio
+import csv
+import io
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from passlib.context import CryptContext
+from sqlalchemy import text
+from Database.database import engine
+
+# Tables holding player state, in the order they are written
+PLAYER_TABLES = (
+    "users", "user_tools", "user_items", "user_category_xp", "market", "market_history",
+)
+# Wiped by --truncate together with PLAYER_TABLES
+DEPENDENT_TABLES = ("inventory_ledger", "chat_history")
+
+USER_COLUMNS = ("Id", "Username", "Email", "Password", "UserCreatedAt", "Gold", "Energy", "TotalLevel")
+USER_TOOL_COLUMNS = (
+    "UserId", "Username", "ToolUniqueName", "ToolId", "Tier", "AcquiredAt", "isEnabled", "isOccupied",
+    "LastUsed", "OngoingCraftingItemUniqueName", "OngoingRemainedQuantity"
+)
+USER_ITEM_COLUMNS = ("UserId", "Username", "UniqueName", "Quantity")
+USER_XP_COLUMNS = ("UserId", "Username", "Category", "CurrentXP", "CategoryLevel", "LastUpdated")
+MARKET_COLUMNS = ("SellerId", "SellerUsername", "ItemUniqueName", "Quantity", "Price", "ListCreatedAt", "ExpireDate")
+MARKET_HISTORY_COLUMNS = (
+    "ItemUniqueName", "Quantity", "Price", "SellerId", "SellerUsername", "BuyerId", "BuyerUsername", "BuyingDate"
+)
+
+# Every player starts with it, see create_users.create_user
+INITIAL_TOOL = "player_ultimate"
+# Ticks of repeating tool production a fully progressed player has accumulated
+MAX_PRODUCTION_TICKS = 50_000
+
+
+def copy_rows(conn, table: str, columns, rows) -> int:
+    """
+    Streams rows into table with COPY FROM STDIN on the connection's own
+    transaction. None is written as NULL.
+
+    :return: Number of rows copied.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+    for row in rows:
+        writer.writerow(['\\N' if value is None else value for value in row])
+        count += 1
+    if not count:
+        return 0
+    buffer.seek(0)
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY "{table}" ({column_list}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')', buffer)
+    finally:
+        cursor.close()
+    return count
+
+
+class WorldModel:
+    """
+    Distributions of the generated world, derived from the game catalog.
+
+    Each player gets a progress value in [0, 1], log-normally distributed so
+    most players are early in the game and few are far along. Tools, tiers,
+    inventories, XP and gold all follow from it: inventories are the expected
+    output of the player's repeating tools' drop tables, XP follows from the
+    items gathered and levels from the catalog's thresholds.
+    """
+
+    def __init__(self, catalog, rng: random.Random):
+        self.catalog = catalog
+        self.rng = rng
+        self.repeating_tools = sorted(
+            name for name, tiers in catalog.tool_tiers.items()
+            if catalog.tools[(name, tiers[0])].isRepeating and name != INITIAL_TOOL
+        )
+        self.crafting_tools = sorted(
+            name for name, tiers in catalog.tool_tiers.items()
+            if not catalog.tools[(name, tiers[0])].isRepeating
+        )
+        # Cheap items change hands most often
+        self.tradable_items = [item for item in catalog.items.values() if item.GoldValue]
+        self.trade_weights = [1 / item.GoldValue for item in self.tradable_items]
+
+    def progress(self) -> float:
+        return min(self.rng.lognormvariate(0, 1) / 10, 1.0)
+
+    def tier_for(self, name: str, progress: float) -> int:
+        tiers = self.catalog.tool_tiers[name]
+        index = min(int(progress * len(tiers) * self.rng.random() * 1.5), len(tiers) - 1)
+        return tiers[index]
+
+    def tools(self, progress: float):
+        """
+        (ToolUniqueName, ToolId, Tier) of one player's tools.
+        """
+        owned = []
+        if INITIAL_TOOL in self.catalog.tool_tiers:
+            owned.append((INITIAL_TOOL, 1, self.catalog.tool_tiers[INITIAL_TOOL][0]))
+        for name in self.repeating_tools + self.crafting_tools:
+            if self.rng.random() >= progress ** 0.5:
+                continue
+            tier = self.tier_for(name, progress)
+            tool = self.catalog.tools[(name, tier)]
+            count = 1
+            if tool.isMultipleCraftable:
+                count = max(1, int((tool.maxCraftingNumber or 1) * progress * self.rng.random()) + 1)
+                count = min(count, tool.maxCraftingNumber or count)
+            owned.extend((name, tool_id, tier) for tool_id in range(1, count + 1))
+        return owned
+
+    def inventory(self, tools, progress: float) -> dict:
+        """
+        UniqueName -> Quantity gathered by the player's repeating tools.
+        """
+        items = {}
+        ticks = progress * MAX_PRODUCTION_TICKS
+        for name, _, tier in tools:
+            tool = self.catalog.tools[(name, tier)]
+            if not tool.isRepeating:
+                continue
+            for drop in self.catalog.drop_tables.get((name, tier), ()):
+                item = self.catalog.items.get(drop.ItemUniqueName)
+                if item is None:
+                    continue
+                probability = min((item.Probability or 1.0) * (tool.ProbabilityBoost or 1.0), 1.0)
+                expected = ticks * probability * (drop.OutputItemQuantity or 1) * self.rng.uniform(0.1, 1.0)
+                quantity = int(expected)
+                if tool.StorageCapacity is not None:
+                    quantity = min(quantity, tool.StorageCapacity)
+                if quantity > 0:
+                    items[item.UniqueName] = items.get(item.UniqueName, 0) + quantity
+        return items
+
+    def category_xp(self, items: dict) -> dict:
+        """
+        Category -> (CurrentXP, CategoryLevel), from the XP the gathered items yielded.
+        Part of the gathered items was used up, so the XP exceeds what is left.
+        """
+        xp = {}
+        for unique_name, quantity in items.items():
+            item = self.catalog.items[unique_name]
+            xp[item.Category] = xp.get(item.Category, 0) + int(quantity * (item.XPYield or 0) * self.rng.uniform(1.0, 2.0))
+        return {
+            category: (current_xp, self.catalog.level_for_xp(category, current_xp, 1))
+            for category, current_xp in xp.items()
+        }
+
+    def gold(self, progress: float) -> float:
+        return round(10.0 + self.rng.lognormvariate(0, 1.5) * 1000 * progress, 2)
+
+    def unit_price(self, item) -> float:
+        return round(item.GoldValue * self.rng.lognormvariate(0.2, 0.3), 2)
+
+    def traded_item(self):
+        return self.rng.choices(self.tradable_items, weights=self.trade_weights)[0]
+
+
+class WorldGenerator:
+    """
+    Generates players chunk by chunk and COPYs each chunk in its own
+    transaction, so memory stays bounded by the chunk size and a failed run
+    keeps the chunks written so far.
+    """
+
+    def __init__(self, catalog, password_hash: str, username_prefix: str = "player_", seed: int = 0,
+                 listing_rate: float = 0.05, trades_per_user: float = 2.0):
+        self.rng = random.Random(seed)
+        self.model = WorldModel(catalog, self.rng)
+        self.password_hash = password_hash
+        self.username_prefix = username_prefix
+        self.listing_rate = listing_rate
+        self.trades_per_user = trades_per_user
+        self.now = datetime.now()
+
+    def _chunk_rows(self, start_index: int, count: int) -> dict:
+        rng, model, now = self.rng, self.model, self.now
+        rows = {table: [] for table in PLAYER_TABLES}
+        players = []
+        for index in range(start_index, start_index + count):
+            user_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+            username = f"{self.username_prefix}{index}"
+            progress = model.progress()
+            created_at = now - timedelta(days=progress * 365 * rng.random())
+            players.append((user_id, username))
+
+            tools = model.tools(progress)
+            for tool_name, tool_id, tier in tools:
+                rows["user_tools"].append((
+                    user_id, username, tool_name, tool_id, tier, created_at, True, False, None, None, None
+                ))
+
+            items = model.inventory(tools, progress)
+            xp = model.category_xp(items)
+            for category, (current_xp, level) in xp.items():
+                rows["user_category_xp"].append((user_id, username, category, current_xp, level, now))
+
+            # Listed quantities leave the inventory, as in create_market_listing
+            if items and rng.random() < self.listing_rate:
+                listable = [name for name in items if model.catalog.items[name].GoldValue]
+                for unique_name in rng.sample(listable, min(len(listable), rng.randint(1, 3))):
+                    quantity = max(items[unique_name] // 4, 1)
+                    items[unique_name] -= quantity
+                    listed_at = now - timedelta(hours=rng.uniform(0, 72))
+                    rows["market"].append((
+                        user_id, username, unique_name, quantity,
+                        model.unit_price(model.catalog.items[unique_name]), listed_at, listed_at + timedelta(days=3)
+                    ))
+
+            for unique_name, quantity in items.items():
+                rows["user_items"].append((user_id, username, unique_name, quantity))
+
+            total_level = sum(level for _, level in xp.values()) or 1
+            rows["users"].append((
+                user_id, username, f"{username}@example.com", self.password_hash, created_at,
+                model.gold(progress), 100.0, total_level
+            ))
+
+        # Trades between players of the chunk, spread over the last 30 days
+        if len(players) > 1 and model.tradable_items:
+            for _ in range(int(len(players) * self.trades_per_user)):
+                (buyer_id, buyer_name), (seller_id, seller_name) = rng.sample(players, 2)
+                item = model.traded_item()
+                quantity = max(int(rng.expovariate(1 / 20)), 1)
+                rows["market_history"].append((
+                    item.UniqueName, quantity, round(model.unit_price(item) * quantity, 2),
+                    seller_id, seller_name, buyer_id, buyer_name, now - timedelta(days=rng.uniform(0, 30))
+                ))
+        return rows
+
+    def generate(self, num_users: int, chunk_size: int = 50_000, start_index: int = 0) -> dict:
+        """
+        Writes num_users players with their tools, items, XP, listings and trades.
+
+        :return: Number of rows written per table.
+        """
+        columns = {
+            "users": USER_COLUMNS,
+            "user_tools": USER_TOOL_COLUMNS,
+            "user_items": USER_ITEM_COLUMNS,
+            "user_category_xp": USER_XP_COLUMNS,
+            "market": MARKET_COLUMNS,
+            "market_history": MARKET_HISTORY_COLUMNS,
+        }
+        totals = {table: 0 for table in PLAYER_TABLES}
+        started = time.perf_counter()
+        for chunk_start in range(start_index, start_index + num_users, chunk_size):
+            count = min(chunk_size, start_index + num_users - chunk_start)
+            rows = self._chunk_rows(chunk_start, count)
+            with engine.connect() as conn:
+                # Users first, the other tables reference them
+                for table in PLAYER_TABLES:
+                    totals[table] += copy_rows(conn, table, columns[table], rows[table])
+                conn.commit()
+            done = chunk_start + count - start_index
+            print(f"{done}/{num_users} users written ({time.perf_counter() - started:.0f}s).")
+        return totals
+
+
+def truncate_player_tables():
+    with engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {', '.join(DEPENDENT_TABLES + PLAYER_TABLES)} RESTART IDENTITY CASCADE"))
+
+
+def analyze_player_tables():
+    with engine.begin() as conn:
+        conn.execute(text(f"ANALYZE {', '.join(PLAYER_TABLES)}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-generate a synthetic player world for load testing.")
+    parser.add_argument("--users", type=int, default=100_000, help="Number of players to generate")
+    parser.add_argument("--chunk-size", type=int, default=50_000, help="Players per COPY transaction")
+    parser.add_argument("--start-index", type=int, default=0, help="First username suffix, to add to an existing world")
+    parser.add_argument("--username-prefix", default="player_", help="Usernames are <prefix><index>")
+    parser.add_argument("--password", default="password", help="Password of every generated player")
+    parser.add_argument("--listing-rate", type=float, default=0.05, help="Share of players with market listings")
+    parser.add_argument("--trades-per-user", type=float, default=2.0, help="Market history rows per player")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--truncate", action="store_true", help="Delete all player state first")
+    args = parser.parse_args()
+
+    from GameServer.game_catalog import load_game_catalog
+    catalog = asyncio.run(load_game_catalog())
+    if not catalog.items:
+        print("The game catalog is empty, run python -m GenerateData.import_game_data first.")
+        raise SystemExit(1)
+
+    # One bcrypt hash for everybody instead of one per player
+    password_hash = CryptContext(schemes=["bcrypt"]).hash(args.password)
+
+    if args.truncate:
+        truncate_player_tables()
+    generator = WorldGenerator(
+        catalog, password_hash, args.username_prefix, args.seed, args.listing_rate, args.trades_per_user
+    )
+    totals = generator.generate(args.users, args.chunk_size, args.start_index)
+    analyze_player_tables()
+    for table, count in totals.items():
+        print(f"{table}: {count} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+# GenerateData/import_game_data.py
+
+import argparse
+import csv
+import io
+import os
+from sqlalchemy import select, insert, update, delete, bindparam, text
+from Database.database import engine
+from Database.models import (
+    Item, Tool, ToolGeneratableItem, CraftingRecipe, ToolCraftingRecipe, CategoryLevels
+)
+from GameServer.catalog_channel import CATALOG_CHANNEL_NAME
+
+GAME_DATA_DIR = 'GameData'
+# Tables with more new rows than this are inserted with COPY instead of executemany
+COPY_THRESHOLD = int(os.getenv("IMPORT_COPY_THRESHOLD", "500"))
+
+
+class GameDataValidationError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"{len(errors)} game data error(s):\n" + "\n".join(errors))
+
+
+# Column parsers, defaults follow the original row-by-row loaders
+
+def _str(value):
+    return value
+
+def _optional_str(value):
+    return value if value != '' else None
+
+def _bool(value):
+    return (value or '').strip().lower() == 'true'
+
+def _optional_float(value):
+    return float(value) if value else None
+
+def _int(value):
+    return int(value)
+
+def _optional_int(value):
+    return int(value) if value else None
+
+def _float_or(default):
+    return lambda value: float(value) if value else default
+
+def _int_or(default):
+    return lambda value: int(value) if value else default
+
+
+class TableSpec:
+    """
+    How one static table is read from its CSV file and matched against the database.
+
+    :param model: ORM model of the table.
+    :param csv_file: File name in the GameData directory.
+    :param natural_key: Columns identifying a row across imports (the Id is database-generated).
+    :param columns: Column name -> parser of the CSV string.
+    """
+
+    def __init__(self, model, csv_file, natural_key, columns):
+        self.model = model
+        self.table = model.__table__
+        self.csv_file = csv_file
+        self.natural_key = natural_key
+        self.columns = columns
+
+    @property
+    def name(self):
+        return self.table.name
+
+    def key_of(self, row: dict):
+        return tuple(row[column] for column in self.natural_key)
+
+
+# Parents first: inserts and updates run in this order, deletes in reverse
+TABLE_SPECS = [
+    TableSpec(Item, 'ItemData.csv', ('UniqueName',), {
+        'UniqueName': _str,
+        'Name': _str,
+        'Category': _str,
+        'GoldValue': _optional_float,
+        'Probability': _optional_float,
+        'isLegendary': _bool,
+        'isCraftable': _bool,
+        'ItemDescription': _str,
+        'XPYield': _int_or(1),
+    }),
+    TableSpec(Tool, 'ToolData.csv', ('UniqueName', 'Tier'), {
+        'UniqueName': _str,
+        'Name': _str,
+        'Category': _str,
+        'isRepeating': _bool,
+        'ProbabilityBoost': _float_or(1.0),
+        'ToolDescription': _str,
+        'StorageCapacity': _optional_int,
+        'Tier': _int,
+        'isMultipleCraftable': _bool,
+        'maxCraftingNumber': _int_or(1),
+    }),
+    TableSpec(CategoryLevels, 'CategoryLevelData.csv', ('Category', 'Level'), {
+        'Category': _str,
+        'Level': _int,
+        'StartingXp': _int,
+    }),
+    TableSpec(ToolGeneratableItem, 'GeneratableItemsData.csv', ('ToolUniqueName', 'ToolTier', 'ItemUniqueName'), {
+        'ToolUniqueName': _str,
+        'ToolTier': _int,
+        'ItemUniqueName': _str,
+        'ResourceUniqueName': _optional_str,
+        'ResourceQuantity': _optional_int,
+        'OutputItemQuantity': _int_or(1),
+    }),
+    TableSpec(CraftingRecipe, 'CraftingRecipesData.csv',
+              ('ToolUniqueName', 'ToolTier', 'OutputItemUniqueName', 'InputItemUniqueName'), {
+        'InputItemUniqueName': _str,
+        'InputQuantity': _int,
+        'ToolUniqueName': _str,
+        'ToolTier': _int,
+        'OutputItemUniqueName': _str,
+        'OutputQuantity': _int,
+        'GenerationDuration': _optional_float,
+    }),
+    TableSpec(ToolCraftingRecipe, 'ToolCraftingRecipesData.csv',
+              ('OutputToolUniqueName', 'OutputToolTier', 'InputItemUniqueName'), {
+        'InputItemUniqueName': _str,
+        'InputQuantity': _int,
+        'OutputToolUniqueName': _str,
+        'OutputToolTier': _int,
+        'GenerationDuration': _optional_float,
+        'Category': _str,
+        'MinimumCategoryLevel': _int,
+    }),
+]
+
+
+def parse_csv_files(data_dir: str = GAME_DATA_DIR):
+    """
+    Reads every CSV file into {table name: {natural key: row dict}}.
+
+    :raises GameDataValidationError: On missing files, unparsable values or duplicate keys.
+    """
+    parsed = {}
+    errors = []
+    for spec in TABLE_SPECS:
+        path = os.path.join(data_dir, spec.csv_file)
+        rows = {}
+        try:
+            with open(path, mode='r', newline='', encoding='utf-8-sig') as csvfile:
+                for line_number, raw in enumerate(csv.DictReader(csvfile), start=2):
+                    try:
+                        row = {column: parser(raw.get(column) or '') for column, parser in spec.columns.items()}
+                    except ValueError as e:
+                        errors.append(f"{spec.csv_file}:{line_number}: {e}")
+                        continue
+                    key = spec.key_of(row)
+                    if key in rows:
+                        errors.append(f"{spec.csv_file}:{line_number}: duplicate {spec.natural_key} {key}")
+                        continue
+                    rows[key] = row
+        except FileNotFoundError:
+            errors.append(f"CSV file '{path}' not found.")
+        parsed[spec.name] = rows
+    if errors:
+        raise GameDataValidationError(errors)
+    return parsed
+
+
+def validate_references(parsed, strict: bool = False):
+    """
+    Checks every foreign key against the parsed rows, so the import never
+    depends on what is already in the database.
+
+    Rows with a dangling reference are dropped from parsed and reported, as the
+    row-by-row loaders used to skip them.
+
+    :param strict: Raise instead of dropping the rows.
+    :return: Error messages of the dropped rows.
+    :raises GameDataValidationError: In strict mode, listing every dangling reference.
+    """
+    items = {key[0] for key in parsed['items']}
+    tools = set(parsed['tools'])
+    references = {
+        'tool_generatable_items': (
+            [('ToolUniqueName', 'ToolTier')], ['ItemUniqueName', 'ResourceUniqueName']
+        ),
+        'crafting_recipes': (
+            [('ToolUniqueName', 'ToolTier')], ['InputItemUniqueName', 'OutputItemUniqueName']
+        ),
+        'tool_crafting_recipes': (
+            [('OutputToolUniqueName', 'OutputToolTier')], ['InputItemUniqueName']
+        ),
+    }
+    errors = []
+    for table_name, (tool_columns, item_columns) in references.items():
+        rows = parsed[table_name]
+        for key, row in list(rows.items()):
+            row_errors = [
+                f"{table_name} {key}: tool '{row[name]}' tier {row[tier]} is not in tools."
+                for name, tier in tool_columns if (row[name], row[tier]) not in tools
+            ] + [
+                f"{table_name} {key}: {column} '{row[column]}' is not in items."
+                for column in item_columns if row[column] is not None and row[column] not in items
+            ]
+            if row_errors:
+                errors.extend(row_errors)
+                del rows[key]
+
+    if errors and strict:
+        raise GameDataValidationError(errors)
+    for error in errors:
+        print(f"Skipped: {error}")
+    return errors
+
+
+class TableDiff:
+    def __init__(self, spec: TableSpec):
+        self.spec = spec
+        self.inserts = []   # row dicts
+        self.updates = []   # row dicts with b_id
+        self.delete_ids = []
+        self.unchanged = 0
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.inserts or self.updates or self.delete_ids)
+
+    def counts(self) -> dict:
+        return {
+            "inserted": len(self.inserts),
+            "updated": len(self.updates),
+            "deleted": len(self.delete_ids),
+            "unchanged": self.unchanged,
+        }
+
+
+def diff_table(conn, spec: TableSpec, desired: dict) -> TableDiff:
+    """
+    Compares the parsed rows with the database rows by natural key.
+    """
+    diff = TableDiff(spec)
+    columns = list(spec.columns)
+    table = spec.table
+    current = {}
+    for db_row in conn.execute(select(table.c.Id, *(table.c[column] for column in columns))):
+        row = dict(db_row._mapping)
+        key = spec.key_of(row)
+        if key in current:
+            # Duplicate natural key left over from older imports, keep the first one
+            diff.delete_ids.append(row['Id'])
+            continue
+        current[key] = row
+
+    for key, row in desired.items():
+        existing = current.pop(key, None)
+        if existing is None:
+            diff.inserts.append(row)
+        elif any(existing[column] != row[column] for column in columns):
+            diff.updates.append({"b_id": existing['Id'], **row})
+        else:
+            diff.unchanged += 1
+    diff.delete_ids.extend(row['Id'] for row in current.values())
+    return diff
+
+
+def _copy_rows(conn, spec: TableSpec, rows):
+    """
+    Inserts rows with COPY FROM STDIN on the connection's own transaction.
+    """
+    columns = list(spec.columns)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['\\N' if row[column] is None else row[column] for column in columns])
+    buffer.seek(0)
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(
+            f'COPY "{spec.name}" ({column_list}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')', buffer
+        )
+    finally:
+        cursor.close()
+
+
+def apply_diffs(conn, diffs):
+    """
+    Applies the diffs of all tables: children are deleted first, then parents
+    are written before the children that reference them.
+    """
+    for diff in reversed(diffs):
+        if diff.delete_ids:
+            conn.execute(delete(diff.spec.table).where(diff.spec.table.c.Id.in_(diff.delete_ids)))
+
+    for diff in diffs:
+        table = diff.spec.table
+        if diff.updates:
+            conn.execute(
+                update(table).where(table.c.Id == bindparam("b_id")).values(
+                    {column: bindparam(column) for column in diff.spec.columns}
+                ),
+                diff.updates
+            )
+        if len(diff.inserts) > COPY_THRESHOLD:
+            _copy_rows(conn, diff.spec, diff.inserts)
+        elif diff.inserts:
+            conn.execute(insert(table), diff.inserts)
+
+
+def import_game_data(data_dir: str = GAME_DATA_DIR, dry_run: bool = False, strict: bool = False) -> dict:
+    """
+    Imports every GameData CSV in a single transaction.
+
+    Only rows that differ from the database are written, so re-running the
+    import on unchanged files reads the tables once and writes nothing. When
+    something changed, running servers are told to reload their game catalog.
+
+    :param data_dir: Directory holding the CSV files.
+    :param dry_run: Compute and report the diff without writing.
+    :param strict: Fail on rows with dangling references instead of skipping them.
+    :return: {table name: {"inserted", "updated", "deleted", "unchanged"}}
+    """
+    parsed = parse_csv_files(data_dir)
+    validate_references(parsed, strict)
+
+    with engine.connect() as conn:
+        try:
+            # Serialize concurrent imports
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('idlecrafter:import_game_data'))"))
+            diffs = [diff_table(conn, spec, parsed[spec.name]) for spec in TABLE_SPECS]
+            changed = any(diff.has_changes for diff in diffs)
+            if changed and not dry_run:
+                apply_diffs(conn, diffs)
+                # Delivered on commit only
+                conn.execute(text("SELECT pg_notify(:channel, 'import')"), {"channel": CATALOG_CHANNEL_NAME})
+                conn.commit()
+            else:
+                conn.rollback()
+        except Exception:
+            conn.rollback()
+            raise
+
+    report = {diff.spec.name: diff.counts() for diff in diffs}
+    for table_name, counts in report.items():
+        print(f"{table_name}: {counts['inserted']} inserted, {counts['updated']} updated, "
+              f"{counts['deleted']} deleted, {counts['unchanged']} unchanged")
+    if not changed:
+        print("Game data is up to date.")
+    elif dry_run:
+        print("Dry run, nothing was written.")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import the GameData CSV files into the database.")
+    parser.add_argument("--data-dir", default=GAME_DATA_DIR, help="Directory holding the CSV files")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    parser.add_argument("--strict", action="store_true", help="Fail on rows referencing unknown items or tools")
+    args = parser.parse_args()
+    try:
+        import_game_data(args.data_dir, args.dry_run, args.strict)
+    except GameDataValidationError as e:
+        print(e)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
 # create_tables.py
 
+from sqlalchemy import text
 from Database.database import engine, Base
 import Database.models  # Ensure models are imported so they are registered
 from Database.models import (Market, MarketHistory, User, UserItem, UserTool, Item, Tool,
-    ToolCraftingRecipe, ToolGeneratableItem, CategoryLevels, UserCategoryXP)
+    ToolCraftingRecipe, ToolGeneratableItem, CategoryLevels, UserCategoryXP, InventoryLedger)
 
 def create_tables():
     Base.metadata.create_all(bind=engine)
@@ -13,6 +14,43 @@ def create_specific_table():
     ToolCraftingRecipe.__table__.create(bind=engine)
     print("Table created successfully.")
 
+def add_unique_constraints():
+    # The bulk tick engine upserts on these keys, databases created before
+    # the constraints were added to the models need them applied once.
+    with engine.begin() as conn:
+        conn.execute(text(
+            'ALTER TABLE user_items ADD CONSTRAINT unique_user_item UNIQUE ("UserId", "UniqueName")'
+        ))
+        conn.execute(text(
+            'ALTER TABLE user_category_xp ADD CONSTRAINT unique_user_category_xp UNIQUE ("UserId", "Category")'
+        ))
+    print("Unique constraints added successfully.")
+
+def add_last_settled_column():
+    # Used by the lazy accrual mode of the repeating tools. Existing tools accrue
+    # from now on, the eager tick loop has produced everything up to this point.
+    with engine.begin() as conn:
+        conn.execute(text(
+            'ALTER TABLE user_tools ADD COLUMN IF NOT EXISTS "LastSettled" TIMESTAMP WITHOUT TIME ZONE'
+        ))
+        conn.execute(text(
+            'UPDATE user_tools SET "LastSettled" = LOCALTIMESTAMP WHERE "LastSettled" IS NULL'
+        ))
+    print("LastSettled column added successfully.")
+
+def create_occupied_tools_index():
+    # Used by the crafting loop to find crafts started by other processes.
+    with engine.begin() as conn:
+        conn.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_user_tools_occupied_last_used ON user_tools ("LastUsed") WHERE "isOccupied"'
+        ))
+    print("Occupied tools index created successfully.")
+
+def create_inventory_ledger_table():
+    # Written by the game loops with INVENTORY_WRITE_MODE=ledger.
+    InventoryLedger.__table__.create(bind=engine, checkfirst=True)
+    print("Inventory ledger table created successfully.")
+
 if __name__ == "__main__":
     # create_tables()
-    create_specific_table()
\ No newline at end of file
+    create_specific_table()
@@ -0,0 +1,110 @@
+# tests/test_query_budgets.py
+
+# Pins the number of statements each endpoint sends, so an N+1 regression fails here.
+# Needs a PostgreSQL database with the tables created and the game data imported (DB_URL, ASYNC_DB_URL).
+
+import asyncio
+import uuid
+import httpx
+import pytest
+from sqlalchemy import delete, text
+from Database.database import async_engine, AsyncSessionLocal
+from Database.models import User, UserTool, UserItem, UserCategoryXP
+from Database.query_accounting import assert_query_budget
+from API.api_app import app
+from API.auth import create_access_token
+from GameServer.game_catalog import load_game_catalog
+from GenerateData.create_users import create_user
+
+
+@pytest.fixture(scope="module")
+def db_loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.run_until_complete(async_engine.dispose())
+    loop.close()
+
+
+async def _create_player():
+    catalog = await load_game_catalog()
+    if not catalog.items:
+        pytest.skip("The game data is not imported.")
+    username = f"budget_{uuid.uuid4().hex[:12]}"
+    user = await create_user({"Username": username, "Email": f"{username}@example.com"}, password_hash="-")
+    # Every item, tool and category, so a per-row query shows up as a repeated statement
+    async with AsyncSessionLocal() as session:
+        session.add_all(
+            UserItem(UserId=user.Id, Username=username, UniqueName=name, Quantity=5)
+            for name, item in catalog.items.items() if name != "mining_stone" and item.GoldValue is not None
+        )
+        session.add_all(
+            UserTool(UserId=user.Id, Username=username, ToolUniqueName=name, ToolId=tool_id, Tier=tier)
+            for tool_id, (name, tier) in enumerate(catalog.tools, start=2) if name != "player_ultimate"
+        )
+        session.add_all(
+            UserCategoryXP(UserId=user.Id, Username=username, Category=category, CurrentXP=0, CategoryLevel=1)
+            for category in catalog.level_thresholds
+        )
+        await session.commit()
+    return user
+
+
+async def _delete_player(user_id):
+    async with AsyncSessionLocal() as session:
+        for model in (UserItem, UserTool, UserCategoryXP):
+            await session.execute(delete(model).where(model.UserId == user_id))
+        await session.execute(delete(User).where(User.Id == user_id))
+        await session.commit()
+
+
+@pytest.fixture(scope="module")
+def player(db_loop):
+    try:
+        db_loop.run_until_complete(_ping())
+    except Exception as e:
+        pytest.skip(f"No database to run the query budgets against: {e}")
+    user = db_loop.run_until_complete(_create_player())
+    token = create_access_token(data={"sub": user.Username, "uid": str(user.Id)})
+    yield user, token
+    db_loop.run_until_complete(_delete_player(user.Id))
+
+
+async def _ping():
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+def _get_within_budget(db_loop, player, path: str, max_queries: int):
+    user, token = player
+
+    async def request():
+        headers = {"Authorization": f"Bearer {token}"}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # The first request authenticates from the database, the budget covers the requests after it
+            await client.get(path, headers=headers)
+            with assert_query_budget(max_queries, max_repeats=1):
+                response = await client.get(path, headers=headers)
+        assert response.status_code == 200, response.text
+        return response
+
+    return db_loop.run_until_complete(request())
+
+
+def test_user_items_budget(db_loop, player):
+    response = _get_within_budget(db_loop, player, "/user/items", 1)
+    assert response.json()["items_by_category"]
+
+
+def test_user_tools_budget(db_loop, player):
+    response = _get_within_budget(db_loop, player, "/user/tools", 1)
+    assert response.json()["tools_by_category"]
+
+
+def test_tool_crafting_recipes_budget(db_loop, player):
+    _get_within_budget(db_loop, player, "/tool-crafting-recipes", 1)
+
+
+def test_category_xp_budget(db_loop, player):
+    response = _get_within_budget(db_loop, player, "/category/xp", 2)
+    assert response.json()["Categories"]
@@ -0,0 +1,110 @@
+# tests/test_tool_simulation.py
+
+import random
+import uuid
+from collections import namedtuple
+import numpy as np
+from GameServer.game_catalog import GameCatalog, ItemDef, ToolDef, DropDef
+from GameServer.repeating_tools_engine import compute_tick_deltas
+from GameServer.tool_simulation import DropTableArrays, ToolSimulation
+
+ToolRow = namedtuple("ToolRow", ["UserId", "Username", "ToolUniqueName", "Tier"])
+CategoryLevel = namedtuple("CategoryLevel", ["Category", "Level", "StartingXp"])
+
+
+def _item(name, category, xp_yield=0):
+    # Probability 1, so both engines drop on every roll
+    return ItemDef(name, name, category, 1.0, 1.0, False, False, None, xp_yield)
+
+
+def _tool(name, capacity=None):
+    return ToolDef(name, name, "Mining", True, 1.0, None, capacity, 1, False, 1)
+
+
+def _catalog():
+    items = [
+        _item("coal", "Mining", 1),
+        _item("iron_ore", "Mining", 2),
+        _item("gem", "Mining", 20),
+        _item("iron_bar", "Smithing", 5),
+        _item("nail", "Smithing", 1),
+        _item("torch", "Crafting"),
+    ]
+    tools = [_tool("pickaxe", capacity=10), _tool("furnace"), _tool("anvil")]
+    drops = [
+        DropDef("pickaxe", 1, "coal", None, None, 3),
+        DropDef("pickaxe", 1, "iron_ore", None, None, 2),
+        DropDef("pickaxe", 1, "gem", None, None, 1),
+        # The expensive slot comes first, the cheaper one can still pay after it fails
+        DropDef("furnace", 1, "iron_bar", "iron_ore", 5, 1),
+        DropDef("furnace", 1, "nail", "iron_ore", 2, 4),
+        DropDef("anvil", 1, "torch", "coal", 4, 1),
+    ]
+    levels = [
+        CategoryLevel("Mining", 1, 0), CategoryLevel("Mining", 2, 30), CategoryLevel("Mining", 3, 60),
+        CategoryLevel("Smithing", 1, 0), CategoryLevel("Smithing", 2, 10),
+    ]
+    return GameCatalog(items, tools, drops, [], [], levels)
+
+
+def _population():
+    users = [uuid.UUID(int=i + 1) for i in range(4)]
+    tool_rows = [
+        # Two pickaxes share the capacity of the same items
+        ToolRow(users[0], "u0", "pickaxe", 1), ToolRow(users[0], "u0", "pickaxe", 1),
+        ToolRow(users[1], "u1", "furnace", 1), ToolRow(users[1], "u1", "furnace", 1),
+        ToolRow(users[2], "u2", "anvil", 1), ToolRow(users[2], "u2", "furnace", 1),
+        ToolRow(users[3], "u3", "furnace", 1), ToolRow(users[3], "u3", "anvil", 1),
+    ]
+    inventories = {
+        users[0]: {"coal": 6, "gem": 9},
+        users[1]: {"iron_ore": 4},
+        users[2]: {"coal": 9, "iron_ore": 1},
+        users[3]: {"iron_ore": 12, "coal": 3},
+    }
+    category_xp = {
+        users[0]: {"Mining": [25, 1]},
+        users[1]: {"Smithing": [9, 1]},
+    }
+    return tool_rows, inventories, category_xp
+
+
+def _copy_state(inventories, category_xp):
+    return (
+        {user_id: dict(items) for user_id, items in inventories.items()},
+        {user_id: {category: list(entry) for category, entry in xp.items()} for user_id, xp in category_xp.items()},
+    )
+
+
+def _nonzero(mapping):
+    return {key: value for key, value in mapping.items() if value}
+
+
+def test_simulation_matches_reference_engine():
+    catalog = _catalog()
+    tool_rows, inventories, category_xp = _population()
+    simulation = ToolSimulation(DropTableArrays(catalog), tool_rows, *_copy_state(inventories, category_xp))
+    reference_inventories, reference_xp = _copy_state(inventories, category_xp)
+
+    for _ in range(3):
+        expected = compute_tick_deltas(tool_rows, reference_inventories, reference_xp, catalog, random.Random(0))
+        actual = simulation.tick(np.random.default_rng(0))
+
+        assert _nonzero(actual.item_deltas) == _nonzero(expected.item_deltas)
+        assert _nonzero(actual.xp_deltas) == _nonzero(expected.xp_deltas)
+        assert actual.levels == {key: expected.levels[key] for key in _nonzero(expected.xp_deltas)}
+        assert actual.total_levels == expected.total_levels
+        assert actual.tool_ticks == expected.tool_ticks
+
+
+def test_unaffordable_slot_leaves_resource_to_later_slots():
+    catalog = _catalog()
+    user_id = uuid.UUID(int=1)
+    simulation = ToolSimulation(
+        DropTableArrays(catalog), [ToolRow(user_id, "u", "furnace", 1)], {user_id: {"iron_ore": 4}}, {}
+    )
+
+    deltas = simulation.tick(np.random.default_rng(0))
+
+    # The iron_bar slot needs 5 and is skipped, the nail slot spends 2 of the 4
+    assert deltas.item_deltas == {(user_id, "iron_ore"): -2, (user_id, "nail"): 4}
@@ -0,0 +1,75 @@
+# tests/test_user_actor_undo.py
+
+# Cached changes of a user actor batch are kept or undone with the batch's transaction.
+# Needs a PostgreSQL database (ASYNC_DB_URL).
+
+import asyncio
+import pytest
+from sqlalchemy import event, text
+from Database.database import async_engine
+from GameServer.state_cache import undo_on_rollback
+from GameServer.user_actors import UserActor
+
+
+@pytest.fixture(scope="module")
+def db_loop():
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(_ping())
+    except Exception as e:
+        loop.close()
+        pytest.skip(f"No database to run the user actor against: {e}")
+    yield loop
+    loop.run_until_complete(async_engine.dispose())
+    loop.close()
+
+
+async def _ping():
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+def _command(undone, name, fail=False):
+    async def command(session):
+        await session.execute(text("SELECT 1"))
+        undo_on_rollback(session, lambda: undone.append(name))
+        if fail:
+            raise ValueError(name)
+        return name
+    return command
+
+
+def _fail_outer_commit(session):
+    @event.listens_for(session.sync_session, "before_commit")
+    def _fail(sess):
+        if not sess.in_nested_transaction():
+            raise RuntimeError("commit failed")
+
+
+def _run_batch(db_loop, *commands):
+    async def run():
+        actor = UserActor(None, "test", batch_size=len(commands), idle_seconds=1)
+        batch = [(command, asyncio.get_running_loop().create_future()) for command in commands]
+        await actor._process(batch)
+        return [future.exception() or future.result() for _, future in batch]
+
+    return db_loop.run_until_complete(run())
+
+
+def test_failed_batch_commit_undoes_committed_commands(db_loop):
+    undone = []
+
+    async def failing_commit(session):
+        _fail_outer_commit(session)
+
+    results = _run_batch(db_loop, _command(undone, "first"), failing_commit)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert undone == ["first"]
+
+
+def test_failed_command_undoes_only_its_own_changes(db_loop):
+    undone = []
+    results = _run_batch(db_loop, _command(undone, "first"), _command(undone, "second", fail=True))
+    assert results[0] == "first"
+    assert isinstance(results[1], ValueError)
+    assert undone == ["second"]